@@ -0,0 +1,230 @@
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+AVIIF_KEYFRAME = 0x10
+
+PathType = Union[str, Path]
+
+
+def _iter_chunks(io, end: int):
+    """
+    Yield (fourcc, list_type, data_start, data_end) of the RIFF chunks between the current position and end,
+    list_type is None for chunks other than LIST. The file is left at the start of the next chunk.
+    """
+    while io.tell() + 8 <= end:
+        fourcc, size = struct.unpack("<4sI", io.read(8))
+        data_start = io.tell()
+        data_end = min(data_start + size, end)
+        if fourcc == b"LIST":
+            yield fourcc, io.read(4), data_start + 4, data_end
+        else:
+            yield fourcc, None, data_start, data_end
+        io.seek(data_start + size + (size & 1))
+
+
+def _decode_fourcc(fourcc: bytes):
+    return fourcc.decode("ascii", errors="replace").strip("\x00 ")
+
+
+@lru_cache(maxsize=None)
+def _probe_avi(file_path: str, file_size: int, mtime_ns: int):
+    header = dict()
+    with open(file_path, "rb") as io:
+        riff, riff_size, form = struct.unpack("<4sI4s", io.read(12))
+        if riff != b"RIFF" or form != b"AVI ":
+            raise ValueError(f"{file_path} is not an avi (RIFF AVI) file")
+        for fourcc, list_type, start, end in _iter_chunks(io, file_size):
+            if list_type != b"hdrl":
+                continue
+            video_stream = False
+            stream_no = -1
+            for fourcc, list_type, start, end in _iter_chunks(io, end):
+                if fourcc == b"avih":
+                    (
+                        micro_sec_per_frame, _, _, _, total_frames, _, _, _, width, height
+                    ) = struct.unpack("<10I", io.read(40))
+                    header.update(frame_count=total_frames, width=width, height=height)
+                    if micro_sec_per_frame:
+                        header.update(fps=1e6/micro_sec_per_frame)
+                elif list_type == b"strl":
+                    stream_no += 1
+                    if "codec" in header:
+                        continue
+                    for fourcc, _, start, end in _iter_chunks(io, end):
+                        if fourcc == b"strh":
+                            stream_type, handler, _, _, _, _, scale, rate, _, length = struct.unpack(
+                                "<4s4sIHHIIIII", io.read(36)
+                            )
+                            video_stream = stream_type == b"vids"
+                            if video_stream:
+                                header.update(
+                                    codec=_decode_fourcc(handler), frame_count=length, stream_no=stream_no
+                                )
+                                if scale:
+                                    header.update(fps=rate/scale)
+                        elif fourcc == b"strf" and video_stream:
+                            _, width, height, _, _, compression = struct.unpack(
+                                "<IiiHH4s", io.read(20)
+                            )
+                            header.update(width=width, height=abs(height))
+                            if not header.get("codec"):
+                                header.update(codec=_decode_fourcc(compression))
+                elif list_type == b"odml":
+                    for fourcc, _, start, end in _iter_chunks(io, end):
+                        if fourcc == b"dmlh":
+                            # total over all RIFF-AVIX segments of files larger than 1GB:
+                            (header["frame_count"],) = struct.unpack("<I", io.read(4))
+            break
+    if "frame_count" not in header:
+        raise ValueError(f"no avi header list found in {file_path}")
+    return header
+
+
+def probe_avi(file_path: PathType):
+    """
+    Read frame_count, fps, codec, width and height from the header of an avi without decoding frames.
+    Results are cached per file, path, size and modification time.
+    """
+    file_path = Path(file_path).resolve()
+    stat = file_path.stat()
+    return dict(_probe_avi(str(file_path), stat.st_size, stat.st_mtime_ns))
+
+
+def is_readable_avi(file_path: PathType, decode: bool = False):
+    """
+    Whether the avi has a valid header with at least one frame. With decode, or when the header cannot be
+    parsed, the first frame is decoded with OpenCV instead.
+    """
+    if not decode:
+        try:
+            return probe_avi(file_path)["frame_count"] > 0
+        except (ValueError, struct.error):
+            pass
+    import cv2
+
+    cap = cv2.VideoCapture(str(file_path))
+    success, _ = cap.read()
+    cap.release()
+    return success
+
+
+def _scan_movi(io, start: int, end: int, video_chunk_ids: list):
+    """
+    (data offset, size) of the video chunks of a movi list, walking its chunk headers.
+    """
+    scanned = []
+    io.seek(start)
+    for fourcc, list_type, data_start, data_end in _iter_chunks(io, end):
+        if fourcc in video_chunk_ids:
+            scanned.append((data_start, data_end - data_start))
+        elif list_type == b"rec ":
+            for fourcc, _, rec_start, rec_end in _iter_chunks(io, data_end):
+                if fourcc in video_chunk_ids:
+                    scanned.append((rec_start, rec_end - rec_start))
+    return scanned
+
+
+def _read_odml_index(io, super_index: bytes):
+    """
+    (data offset, size, is keyframe) arrays of the frames in the standard (ix##) indexes listed by an
+    OpenDML super index (indx chunk data), which cover the frames of all RIFF-AVIX segments.
+    """
+    longs_per_entry, _, index_type, entries_in_use = struct.unpack("<HBBI", super_index[:8])
+    assert index_type == 0, "indx should be an index of indexes"
+    index_entries = np.frombuffer(
+        super_index, dtype=[("offset", "<u8"), ("size", "<u4"), ("duration", "<u4")], count=entries_in_use,
+        offset=24,
+    )
+    offsets, sizes = [], []
+    for index_offset in index_entries["offset"][index_entries["offset"] > 0]:
+        io.seek(int(index_offset))
+        _, chunk_size = struct.unpack("<4sI", io.read(8))
+        chunk = io.read(chunk_size)
+        longs_per_entry, _, _, entries_in_use, _, base_offset = struct.unpack("<HBBI4sQ", chunk[:20])
+        entries = np.frombuffer(chunk, dtype="<u4", count=entries_in_use*longs_per_entry, offset=24)
+        entries = entries.reshape(entries_in_use, longs_per_entry)
+        # the offsets point to the chunk data:
+        offsets.append(entries[:, 0].astype("int64") + base_offset)
+        sizes.append(entries[:, 1])
+    sizes = np.concatenate(sizes) if sizes else np.empty(0, dtype="<u4")
+    offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype="int64")
+    # the high bit of the size flags the frames that are not keyframes:
+    return offsets, (sizes & 0x7FFFFFFF).astype("int64"), (sizes & 0x80000000) == 0
+
+
+def index_avi_frames(file_path: PathType):
+    """
+    Byte offset and size of the data of each video frame and whether it is a keyframe, read from the
+    indexes of the container. The OpenDML (indx/ix##) index of the video stream is used when present, it
+    covers the RIFF-AVIX extensions of files larger than 1GB, otherwise the idx1 index covers the first
+    RIFF segment. The movi lists that are not indexed are scanned chunk by chunk and only the first frame
+    of a scanned file is marked as keyframe.
+
+    Returns
+    -------
+    dict(byte_offset, byte_size, is_keyframe) of arrays with one entry per frame
+    """
+    file_path = Path(file_path)
+    header = probe_avi(file_path)
+    stream_no = header.get("stream_no", 0)
+    video_chunk_ids = [f"{stream_no:02d}{chunk_type}".encode() for chunk_type in ["dc", "db"]]
+    file_size = file_path.stat().st_size
+    movi_lists = []
+    idx1 = None
+    super_index = None
+    with open(file_path, "rb") as io:
+        riff_end = 0
+        while riff_end + 12 <= file_size:
+            io.seek(riff_end)
+            riff, riff_size, form = struct.unpack("<4sI4s", io.read(12))
+            if riff != b"RIFF":
+                break
+            riff_end = min(riff_end + 8 + riff_size + (riff_size & 1), file_size)
+            # the movi lists are skipped by their size, their chunks are only walked if not indexed:
+            for fourcc, list_type, start, end in _iter_chunks(io, riff_end):
+                if list_type == b"movi":
+                    movi_lists.append((start, end))
+                elif list_type == b"hdrl":
+                    strl_no = -1
+                    for fourcc, list_type, strl_start, strl_end in _iter_chunks(io, end):
+                        if list_type != b"strl":
+                            continue
+                        strl_no += 1
+                        for fourcc, _, data_start, data_end in _iter_chunks(io, strl_end):
+                            if fourcc == b"indx" and strl_no == stream_no:
+                                super_index = io.read(data_end - data_start)
+                elif fourcc == b"idx1" and idx1 is None:
+                    idx1 = np.frombuffer(
+                        io.read(end - start),
+                        dtype=[("ckid", "S4"), ("flags", "<u4"), ("offset", "<u4"), ("size", "<u4")],
+                    )
+        if super_index is not None:
+            offsets, sizes, is_keyframe = _read_odml_index(io, super_index)
+            return dict(byte_offset=offsets, byte_size=sizes, is_keyframe=is_keyframe)
+        offsets, sizes, is_keyframe = [], [], []
+        if idx1 is not None and len(idx1) > 0:
+            idx1 = idx1[np.isin(idx1["ckid"], video_chunk_ids)]
+            idx1_offsets = idx1["offset"].astype("int64")
+            # idx1 offsets are either relative to the 'movi' fourcc or absolute:
+            if len(idx1_offsets) and idx1_offsets[0] < movi_lists[0][0] - 4:
+                idx1_offsets = idx1_offsets + movi_lists[0][0] - 4
+            offsets.append(idx1_offsets + 8)
+            sizes.append(idx1["size"].astype("int64"))
+            is_keyframe.append((idx1["flags"] & AVIIF_KEYFRAME) > 0)
+            # idx1 only indexes the first RIFF segment:
+            movi_lists = movi_lists[1:]
+        for start, end in movi_lists:
+            scanned = np.array(_scan_movi(io, start, end, video_chunk_ids), dtype="int64").reshape(-1, 2)
+            offsets.append(scanned[:, 0])
+            sizes.append(scanned[:, 1])
+            is_keyframe.append(np.zeros(len(scanned), dtype=bool))
+    offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype="int64")
+    sizes = np.concatenate(sizes) if sizes else np.empty(0, dtype="int64")
+    is_keyframe = np.concatenate(is_keyframe) if is_keyframe else np.empty(0, dtype=bool)
+    if idx1 is None or len(idx1) == 0:
+        is_keyframe[:1] = True
+    return dict(byte_offset=offsets, byte_size=sizes, is_keyframe=is_keyframe)
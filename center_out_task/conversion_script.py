@@ -1,26 +1,100 @@
 from pathlib import Path
 
-from joblib import Parallel, delayed
+from conversion_utils.backends import get_backend_path, run_conversion
+from conversion_utils.estimator import format_estimate
+from conversion_utils.manifest import run_resumable
+from conversion_utils.profiling import (
+    ConversionProfiler,
+    format_spans,
+    get_profile_path,
+    profile_span,
+    profiling,
+    save_batch_profile,
+)
+from conversion_utils.session_index import SessionIndex, find_files
 
-from .coutnwbconverter import COutNWBConverter
+from .aviheader import is_readable_avi
 
-import cv2
 
+def get_nwbfile_path(source_folder, stub: bool = False, backend: str = "hdf5"):
+    nwb_path_append = "_stub" if stub else ""
+    return get_backend_path(
+        source_folder/f"{source_folder.name}_nwb_v4{nwb_path_append}.nwb", backend
+    )
+
+
+def convert(
+    source_folder,
+    trial_range: list = None,
+    channel_ids: list = None,
+    identifier: str = None,
+    session_index: SessionIndex = None,
+    trace_allocations: bool = False,
+    dry_run: bool = False,
+    backend: str = "hdf5",
+    cache_dir: str = None,
+    checkpointed: bool = False,
+):
+    """
+    Parameters
+    ----------
+    source_folder: Path
+        session folder
+    trial_range: list
+        [start, stop) trials to convert, for a quick stub conversion of the session. Only the first
+        Blackrock segment is written, cut to the approximate time window of these trials (the Blackrock
+        data has no timestamps to align it with the trials, see COutMatDataInterface.get_time_range).
+    channel_ids: list
+        channels (0-191) to convert in the units and Blackrock data, for a quick stub conversion. The
+        Blackrock files of an array without requested channels (A: 0-95, B: 96-191) are not converted.
+    identifier: str
+        NWB identifier, a random one if None
+    session_index: SessionIndex
+        index to look the session files up in instead of globbing the folder
+    trace_allocations: bool
+        attribute the python allocations to the stages with tracemalloc (slower) in addition to the
+        polled resident memory, see conversion_utils.profiling.ConversionProfiler
+    dry_run: bool
+        only return the predicted output size, peak memory and wall time of the conversion, see
+        COutNWBConverter.estimate_conversion. The recordings of a stub are counted over its channel_ids and
+        trial_range window.
+    backend: str
+        'hdf5' (.nwb file) or 'zarr' (.nwb.zarr store, requires hdmf-zarr)
+    cache_dir: str
+        folder caching the data extracted from the .mat file, for faster reconversions
+    checkpointed: bool
+        write the Blackrock segments, the .mat data and the movie one at a time, so that a conversion
+        that crashed resumes from the first one not written when run again, see
+        conversion_utils.checkpoint.run_checkpointed
+    """
+    # imported here, importing this module (in the batch workers too) does not load pynwb and
+    # nwb_conversion_tools before a conversion needs them:
+    from .coutnwbconverter import COutNWBConverter
 
-def convert(source_folder):
+    stub = trial_range is not None or channel_ids is not None
     # retrieve the correct files from source path:
-    nsx_files = list(source_folder.glob("**/*.ns3"))
-    movie_file = list(source_folder.glob("**/*.avi"))
-    mat_file = list(source_folder.glob("**/R*.mat"))[0]
+    nsx_files = find_files(source_folder, "*.ns3", session_index)
+    if trial_range is not None:
+        # the trials fall within the first segment:
+        nsx_files = [nsx_file for nsx_file in nsx_files if nsx_file.stem[-1] == "1"]
+    movie_file = find_files(source_folder, "*.avi", session_index)
+    mat_file = find_files(source_folder, "R*.mat", session_index)[0]
 
     source_data = dict()
     conversion_options = dict()
+    nsx_arg_names = []
     for nsx_file in nsx_files:
         if "M1" in nsx_file.parent.name:
             array = "A"
+            array_channels = range(96)
         else:
             array = "B"
+            array_channels = range(96, 192)
+        if channel_ids is not None and not any(ch in array_channels for ch in channel_ids):
+            # none of the requested channels are recorded by this array:
+            continue
         arg_name = array + nsx_file.stem[-1]
+        nsx_arg_names.append(arg_name)
         source_data.update({arg_name: dict(filename="", nsx_override=str(nsx_file))})
         conversion_options.update(
             {
@@ -31,33 +105,120 @@ def convert(source_folder):
             }
         )
     source_data.update(Mat=dict(filename=str(mat_file)))
+    conversion_options.update(Mat=dict(reward_as_intervals=True))
+    if cache_dir is not None:
+        conversion_options["Mat"].update(cache_dir=str(cache_dir))
     if len(movie_file) > 0:
-        cap = cv2.VideoCapture(str(movie_file[0]))
-        success, _ = cap.read()
-        if success:
+        if is_readable_avi(movie_file[0]):
             source_data.update(Movie=dict(movie_filepath=str(movie_file[0])))
-            conversion_options.update(Movie=dict(external_mode=True))
+            conversion_options.update(Movie=dict(external_mode=True, index_frames=True))
 
-    ch = COutNWBConverter(source_data)
-    nwbfile_saveloc = source_folder/f"{source_folder.name}_nwb_v4.nwb"
+    if dry_run:
+        recording_stub_options = dict()
+        if channel_ids is not None:
+            recording_stub_options.update(channel_ids=list(channel_ids))
+        if trial_range is not None:
+            from .matdatainterface import COutMatDataInterface
 
-    print("running conversion to nwb...")
-    ch.run_conversion(
-        metadata=ch.get_metadata(),
-        nwbfile_path=str(nwbfile_saveloc),
-        overwrite=True,
-        conversion_options=conversion_options,
+            # only the times of the first and last trials are read from the .mat file:
+            recording_stub_options.update(
+                time_range=COutMatDataInterface(**source_data["Mat"]).get_time_range(trial_range)
+            )
+        for arg_name in nsx_arg_names:
+            conversion_options[arg_name].update(recording_stub_options)
+        estimate = COutNWBConverter.estimate_conversion(source_data, conversion_options)
+        print(format_estimate(estimate))
+        return estimate
+    profiler = ConversionProfiler(
+        source_folder.name, trace_allocations=trace_allocations, poll_rss=True
     )
+    # the source files are read when the data interfaces are created:
+    with profiling(profiler), profile_span("initialization"):
+        ch = COutNWBConverter(source_data)
+    recording_stub_options = dict()
+    if channel_ids is not None:
+        recording_stub_options.update(channel_ids=list(channel_ids))
+        conversion_options["Mat"].update(channel_ids=list(channel_ids))
+    if trial_range is not None:
+        recording_stub_options.update(
+            time_range=ch.data_interface_objects["Mat"].get_time_range(trial_range)
+        )
+        conversion_options["Mat"].update(trial_range=list(trial_range))
+    for arg_name in nsx_arg_names:
+        conversion_options[arg_name].update(recording_stub_options)
+    nwbfile_saveloc = get_nwbfile_path(source_folder, stub=stub, backend=backend)
+    metadata = ch.get_metadata()
+    if identifier is not None:
+        metadata["NWBFile"].update(identifier=identifier)
+
+    print("running conversion to nwb...")
+    with profiling(profiler), profile_span("conversion"):
+        run_conversion(
+            ch,
+            nwbfile_saveloc,
+            metadata,
+            conversion_options,
+            backend=backend,
+            checkpointed=checkpointed,
+        )
+    profiler.save(get_profile_path(nwbfile_saveloc))
+    print(format_spans(profiler.to_dict()["spans"]))
     print(f"converted for {source_folder}")
+    return profiler.to_dict()
 
 
-if __name__ == "__main__":
+def run_parallel(
+    pt,
+    max_memory: int = None,
+    max_workers: int = 10,
+    manifest_path=None,
+    content_identifier: bool = False,
+    backend: str = "hdf5",
+):
+    """
+    Convert all sessions in pt/*/* in parallel within a memory budget (bytes, defaults to 80% of the
+    physical memory), see conversion_utils.scheduler.schedule_sessions. Sessions recorded as completed
+    in the manifest (default pt/conversion_manifest.json) with unchanged input files are skipped, see
+    conversion_utils.manifest.run_resumable. The session files are looked up in the session index
+    pt/.session_index.json, refreshed for the directories that changed. The stage timings of the
+    sessions are summed in pt/conversion_profile.json.
+    """
+    pt = Path(pt)
+    manifest_path = pt/"conversion_manifest.json" if manifest_path is None else manifest_path
+    session_index = SessionIndex(pt).refresh()
+    sessions = [
+        dict(
+            name=str(loc.relative_to(pt)),
+            args=(loc,),
+            kwargs=dict(session_index=session_index.subindex(loc), backend=backend),
+            options=dict(),
+            file_paths=session_index.find(loc, "R*.mat")
+                       + session_index.find(loc, "*.ns3")
+                       + session_index.find(loc, "*.avi"),
+            output_path=get_nwbfile_path(loc, backend=backend),
+        )
+        for loc in session_index.subdirs(pt, depth=2)
+    ]
+    reports = run_resumable(
+        convert,
+        sessions,
+        manifest_path,
+        content_identifier=content_identifier,
+        max_memory=max_memory,
+        max_workers=max_workers,
+    )
+    save_batch_profile(
+        [session["output_path"] for session in sessions], pt/"conversion_profile.json"
+    )
+    return reports
+
+
+def main():
     source_folder = Path(
         r"C:\Users\Saksham\Documents\NWB\shenoy\data\centerOut\3Ring\2016-01-28 (1)"
     )
     convert(source_folder)
 
 
-def run_parallel(pt):
-    pt = Path(pt)
-    Parallel(n_jobs=10)(delayed(convert)(loc) for loc in pt.glob("*/*"))
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ from typing import Union
 
 import numpy as np
 from nwb_conversion_tools import BlackrockRecordingExtractorInterface
+from nwb_conversion_tools.utils.json_schema import get_schema_from_method_signature
+from spikeextractors import SubRecordingExtractor
+
+from conversion_utils.profiling import profile_span, trace_method
 
 PathType = Union[str, Path]
 
@@ -33,6 +37,15 @@ class COutBlackrockIODataInterface(BlackrockRecordingExtractorInterface):
                 chan_id, "brain_area", self._region
             )
 
+    @staticmethod
+    def get_channel_id_offset(source_data: dict):
+        """
+        Offset of the channel ids of the interface over the electrode ids of the nsx file: the PMd array
+        channels follow the M1 ones. Used by conversion_utils.estimator.estimate_conversion.
+        """
+        folder_name = Path(source_data["nsx_override"]).parent.name
+        return 96 if "M1" not in folder_name and "PMd" in folder_name else 0
+
     @classmethod
     def get_source_schema(cls):
         source_schema = super().get_source_schema()
@@ -42,6 +55,62 @@ class COutBlackrockIODataInterface(BlackrockRecordingExtractorInterface):
         ] = "Path to Blackrock file."
         return source_schema
 
+    def get_conversion_options_schema(self):
+        conversion_options_schema = get_schema_from_method_signature(
+            BlackrockRecordingExtractorInterface.run_conversion,
+            exclude=["nwbfile", "metadata"],
+        )
+        conversion_options_schema["properties"].update(
+            channel_ids=dict(type="array", description="channels (0-191) to write"),
+            time_range=dict(type="array", description="[start, stop] in s of the data to write"),
+        )
+        return conversion_options_schema
+
+    def get_subset_recording(self, channel_ids: list = None, time_range: list = None):
+        """
+        Lazy view of the recording limited to channel_ids and the frames in time_range, only that part of
+        the nsx file is read when writing. time_range is on the time base of the trials (see
+        COutMatDataInterface.get_time_range), taken as starting with the first frame of the segment.
+        """
+        kwargs = dict()
+        if channel_ids is not None:
+            kwargs.update(
+                channel_ids=[
+                    ch for ch in self.recording_extractor.get_channel_ids() if ch in channel_ids
+                ]
+            )
+            assert len(kwargs["channel_ids"]) > 0, f"none of channel_ids are recorded in {self.nsx_loc}"
+        if time_range is not None:
+            sampling_frequency = self.recording_extractor.get_sampling_frequency()
+            num_frames = self.recording_extractor.get_num_frames()
+            kwargs.update(
+                start_frame=min(int(time_range[0]*sampling_frequency), num_frames),
+                end_frame=min(int(np.ceil(time_range[1]*sampling_frequency)), num_frames),
+            )
+        return SubRecordingExtractor(self.recording_extractor, **kwargs)
+
+    def run_conversion(
+        self, nwbfile, metadata, channel_ids: list = None, time_range: list = None, **kwargs
+    ):
+        """
+        channel_ids and time_range restrict the channels and samples written, for stub conversions. Other
+        conversion options are passed to BlackrockRecordingExtractorInterface.run_conversion
+        The traces read while the file is written are counted in the '<segment>/read' span, within the span
+        of the segment.
+        """
+        span_name = f"segment {self.nsx_loc.parent.stem}_{self.nsx_loc.stem[-1]}"
+        trace_method(self.recording_extractor, "get_traces", f"{span_name}/read")
+        if channel_ids is None and time_range is None:
+            with profile_span(span_name):
+                return super().run_conversion(nwbfile, metadata, **kwargs)
+        recording_extractor = self.recording_extractor
+        self.recording_extractor = self.get_subset_recording(channel_ids, time_range)
+        try:
+            with profile_span(span_name):
+                return super().run_conversion(nwbfile, metadata, **kwargs)
+        finally:
+            self.recording_extractor = recording_extractor
+
     def get_metadata_schema(self):
         metadata_schema = super().get_metadata_schema()
         metadata_schema["properties"]["Ecephys"]["additionalProperties"] = True
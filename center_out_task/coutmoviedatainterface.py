@@ -1,7 +1,14 @@
 from pathlib import Path
 from typing import Union
 
+import numpy as np
+from hdmf.common import DynamicTable
 from nwb_conversion_tools import MovieInterface
+from nwb_conversion_tools.utils.json_schema import get_schema_from_method_signature
+from pynwb import NWBFile
+from pynwb.image import ImageSeries
+
+from .aviheader import index_avi_frames, probe_avi
 
 PathType = Union[str, Path]
 
@@ -12,3 +19,79 @@ class CoutMoviedataInterface(MovieInterface):
                 Path(movie_filepath).suffix == ".avi"
         ), "movie file path as avi not present"
         super().__init__(file_paths=[movie_filepath])
+        self.movie_filepath = Path(movie_filepath)
+
+    def get_conversion_options_schema(self):
+        conversion_options_schema = get_schema_from_method_signature(
+            MovieInterface.run_conversion, exclude=["nwbfile", "metadata"]
+        )
+        conversion_options_schema["properties"].update(
+            index_frames=dict(
+                type="boolean",
+                description="add a table of the byte offset, keyframe and trial of each frame",
+            )
+        )
+        return conversion_options_schema
+
+    def _get_image_series(self, nwbfile: NWBFile):
+        for image_series in nwbfile.acquisition.values():
+            if isinstance(image_series, ImageSeries) and image_series.external_file is not None:
+                if str(self.movie_filepath) in [str(i) for i in image_series.external_file[:]]:
+                    return image_series
+
+    def add_frame_index(self, nwbfile: NWBFile):
+        """
+        Add a '<ImageSeries name>_frame_index' table with, for every frame of the external movie, the byte
+        offset and size of its data in the avi, whether it is a keyframe, the keyframe to start decoding
+        from, its timestamp and the trial it falls in (-1 outside trials). Readers can then seek to the
+        frames of a trial without decoding the movie from the start.
+        """
+        image_series = self._get_image_series(nwbfile)
+        assert image_series is not None, f"no external ImageSeries of {self.movie_filepath} in nwbfile"
+        frame_index = index_avi_frames(self.movie_filepath)
+        no_frames = len(frame_index["byte_offset"])
+        if image_series.timestamps is not None:
+            timestamps = np.asarray(image_series.timestamps[:no_frames], dtype="float64")
+        else:
+            rate = image_series.rate or probe_avi(self.movie_filepath).get("fps")
+            assert rate, (
+                f"the frame rate of {self.movie_filepath.name} is neither in its ImageSeries nor in its header, "
+                "its frames cannot be timed"
+            )
+            timestamps = (image_series.starting_time or 0.0) + np.arange(no_frames)/rate
+        trial = np.full(no_frames, -1, dtype="int64")
+        if nwbfile.trials is not None:
+            start_times = np.asarray(nwbfile.trials["start_time"].data[:])
+            stop_times = np.asarray(nwbfile.trials["stop_time"].data[:])
+            trial_no = np.searchsorted(start_times, timestamps, side="right") - 1
+            in_trial = (trial_no >= 0) & (timestamps <= stop_times[np.maximum(trial_no, 0)])
+            trial[in_trial] = trial_no[in_trial]
+        keyframe_nos = np.where(frame_index["is_keyframe"], np.arange(no_frames), 0)
+        frame_index_table = DynamicTable(
+            name=f"{image_series.name}_frame_index",
+            description=f"frame index of the external file {self.movie_filepath.name}",
+            id=np.arange(no_frames),
+        )
+        for name, description, data in [
+            ("byte_offset", "offset in bytes of the frame data in the file", frame_index["byte_offset"]),
+            ("byte_size", "size in bytes of the frame data", frame_index["byte_size"]),
+            ("is_keyframe", "whether the frame is a keyframe", frame_index["is_keyframe"]),
+            (
+                "decode_start_frame",
+                "last keyframe at or before the frame, decoding from there yields the frame",
+                np.maximum.accumulate(keyframe_nos),
+            ),
+            ("timestamp", "time of the frame in s", timestamps),
+            ("trial", "row of the trials table the frame falls in, -1 outside trials", trial),
+        ]:
+            frame_index_table.add_column(name=name, description=description, data=data)
+        nwbfile.add_acquisition(frame_index_table)
+
+    def run_conversion(self, nwbfile: NWBFile, metadata: dict, index_frames: bool = False, **kwargs):
+        """
+        index_frames adds the frame index table, see add_frame_index. Other conversion options are passed
+        to MovieInterface.run_conversion
+        """
+        super().run_conversion(nwbfile, metadata, **kwargs)
+        if index_frames:
+            self.add_frame_index(nwbfile)
@@ -3,12 +3,14 @@ import uuid
 from nwb_conversion_tools import NWBConverter
 from nwb_conversion_tools.utils.json_schema import dict_deep_update
 
+from conversion_utils.estimator import EstimateConversionMixin
+
 from .coutblackrockiodatainterface import COutBlackrockIODataInterface
 from .coutmoviedatainterface import CoutMoviedataInterface
 from .matdatainterface import COutMatDataInterface
 
 
-class COutNWBConverter(NWBConverter):
+class COutNWBConverter(EstimateConversionMixin, NWBConverter):
     data_interface_classes = dict(
         A1=COutBlackrockIODataInterface,
         B1=COutBlackrockIODataInterface,
@@ -15,22 +15,36 @@ from pynwb.behavior import Position, SpatialSeries
 from pynwb.epoch import TimeIntervals
 from pynwb.misc import Units
 
+from conversion_utils.extraction_cache import cached_extraction
+from conversion_utils.profiling import get_nbytes, profile_span
+
 from .matextractor import MatDataExtractor
 
 PathType = Union[str, Path]
 
 
 class COutMatDataInterface(BaseDataInterface):
-    def __init__(self, filename: PathType):
+    def __init__(self, filename: PathType, access_profile: Union[str, dict] = None):
         super().__init__()
         self.file_path = Path(filename)
         assert self.file_path.suffix == ".mat", "file_path should be a .mat"
         assert self.file_path.exists(), "file_path does not exist"
-        self.mat_extractor = MatDataExtractor(self.file_path)
+        self.access_profile = access_profile
+        self._mat_extractor = None
+
+    @property
+    def mat_extractor(self):
+        # the .mat file is opened on first use, not at all when its data is read from the extraction cache:
+        if self._mat_extractor is None:
+            self._mat_extractor = MatDataExtractor(self.file_path, access_profile=self.access_profile)
+        return self._mat_extractor
 
     @classmethod
     def get_source_schema(cls):
-        return get_schema_from_method_signature(cls.__init__)
+        source_schema = get_schema_from_method_signature(cls.__init__, exclude=["access_profile"])
+        # a profile name of conversion_utils.h5access.ACCESS_PROFILES or a dict of h5py access settings:
+        source_schema["properties"]["access_profile"] = dict(type=["string", "object"])
+        return source_schema
 
     @staticmethod
     def _convert_schema_object_to_array(schema_to_convert):
@@ -88,60 +102,156 @@ class COutMatDataInterface(BaseDataInterface):
         )
         return metadata
 
-    def run_conversion(self, nwbfile: NWBFile, metadata: dict, **kwargs):
+    def get_trial_nos(self, trial_range: list = None):
+        """
+        Trial numbers in [start, stop) of trial_range, all trials if None.
+        """
+        if trial_range is None:
+            return np.arange(self.mat_extractor._no_trials)
+        start, stop = trial_range
+        return np.arange(start, min(stop, self.mat_extractor._no_trials))
+
+    def get_time_range(self, trial_range: list = None):
+        """
+        [start, stop] in s of the trials in trial_range, to cut the matching window of a recording.
+        The trial times are relative to the start of the first trial in the .mat file, the Blackrock
+        segments have no timestamps to align them with, so the window assumes the first segment started
+        with the first trial and is approximate.
+        """
+        trial_nos = self.get_trial_nos(trial_range)
+        with self.mat_extractor:
+            trial_times = self.mat_extractor.get_trial_times(trial_nos=trial_nos[[0, -1]])
+        return [float(trial_times[0][0]), float(trial_times[-1][-1])]
+
+    def _extract(self, trial_range, channel_ids, reward_as_intervals: bool):
+        """
+        Behavior, stimulus, trial columns and unit spike times of the trials in trial_range and of
+        channel_ids read from the .mat file.
+        """
+        trial_nos = self.get_trial_nos(trial_range)
+        with self.mat_extractor:
+            data = dict(
+                beh_pos=self.mat_extractor.extract_behavioral_position(trial_nos=trial_nos),
+                trial_times=self.mat_extractor.get_trial_times(trial_nos=trial_nos),
+                task_data=self.mat_extractor.extract_task_data(trial_nos=trial_nos),
+                task_times_data=self.mat_extractor.extract_task_times(trial_nos=trial_nos),
+                spike_times=self.mat_extractor.extract_unit_spike_times(
+                    spike_ids=channel_ids, trial_nos=trial_nos
+                ),
+            )
+            if reward_as_intervals:
+                data.update(
+                    reward_intervals=self.mat_extractor.extract_reward_intervals(trial_nos=trial_nos)
+                )
+            else:
+                data.update(stim_pos=self.mat_extractor.extract_stimulus(trial_nos=trial_nos))
+        return data
+
+    def run_conversion(
+        self,
+        nwbfile: NWBFile,
+        metadata: dict,
+        reward_as_intervals: bool = False,
+        trial_range: list = None,
+        channel_ids: list = None,
+        cache_dir: str = None,
+    ):
+        """
+        Parameters
+        ----------
+        reward_as_intervals: bool
+            store the juice reward as a 'juice_reward' onset/offset intervals table instead of a
+            stimulus TimeSeries sampled at every time point of the session
+        trial_range: list
+            [start, stop) trial numbers to convert, for stub conversions. All trials if None.
+        channel_ids: list
+            channels (0-191) whose units are converted. All channels if None.
+        cache_dir: str
+            folder of the extraction cache (see conversion_utils.extraction_cache), the .mat file is only
+            read if it changed since its data was cached. No caching if None.
+        """
         assert isinstance(nwbfile, NWBFile), "'nwbfile' should be of type pynwb.NWBFile"
-        beh_pos = self.mat_extractor.extract_behavioral_position()
-        stim_pos = self.mat_extractor.extract_stimulus()
-        trial_times = self.mat_extractor.get_trial_times()
+        channel_ids = np.arange(192) if channel_ids is None else np.sort(channel_ids)
+        with profile_span("extraction") as counts:
+            data = cached_extraction(
+                cache_dir,
+                self.file_path,
+                MatDataExtractor,
+                lambda: self._extract(trial_range, channel_ids, reward_as_intervals),
+                options=dict(
+                    trial_range=None if trial_range is None else list(trial_range),
+                    channel_ids=channel_ids.tolist(),
+                    reward_as_intervals=reward_as_intervals,
+                ),
+            )
+            counts.update(items=len(data["trial_times"]))
+        beh_pos = data["beh_pos"]
+        if reward_as_intervals:
+            reward_intervals = data["reward_intervals"]
+        else:
+            stim_pos = data["stim_pos"]
+        trial_times = data["trial_times"]
         trial_times_all = np.concatenate(trial_times)
-        task_data = self.mat_extractor.extract_task_data()
-        task_times_data = self.mat_extractor.extract_task_times()
-        spike_times = self.mat_extractor.extract_unit_spike_times()
+        task_data = data["task_data"]
+        task_times_data = data["task_times_data"]
+        spike_times = data["spike_times"]
 
         # add behavior:
-        beh_mod = nwbfile.create_processing_module(
-            "behavior", "contains monkey movement data"
-        )
-        position_container = Position()
-        spatial_series_list = []
-        for beh in beh_pos:
-            args = dict(
-                timestamps=trial_times_all,
-                reference_frame="screen center",
-                conversion=np.nan,
-            )
-            spatial_series_list.append(
-                position_container.create_spatial_series(**beh, **args)
+        with profile_span(
+                "behavior",
+                items=len(trial_times_all),
+                bytes=sum(beh["data"].nbytes for beh in beh_pos) + trial_times_all.nbytes,
+        ):
+            beh_mod = nwbfile.create_processing_module(
+                "behavior", "contains monkey movement data"
             )
-        beh_mod.add(position_container)
+            position_container = Position()
+            spatial_series_list = []
+            for beh in beh_pos:
+                args = dict(
+                    timestamps=trial_times_all,
+                    reference_frame="screen center",
+                    conversion=np.nan,
+                )
+                spatial_series_list.append(
+                    position_container.create_spatial_series(**beh, **args)
+                )
+            beh_mod.add(position_container)
         # add stimulus:
-        nwbfile.add_stimulus(
-            TimeSeries(
-                name="juice_reward",
-                description="1 is when reward was presented",
-                data=stim_pos,
-                timestamps=trial_times_all,
-                unit="n.a.",
+        if reward_as_intervals:
+            reward_table = TimeIntervals(
+                name="juice_reward", description="intervals when the juice reward was presented"
             )
-        )
-        # add trials:
-        for col_details in task_data + task_times_data:
-            col_det = dict(
-                name=col_details["name"], description=col_details["description"]
-            )
-            if "index" in col_details:
-                col_det.update(index=col_details["index"])
-            nwbfile.add_trial_column(**col_det)
-        for trial_no in range(self.mat_extractor._no_trials):
-            col_details_dict = {
-                i["name"]: i["data"][trial_no] for i in task_data + task_times_data
-            }
-            col_details_dict.update(
-                start_time=trial_times[trial_no][0],
-                stop_time=trial_times[trial_no][-1],
-                timeseries=spatial_series_list,
+            for start_time, stop_time in zip(
+                    reward_intervals["start_time"], reward_intervals["stop_time"]
+            ):
+                reward_table.add_interval(start_time=start_time, stop_time=stop_time)
+            nwbfile.add_time_intervals(reward_table)
+        else:
+            nwbfile.add_stimulus(
+                TimeSeries(
+                    name="juice_reward",
+                    description="1 is when reward was presented",
+                    data=stim_pos,
+                    timestamps=trial_times_all,
+                    unit="n.a.",
+                )
             )
-            nwbfile.add_trial(**col_details_dict)
+        # add trials, then the task columns in bulk (ragged columns come with their VectorIndex data):
+        with profile_span(
+                "trials",
+                items=len(trial_times),
+                bytes=get_nbytes([col_details["data"] for col_details in task_data + task_times_data])
+                + 16*len(trial_times),
+        ):
+            for trial_no in range(len(trial_times)):
+                nwbfile.add_trial(
+                    start_time=trial_times[trial_no][0],
+                    stop_time=trial_times[trial_no][-1],
+                    timeseries=spatial_series_list,
+                )
+            for col_details in task_data + task_times_data:
+                nwbfile.add_trial_column(**col_details)
 
         if len(nwbfile.devices) == 0:
             nwbfile.create_device(
@@ -162,13 +272,21 @@ class COutMatDataInterface(BaseDataInterface):
                 device=nwbfile.devices["Utah Electrode"],
             )
         # add units:
-        for no, unit_sp_times in enumerate(spike_times):
-            elec_group = 1 if no > 95 else 0
-            nwbfile.add_unit(
-                spike_times=unit_sp_times,
-                electrodes=[no],
-                electrode_group=list(nwbfile.electrode_groups.values())[elec_group],
-                obs_intervals=np.array([trial_times[0][0], trial_times[-1][-1]])[
-                              np.newaxis, :
-                              ],
-            )
+        electrode_ids = [] if nwbfile.electrodes is None else list(nwbfile.electrodes.id[:])
+        with profile_span(
+                "units",
+                items=sum(len(unit_sp_times) for unit_sp_times in spike_times),
+                bytes=get_nbytes(spike_times),
+        ):
+            for no, unit_sp_times in zip(channel_ids, spike_times):
+                elec_group = 1 if no > 95 else 0
+                # the electrodes table only holds the converted channels of a channel subset:
+                electrode_no = electrode_ids.index(no) if no in electrode_ids else int(no)
+                nwbfile.add_unit(
+                    spike_times=unit_sp_times,
+                    electrodes=[electrode_no],
+                    electrode_group=list(nwbfile.electrode_groups.values())[elec_group],
+                    obs_intervals=np.array([trial_times[0][0], trial_times[-1][-1]])[
+                                  np.newaxis, :
+                                  ],
+                )
@@ -1,18 +1,42 @@
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Union
 
 import h5py
 import numpy as np
-from scipy.sparse import csc_matrix
-from tqdm import tqdm
+
+from conversion_utils.h5access import open_h5_file
+from conversion_utils.profiling import profile_span
+
+
+def _ragged_column(data, index):
+    """
+    data and index of a ragged trial column. hdmf rejects an index into empty data, when no trial holds a
+    value the column is passed as one empty array per trial instead.
+    """
+    if len(data) == 0:
+        return dict(data=[data[:0] for _ in index], index=True)
+    return dict(data=data, index=index)
 
 
 class MatDataExtractor:
-    def __init__(self, file_name):
+    # increase whenever the extracted data changes, to invalidate the extraction caches:
+    EXTRACTOR_VERSION = 3
+
+    def __init__(self, file_name, access_profile: Union[str, dict] = None):
+        """
+        Parameters
+        ----------
+        file_name: PathType
+            R*.mat file (matlab v7.3)
+        access_profile: Union[str, dict]
+            name of a profile in conversion_utils.h5access.ACCESS_PROFILES or a dict of h5py access settings
+        """
         self.file_name = Path(file_name)
         assert self.file_name.suffix == ".mat"
-        self._open_file = h5py.File(self.file_name, "r")
-        self.R = self._open_file["R"]
+        self._access_profile = access_profile
+        self._open_file = None
+        self.open()
         self._colnames = list(self.R.keys())
         self._no_trials = len(self.R[self._colnames[0]])
         self.session_start = self._convert_matlab_datenum(0)
@@ -23,6 +47,22 @@ class MatDataExtractor:
             ]
         )
 
+    def open(self):
+        if not self._open_file:
+            self._open_file = open_h5_file(self.file_name, self._access_profile)
+            self.R = self._open_file["R"]
+        return self
+
+    def close(self):
+        if self._open_file:
+            self._open_file.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def _chr_convert(self, array):
         if isinstance(array, np.ndarray):
             array = array.flatten()
@@ -38,209 +78,335 @@ class MatDataExtractor:
         )
         return time
 
+    def get_trial_start_times(self, trial_nos: list = None):
+        """
+        Trial start times in s relative to session start, without building the per sample time vectors.
+        """
+        if trial_nos is None:
+            trial_nos = range(self._no_trials)
+        start_list = []
+        for trial_no in trial_nos:
+            time_diff = self._convert_matlab_datenum(trial_no) - self.session_start
+            start_list.append(
+                time_diff.seconds + np.round((time_diff.microseconds*1e-6), 3)
+            )
+        return np.array(start_list)
+
     def get_trial_times(self, trial_nos: list = None):
         if trial_nos is None:
             trial_nos = range(self._no_trials)
 
         time_list = []
-        for trial_no in trial_nos:
-            start_date = self._convert_matlab_datenum(trial_no)
+        for trial_no, trial_start in zip(trial_nos, self.get_trial_start_times(trial_nos)):
             trial_len = self.R[self.R["trialLength"][trial_no][0]][0, 0]
             time_range = np.arange(trial_len)/1e3
-            time_diff = start_date - self.session_start
-            time_diff_sec = time_diff.seconds + np.round(
-                (time_diff.microseconds*1e-6), 3
-            )
-            time_list.append(time_diff_sec + time_range)
+            time_list.append(trial_start + time_range)
         return time_list
 
-    def _return_array(self, field, element=0):
+    def _return_refs(self, field, trial_nos: list = None):
+        """
+        Resolve the object references of a column of R with a single read of the reference dataset.
+        """
+        refs = self.R[field][:, 0]
+        if trial_nos is not None:
+            refs = refs[np.asarray(trial_nos)]
+        return [self.R[ref] for ref in refs]
+
+    def _return_scalars(self, field, trial_nos: list = None):
+        """
+        First value of a column of R for each trial as a float array, nan for empty entries.
+        """
+        return np.array(
+            [
+                dataset[0, 0] if len(dataset.shape) > 1 else np.nan
+                for dataset in self._return_refs(field, trial_nos)
+            ],
+            dtype="float64",
+        )
+
+    def _return_ragged(self, field, trial_nos: list = None, empty_value=None):
+        """
+        Values of a column of R for each trial packed as (data, index). Empty entries contribute no
+        values, or a single empty_value if given.
+        """
+        empty = np.empty(0) if empty_value is None else np.array([empty_value])
+        return self._pack_ragged(
+            [
+                np.atleast_1d(dataset[()].squeeze()) if len(dataset.shape) > 1 else empty
+                for dataset in self._return_refs(field, trial_nos)
+            ]
+        )
+
+    @staticmethod
+    def _pack_ragged(arrays):
+        """
+        Pack a list of per trial arrays into a flat data array and the end offsets (VectorIndex) of each trial.
+        """
+        non_empty = [array for array in arrays if len(array) > 0]
+        if len({array.shape[1:] for array in non_empty}) > 1:
+            arrays = [array.ravel() for array in arrays]
+            non_empty = [array.ravel() for array in non_empty]
+        index = np.cumsum([len(array) for array in arrays], dtype="int64")
+        data = np.concatenate(non_empty, axis=0) if non_empty else np.empty(0)
+        return data, index
+
+    def extract_trial_params(self, trial_nos: list = None, names: list = None, ragged_names: list = None):
+        """
+        Read the fields of startTrialParams in a single pass over the trials. Only the datasets of the
+        requested fields are opened and the scalar parameters are read directly into one buffer per field.
+
+        Parameters
+        ----------
+        trial_nos: list
+            trials to read, defaults to all trials
+        names: list
+            parameters to read, defaults to all the numeric parameters. Requested parameters are always
+            returned, nan (scalars) or empty (ragged) where they are missing or not numeric.
+        ragged_names: list
+            parameters always returned as ragged even if every trial holds at most one value
+
+        Returns
+        -------
+        scalars: np.ndarray
+            structured array with one record per trial and one float field per scalar parameter.
+            Trials where the parameter is empty are nan.
+        ragged: dict
+            parameter name: (data, index) for variable length parameters. index contains the end offset
+            of each trial in data.
+        """
+        ragged_names = [] if ragged_names is None else ragged_names
+        param_groups = self._return_refs("startTrialParams", trial_nos)
+        no_trials = len(param_groups)
+        datasets = dict() if names is None else {name: [None]*no_trials for name in names}
+        for trial_no, trlparams in enumerate(param_groups):
+            for name in trlparams.keys() if names is None else names:
+                dataset = trlparams.get(name)
+                if isinstance(dataset, h5py.Dataset) and dataset.dtype.kind in "biuf":
+                    datasets.setdefault(name, [None]*no_trials)[trial_no] = dataset
+
+        def size(dataset):
+            # matlab empty arrays are stored as their 1d dims vector:
+            return 0 if dataset is None or len(dataset.shape) < 2 else dataset.size
+
+        scalar_values = dict()
+        ragged = dict()
+        for name, trial_datasets in datasets.items():
+            if name not in ragged_names and all(size(dataset) <= 1 for dataset in trial_datasets):
+                buffer = np.full(no_trials, np.nan)
+                for trial_no, dataset in enumerate(trial_datasets):
+                    if size(dataset) == 1:
+                        dataset.read_direct(buffer, np.s_[0, 0], np.s_[trial_no])
+                scalar_values[name] = buffer
+            else:
+                ragged[name] = self._pack_ragged(
+                    [
+                        np.atleast_1d(dataset[()].squeeze()) if size(dataset) > 0 else np.empty(0)
+                        for dataset in trial_datasets
+                    ]
+                )
+        scalars = np.empty(no_trials, dtype=[(name, "float64") for name in scalar_values])
+        for name, buffer in scalar_values.items():
+            scalars[name] = buffer
+        return scalars, ragged
+
+    def _return_array(self, field, element=0, trial_nos: list = None):
+        if trial_nos is None:
+            trial_nos = range(self._no_trials)
         if element == 0:
-            return [self.R[self.R[field][i][0]][0, 0] for i in range(self._no_trials)]
+            return [self.R[self.R[field][i][0]][0, 0] for i in trial_nos]
         else:
             return [
                 self.R[self.R[field][i][0]][
                 : int(self.R[self.R["trialLength"][i][0]][0, 0]), :
                 ].squeeze()
-                for i in range(self._no_trials)
+                for i in trial_nos
             ]
 
-    def get_trial_ids(self):
-        return self._return_array("trialNum")
+    def get_trial_ids(self, trial_nos: list = None):
+        return self._return_array("trialNum", trial_nos=trial_nos)
+
+    def extract_unit_spike_times(self, spike_ids: list = None, trial_nos: list = None):
+        """
+        Spike times in s of the channels in spike_ids (sorted, 0-95 spikeRaster, 96-191 spikeRaster2) over
+        trial_nos. The raster of an array is not read if none of its channels are requested.
+        """
+        from scipy.sparse import csc_matrix
 
-    def extract_unit_spike_times(self, spike_ids: list = None):
-        if spike_ids is None:
-            spike_ids = np.arange(192)
-        trial_nos = np.arange(self._no_trials)
+        spike_ids = np.arange(192) if spike_ids is None else np.sort(spike_ids)
+        if trial_nos is None:
+            trial_nos = np.arange(self._no_trials)
         spike_times_all_list = []
         for _ in spike_ids:
             spike_times_all_list.append([])
-        for trl in tqdm(trial_nos):
-            spike_times = self.get_trial_times(trial_nos=[trl])[0]
-            ch_count = 0
-            for no, ar in enumerate(["", "2"]):
-                sp1 = self.R[self.R[f"spikeRaster{ar}"][trl][0]]
-                sp_bool = csc_matrix(
-                    (sp1["data"], sp1["ir"], sp1["jc"]), shape=(96, len(sp1["jc"]) - 1)
-                ).toarray()
-                trial_len = self.R[self.R["trialLength"][trl][0]][0, 0]
-                spk_ids_bool = ((no*96) <= spike_ids) & (spike_ids < ((no + 1)*96))
-                sp_bool = sp_bool[spike_ids[spk_ids_bool] - no*96, : int(trial_len)]
-                for sp in sp_bool:
-                    spike_times_all_list[ch_count].extend(spike_times[sp >= 1])
-                    ch_count += 1
+        with profile_span("spike_times") as counts:
+            for trl in trial_nos:
+                spike_times = self.get_trial_times(trial_nos=[trl])[0]
+                ch_count = 0
+                for no, ar in enumerate(["", "2"]):
+                    spk_ids_bool = ((no*96) <= spike_ids) & (spike_ids < ((no + 1)*96))
+                    if not spk_ids_bool.any():
+                        continue
+                    sp1 = self.R[self.R[f"spikeRaster{ar}"][trl][0]]
+                    sp_bool = csc_matrix(
+                        (sp1["data"], sp1["ir"], sp1["jc"]), shape=(96, len(sp1["jc"]) - 1)
+                    ).toarray()
+                    counts["bytes"] += sp_bool.nbytes
+                    trial_len = self.R[self.R["trialLength"][trl][0]][0, 0]
+                    sp_bool = sp_bool[spike_ids[spk_ids_bool] - no*96, : int(trial_len)]
+                    for sp in sp_bool:
+                        spike_times_all_list[ch_count].extend(spike_times[sp >= 1])
+                        ch_count += 1
+            counts["items"] = sum(len(unit_sp_times) for unit_sp_times in spike_times_all_list)
         return spike_times_all_list
 
-    def extract_behavioral_position(self):
+    def extract_behavioral_position(self, trial_nos: list = None):
         out_dict = [
             dict(
                 name="Eye",
                 description="pos of eye in x,y",
-                data=np.concatenate(self._return_array("eyePos", element=1)),
+                data=np.concatenate(self._return_array("eyePos", element=1, trial_nos=trial_nos)),
             ),
             dict(
                 name="Cursor",
                 description="cursor pos on screen in x,y",
-                data=np.concatenate(self._return_array("cursorPos", element=1))[:, :2],
+                data=np.concatenate(self._return_array("cursorPos", element=1, trial_nos=trial_nos))[:, :2],
             ),
             dict(
                 name="Hand",
                 description="hand pos in x,y,z",
-                data=np.concatenate(self._return_array("handPos", element=1)),
+                data=np.concatenate(self._return_array("handPos", element=1, trial_nos=trial_nos)),
             ),
             dict(
                 name="DecodePos",
                 description="decoded pos in x,y",
-                data=np.concatenate(self._return_array("decodePos", element=1)),
+                data=np.concatenate(self._return_array("decodePos", element=1, trial_nos=trial_nos)),
             ),
         ]
         return out_dict
 
-    def extract_stimulus(self):
+    def extract_stimulus(self, trial_nos: list = None):
+        if trial_nos is None:
+            trial_nos = range(self._no_trials)
         juice = np.concatenate(
             [
                 self.R[self.R["juice"][i][0]]["jc"][
                 : int(self.R[self.R["trialLength"][i][0]][0, 0])
                 ]
-                for i in range(self._no_trials)
+                for i in trial_nos
             ]
         )
         return juice
 
-    def extract_task_data(self):
-        trial_times = self.get_trial_times()
-        trial_params = [
-            self.R[self.R["startTrialParams"][i][0]] for i in range(self._no_trials)
+    def extract_reward_intervals(self, trial_nos: list = None):
+        """
+        Juice reward onset and offset times in s. Each run of consecutive rewarded samples within a trial is
+        one interval, the offset is the time of the first sample after the run.
+        """
+        if trial_nos is None:
+            trial_nos = range(self._no_trials)
+        if len(trial_nos) == 0:
+            return dict(start_time=np.empty(0), stop_time=np.empty(0))
+        trial_lengths = self._return_scalars("trialLength", trial_nos).astype("int64")
+        # juice is a sparse 1 x samples matrix, jc is its cumulative count of values per column (sample):
+        juice_trials = [
+            np.diff(juice["jc"][: trial_len + 1].ravel()) >= 1
+            for juice, trial_len in zip(self._return_refs("juice", trial_nos), trial_lengths)
         ]
+        trial_lengths = np.array([len(juice) for juice in juice_trials], dtype="int64")
+        trial_first_sample = np.concatenate([[0], np.cumsum(trial_lengths)[:-1]])
+        rewarded = np.concatenate(juice_trials)
+        is_first = np.zeros(len(rewarded), dtype=bool)
+        is_first[trial_first_sample[trial_lengths > 0]] = True
+        is_last = np.roll(is_first, -1)
+        is_last[-1:] = True
+        previous_rewarded = np.concatenate([[False], rewarded[:-1]]) & ~is_first
+        next_rewarded = np.concatenate([rewarded[1:], [False]]) & ~is_last
+        onsets = np.flatnonzero(rewarded & ~previous_rewarded)
+        offsets = np.flatnonzero(rewarded & ~next_rewarded)
+        sample_trial = np.repeat(np.arange(len(trial_lengths)), trial_lengths)
+        trial_start = self.get_trial_start_times(trial_nos)
+
+        def sample_time(samples, shift=0):
+            trials = sample_trial[samples]
+            return trial_start[trials] + (samples - trial_first_sample[trials] + shift)/1e3
+
+        return dict(start_time=sample_time(onsets), stop_time=sample_time(offsets, shift=1))
+
+    def extract_task_data(self, trial_nos: list = None):
+        trial_start = self.get_trial_start_times(trial_nos)
+        ragged_names = ["posTarget", "sizeTarget", "barrierPoints"]
+        trial_params, trial_params_ragged = self.extract_trial_params(
+            trial_nos,
+            names=["taskID", "versionID", "timeReach", "timeTargetHold", "timeFail"] + ragged_names,
+            ragged_names=ragged_names,
+        )
+
         out_dict = [
             dict(
                 name="is_successful",
                 description="if monkey started before the mandatory delay period after target shown",
-                data=self._return_array("isSuccessful"),
+                data=self._return_scalars("isSuccessful", trial_nos),
             ),
             dict(
                 name="task_id",
                 description="which target configuration",
-                data=[
-                    trlparams["taskID"][0, 0]
-                    for no, trlparams in enumerate(trial_params)
-                ],
+                data=trial_params["taskID"],
             ),
             dict(
                 name="version_id",
                 description="which target version",
-                data=[
-                    trlparams["versionID"][0, 0]
-                    for no, trlparams in enumerate(trial_params)
-                ],
+                data=trial_params["versionID"],
             ),
             dict(
                 name="reach_time",
                 description="max time to reach the target",
-                data=[
-                    trial_times[no][0] + trlparams["timeReach"][0, 0]*1e-3
-                    for no, trlparams in enumerate(trial_params)
-                ],
+                data=trial_start + trial_params["timeReach"]*1e-3,
             ),
             dict(
                 name="target_hold_time",
                 description="min time required to have successfully acquired the target",
-                data=[
-                    trial_times[no][0] + trlparams["timeTargetHold"][0, 0]*1e-3
-                    for no, trlparams in enumerate(trial_params)
-                ],
+                data=trial_start + trial_params["timeTargetHold"]*1e-3,
             ),
             dict(
                 name="fail_time",
                 description="time limit to target reach failure",
-                data=[
-                    trial_times[no][0] + trlparams["timeFail"][0, 0]*1e-3
-                    for no, trlparams in enumerate(trial_params)
-                ],
+                data=trial_start + trial_params["timeFail"]*1e-3,
             ),
             dict(
                 name="target_pos",
                 description="position of target on screen",
-                data=[
-                    trlparams["posTarget"][()].squeeze() for trlparams in trial_params
-                ],
-                index=True,
+                **_ragged_column(*trial_params_ragged["posTarget"]),
             ),
             dict(
                 name="target_size",
                 description="target size",
-                data=[
-                    trlparams["sizeTarget"][()].squeeze() for trlparams in trial_params
-                ],
-                index=True,
+                **_ragged_column(*trial_params_ragged["sizeTarget"]),
             ),
             dict(
                 name="barrier_points",
                 description="barrier points location",
-                data=[
-                    trlparams["barrierPoints"][()].squeeze()
-                    for trlparams in trial_params
-                ],
-                index=True,
+                **_ragged_column(*trial_params_ragged["barrierPoints"]),
             ),
         ]
         return out_dict
 
-    def extract_task_times(self):
-        trial_times = self.get_trial_times()
-        time_target_on = []
-        time_target_acquire = []
-        time_target_held = []
-        time_target_shown = []
-        for i in range(self._no_trials):
-            trial_start = trial_times[i][0]
-            target_acquire = self.R[self.R["timeTargetAcquire"][i][0]]
-            target_on = self.R[self.R["timeTargetOn"][i][0]]
-            target_held = self.R[self.R["timeTargetHeld"][i][0]]
-            delay_time = self.R[self.R["delayTime"][i][0]][0, 0]
-            if len(target_acquire.shape) > 1:
-                if target_acquire.shape == (1, 1):
-                    time_target_acquire.append(
-                        [target_acquire[0, 0]/1e3 + trial_start]
-                    )
-                else:
-                    time_target_acquire.append(
-                        (target_acquire[()]/1e3 + trial_start).squeeze().tolist()
-                    )
-            else:
-                time_target_acquire.append([np.nan])
-            if len(target_held.shape) > 1:
-                time_target_held.append(target_held[0, 0]/1e3 + trial_start)
-            else:
-                time_target_held.append(np.nan)
-            if len(target_on.shape) > 1:
-                time_target_on.append(target_on[0, 0]/1e3 + trial_start)
-            else:
-                time_target_on.append(np.nan)
-            if np.isnan(delay_time):
-                time_target_shown.append(time_target_on[-1])
-            else:
-                time_target_shown.append(time_target_on[-1] - delay_time/1e3)
+    def extract_task_times(self, trial_nos: list = None):
+        """
+        Event times in s. target_acquire_time can hold several acquisitions per trial and is returned as
+        flat data with the end offset of each trial in index, trials without acquisition hold a single nan.
+        """
+        trial_start = self.get_trial_start_times(trial_nos)
+        acquire_data, acquire_index = self._return_ragged(
+            "timeTargetAcquire", trial_nos, empty_value=np.nan
+        )
+        acquire_trial = np.repeat(np.arange(len(acquire_index)), np.diff(acquire_index, prepend=0))
+        time_target_acquire = acquire_data/1e3 + trial_start[acquire_trial]
+        time_target_held = self._return_scalars("timeTargetHeld", trial_nos)/1e3 + trial_start
+        time_target_on = self._return_scalars("timeTargetOn", trial_nos)/1e3 + trial_start
+        delay_time = self._return_scalars("delayTime", trial_nos)
+        time_target_shown = np.where(
+            np.isnan(delay_time), time_target_on, time_target_on - delay_time/1e3
+        )
         out_dict = [
             dict(
                 name="go_cue_time",
@@ -251,7 +417,7 @@ class MatDataExtractor:
                 name="target_acquire_time",
                 description="time when target was acquired by monkey",
                 data=time_target_acquire,
-                index=True,
+                index=acquire_index,
             ),
             dict(
                 name="target_held_time",
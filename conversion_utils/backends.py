@@ -0,0 +1,89 @@
+import shutil
+from pathlib import Path
+from typing import Union
+
+from .profiling import profile_span
+
+PathType = Union[str, Path]
+
+BACKEND_SUFFIXES = dict(hdf5=".nwb", zarr=".nwb.zarr")
+
+
+def get_backend_path(nwbfile_path: PathType, backend: str = "hdf5"):
+    """
+    nwbfile_path (.nwb) with the suffix of the backend, a .nwb.zarr directory for zarr.
+    """
+    nwbfile_path = Path(nwbfile_path)
+    return nwbfile_path.with_name(nwbfile_path.stem + BACKEND_SUFFIXES[backend])
+
+
+def get_output_size(nwbfile_path: PathType):
+    """
+    Bytes of an hdf5 file or of all the files of a zarr store.
+    """
+    nwbfile_path = Path(nwbfile_path)
+    if nwbfile_path.is_dir():
+        return sum(file_path.stat().st_size for file_path in nwbfile_path.rglob("*") if file_path.is_file())
+    return nwbfile_path.stat().st_size
+
+
+def write_nwbfile(nwbfile, nwbfile_path: PathType, backend: str = "hdf5"):
+    """
+    Write nwbfile to an hdf5 file or to a zarr store (requires hdmf-zarr), replacing an existing one.
+    """
+    assert backend in BACKEND_SUFFIXES, f"backend should be one of {list(BACKEND_SUFFIXES)}"
+    nwbfile_path = Path(nwbfile_path)
+    if backend == "hdf5":
+        from pynwb import NWBHDF5IO
+
+        with NWBHDF5IO(str(nwbfile_path), "w") as io:
+            io.write(nwbfile)
+        return
+    from hdmf_zarr.nwb import NWBZarrIO
+
+    if nwbfile_path.exists():
+        shutil.rmtree(nwbfile_path)
+    with NWBZarrIO(str(nwbfile_path), mode="w") as io:
+        io.write(nwbfile)
+
+
+def run_conversion(
+    converter,
+    nwbfile_path: PathType,
+    metadata: dict,
+    conversion_options: dict = None,
+    backend: str = "hdf5",
+    checkpointed: bool = False,
+):
+    """
+    converter.run_conversion to nwbfile_path for the hdf5 backend. For zarr, the in-memory NWBFile built by
+    the converter is written with write_nwbfile, timed as the 'write' span.
+
+    With checkpointed (hdf5 only), the data interfaces are appended to the file one at a time and a
+    conversion that crashed resumes from the first interface not written, see
+    conversion_utils.checkpoint.run_checkpointed.
+    """
+    if checkpointed:
+        from .checkpoint import run_checkpointed
+
+        assert backend == "hdf5", "only hdf5 conversions can be checkpointed"
+        return run_checkpointed(converter, nwbfile_path, metadata, conversion_options)
+    if backend == "hdf5":
+        return converter.run_conversion(
+            metadata=metadata,
+            nwbfile_path=str(nwbfile_path),
+            overwrite=True,
+            conversion_options=conversion_options,
+        )
+    if hasattr(converter, "create_nwbfile"):
+        # neuroconv converters:
+        nwbfile = converter.create_nwbfile(
+            metadata=metadata, conversion_options=conversion_options
+        )
+    else:
+        nwbfile = converter.run_conversion(
+            metadata=metadata, save_to_file=False, conversion_options=conversion_options
+        )
+    with profile_span("write"):
+        write_nwbfile(nwbfile, nwbfile_path, backend=backend)
+    return nwbfile
@@ -0,0 +1,127 @@
+"""
+Benchmark writing the same NWB content to an hdf5 file and to a zarr store:
+
+    python -m conversion_utils.benchmark_backends path/to/scratch --segments 8 --frames 1000000
+
+The content is synthetic: --segments int16 recordings of --channels channels, read from flat binary
+files like the SpikeGLX .bin, and a units table. Recordings already on disk (.bin, frames x channels int16)
+can be passed with --recordings instead.
+"""
+import argparse
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
+
+import numpy as np
+
+from .backends import BACKEND_SUFFIXES, get_output_size, write_nwbfile
+from .iterators import BinaryRecordingIterator
+
+
+def make_recordings(folder: Path, segments: int, num_channels: int, num_frames: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    file_paths = []
+    for segment in range(segments):
+        file_path = folder/f"segment{segment}.bin"
+        with open(file_path, "wb") as io:
+            for start in range(0, num_frames, 100000):
+                frames = min(100000, num_frames - start)
+                # band limited noise compresses like real recordings, white noise would not:
+                noise = rng.normal(0, 50, size=(frames, num_channels)).cumsum(axis=0)*0.05
+                io.write(noise.astype("int16").tobytes())
+        file_paths.append(file_path)
+    return file_paths
+
+
+def make_nwbfile(recording_paths: list, num_channels: int, num_units: int = 100, seed: int = 0):
+    from pynwb import NWBFile
+    from pynwb.ecephys import ElectricalSeries
+
+    nwbfile = NWBFile(
+        session_description="backend benchmark",
+        identifier=str(uuid4()),
+        session_start_time=datetime.now().astimezone(),
+    )
+    device = nwbfile.create_device(name="device")
+    group = nwbfile.create_electrode_group(
+        name="group", description="benchmark", location="unknown", device=device
+    )
+    for _ in range(num_channels):
+        nwbfile.add_electrode(group=group, location="unknown")
+    electrodes = nwbfile.create_electrode_table_region(
+        region=list(range(num_channels)), description="all electrodes"
+    )
+    for segment, file_path in enumerate(recording_paths):
+        nwbfile.add_acquisition(
+            ElectricalSeries(
+                name=f"ElectricalSeries{segment}",
+                data=BinaryRecordingIterator(file_path, num_channels),
+                electrodes=electrodes,
+                rate=30000.0,
+            )
+        )
+    rng = np.random.default_rng(seed)
+    for _ in range(num_units):
+        nwbfile.add_unit(spike_times=np.sort(rng.uniform(0, 3600, size=rng.integers(1000, 20000))))
+    return nwbfile
+
+
+def benchmark(
+    folder: Path,
+    recording_paths: list,
+    num_channels: int,
+    repeats: int = 1,
+):
+    """
+    Time writing the content to hdf5 and to zarr.
+
+    Returns
+    -------
+    list of dict(backend, repeat, write_time, data_bytes, output_size, throughput (MB/s))
+    """
+    data_bytes = sum(Path(file_path).stat().st_size for file_path in recording_paths)
+    results = []
+    for repeat in range(repeats):
+        for backend in BACKEND_SUFFIXES:
+            nwbfile_path = folder/f"benchmark{BACKEND_SUFFIXES[backend]}"
+            nwbfile = make_nwbfile(recording_paths, num_channels)
+            start = perf_counter()
+            write_nwbfile(nwbfile, nwbfile_path, backend=backend)
+            write_time = perf_counter() - start
+            results.append(
+                dict(
+                    backend=backend,
+                    repeat=repeat,
+                    write_time=write_time,
+                    data_bytes=data_bytes,
+                    output_size=get_output_size(nwbfile_path),
+                    throughput=data_bytes/1e6/write_time,
+                )
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("folder", type=Path, help="scratch folder for the recordings and outputs")
+    parser.add_argument("--recordings", nargs="+", type=Path)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=96)
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+    args.folder.mkdir(parents=True, exist_ok=True)
+    recording_paths = args.recordings or make_recordings(
+        args.folder, args.segments, args.channels, args.frames
+    )
+    results = benchmark(args.folder, recording_paths, args.channels, repeats=args.repeats)
+    for result in results:
+        print(
+            f"{result['backend']:<5} {result['write_time']:8.2f} s "
+            f"{result['throughput']:8.1f} MB/s  output {result['output_size']/1e6:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
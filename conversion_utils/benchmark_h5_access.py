@@ -0,0 +1,104 @@
+"""
+Benchmark the hdf5 access profiles of conversion_utils.h5access on real .mat files:
+
+    python -m conversion_utils.benchmark_h5_access center_out path/to/R*.mat --repeats 3
+
+Every repeat runs all profiles in turn on each file so that the os page cache warms up evenly,
+drop the caches between runs to compare cold reads.
+"""
+import argparse
+import importlib
+from pathlib import Path
+from time import perf_counter
+
+from .h5access import ACCESS_PROFILES
+
+WORKLOADS = dict(
+    center_out=(
+        "center_out_task.matextractor",
+        [
+            "extract_task_data",
+            "extract_task_times",
+            "extract_behavioral_position",
+            "extract_stimulus",
+        ],
+    ),
+    neuropixel=(
+        "monkey_neuropixel.matextractor",
+        [
+            "get_trial_epochs",
+            "get_behavior_movement",
+            "get_task_details",
+            "extract_unit_details",
+        ],
+    ),
+)
+
+
+def benchmark(task: str, file_paths: list, profiles: list = None, repeats: int = 1):
+    """
+    Time opening each file and running the extraction workload of the task with each access profile.
+
+    Returns
+    -------
+    list of dict(profile, file, file_size, repeat, open_time, workload_time, total_time)
+    """
+    module_name, method_names = WORKLOADS[task]
+    extractor_class = importlib.import_module(module_name).MatDataExtractor
+    profiles = list(ACCESS_PROFILES) if profiles is None else profiles
+    results = []
+    for repeat in range(repeats):
+        for file_path in file_paths:
+            for profile in profiles:
+                start = perf_counter()
+                extractor = extractor_class(file_path, access_profile=profile)
+                open_time = perf_counter() - start
+                with extractor:
+                    for method_name in method_names:
+                        getattr(extractor, method_name)()
+                total_time = perf_counter() - start
+                results.append(
+                    dict(
+                        profile=profile,
+                        file=str(file_path),
+                        file_size=Path(file_path).stat().st_size,
+                        repeat=repeat,
+                        open_time=open_time,
+                        workload_time=total_time - open_time,
+                        total_time=total_time,
+                    )
+                )
+    return results
+
+
+def summarize(results: list):
+    """
+    Best total time per (file, profile) and the winning profile per file.
+    """
+    best = dict()
+    for result in results:
+        key = (result["file"], result["profile"])
+        best[key] = min(best.get(key, float("inf")), result["total_time"])
+    winners = dict()
+    for (file, profile), total_time in best.items():
+        if file not in winners or total_time < best[(file, winners[file])]:
+            winners[file] = profile
+    return best, winners
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("task", choices=list(WORKLOADS))
+    parser.add_argument("file_paths", nargs="+", type=Path)
+    parser.add_argument("--profiles", nargs="+", choices=list(ACCESS_PROFILES))
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+    results = benchmark(args.task, args.file_paths, profiles=args.profiles, repeats=args.repeats)
+    best, winners = summarize(results)
+    for (file, profile), total_time in best.items():
+        marker = "*" if winners[file] == profile else " "
+        print(f"{marker} {profile:<12} {total_time:10.3f} s  {file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark streaming a flat binary recording (SpikeGLX .bin, frames x channels int16) to a gzip compressed
+hdf5 dataset with several compressing threads and chunk shapes:
+
+    python -m conversion_utils.benchmark_streaming path/to/scratch --threads 1 2 4 8 --chunks 30000x64 3000x384
+
+The recording is synthetic unless one is passed with --recording.
+"""
+import argparse
+from pathlib import Path
+
+from .benchmark_backends import make_recordings
+from .streaming import get_binary_memmap, stream_to_nwbfile
+
+
+def benchmark(folder: Path, recording_path: Path, num_channels: int, threads: list, chunk_shapes: list):
+    """
+    Stream the recording with every number of threads and chunk shape.
+
+    Returns
+    -------
+    list of dict(threads, chunk_shape, bytes, compressed_bytes, chunks, wall_time, throughput (MB/s))
+    """
+    import h5py
+
+    source = get_binary_memmap(recording_path, num_channels)
+    output_path = folder/"benchmark_streaming.h5"
+    results = []
+    for chunk_shape in chunk_shapes:
+        for number_of_threads in threads:
+            with h5py.File(output_path, "w") as file:
+                file.create_dataset(
+                    "data",
+                    shape=source.shape,
+                    dtype=source.dtype,
+                    chunks=tuple(min(size, maximum) for size, maximum in zip(chunk_shape, source.shape)),
+                    compression="gzip",
+                )
+            stats = stream_to_nwbfile(output_path, "data", source, number_of_threads=number_of_threads)
+            results.append(dict(stats, chunk_shape=chunk_shape))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("folder", type=Path, help="scratch folder for the recording and output")
+    parser.add_argument("--recording", type=Path)
+    parser.add_argument("--channels", type=int, default=385)
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--chunks", nargs="+", default=["30000x64"], help="frames x channels chunk shapes")
+    args = parser.parse_args()
+    args.folder.mkdir(parents=True, exist_ok=True)
+    recording_path = args.recording or make_recordings(args.folder, 1, args.channels, args.frames)[0]
+    chunk_shapes = [tuple(int(size) for size in chunks.split("x")) for chunks in args.chunks]
+    results = benchmark(args.folder, recording_path, args.channels, args.threads, chunk_shapes)
+    for result in results:
+        print(
+            f"chunks={'x'.join(str(size) for size in result['chunk_shape']):<10} threads={result['threads']:<3} "
+            f"{result['wall_time']:8.2f} s {result['throughput']:8.1f} MB/s  "
+            f"ratio {result['bytes']/max(result['compressed_bytes'], 1):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import json
+import os
+from copy import deepcopy
+from functools import partial
+from pathlib import Path
+from typing import Union
+
+from .manifest import hash_options
+from .profiling import profile_span
+
+PathType = Union[str, Path]
+
+ELECTRODES = "electrodes"
+
+
+def get_journal_path(nwbfile_path: PathType):
+    return Path(nwbfile_path).with_suffix(".journal.json")
+
+
+def list_objects(nwbfile_path: PathType):
+    """
+    Names of all the groups and datasets of an hdf5 file.
+    """
+    import h5py
+
+    names = []
+    with h5py.File(nwbfile_path, "r") as file:
+        file.visit(names.append)
+    return names
+
+
+def remove_objects(nwbfile_path: PathType, objects: list):
+    """
+    Delete the groups and datasets of an hdf5 file that are not in objects, the partial output of an
+    interrupted component.
+    """
+    import h5py
+
+    objects = set(objects)
+    with h5py.File(nwbfile_path, "r+") as file:
+        names = []
+        file.visit(names.append)
+        for name in sorted(set(names) - objects, key=len):
+            # the members of a deleted group are gone already:
+            if name in file:
+                del file[name]
+
+
+class ConversionJournal:
+    """
+    Sidecar JSON of a checkpointed conversion: the components written to the NWB file so far, the component
+    being written and the hdf5 objects of the file before it. The journal only holds for the key it was
+    created with (metadata and conversion options), another key starts it over.
+    """
+
+    def __init__(self, journal_path: PathType, key: str):
+        self.journal_path = Path(journal_path)
+        self.key = key
+        self.completed = []
+        self.started = None
+        self.objects = []
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as io:
+                journal = json.load(io)
+            if journal["key"] == key:
+                self.completed = journal["completed"]
+                self.started = journal["started"]
+                self.objects = journal["objects"]
+
+    def save(self):
+        temp_path = self.journal_path.with_name(f".{self.journal_path.name}.{os.getpid()}")
+        with open(temp_path, "w") as io:
+            json.dump(
+                dict(key=self.key, completed=self.completed, started=self.started, objects=self.objects),
+                io,
+                indent=2,
+            )
+        os.replace(temp_path, self.journal_path)
+
+    def reset(self):
+        self.completed = []
+        self.started = None
+        self.objects = []
+
+    def start(self, name: str, objects: list):
+        self.started = name
+        self.objects = objects
+        self.save()
+
+    def complete(self, name: str):
+        self.completed.append(name)
+        self.started = None
+        self.objects = []
+        self.save()
+
+    def remove(self):
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+
+
+def _add_electrodes(data_interface_objects: dict, metadata: dict, conversion_options: dict, nwbfile):
+    """
+    Devices, electrode groups and electrodes of all the recording interfaces. The tables of a file opened
+    for appending cannot grow, the electrodes of every recording are written with the first component so
+    that the recordings written next only refer to them.
+    """
+    from nwb_conversion_tools.utils.spike_interface import (
+        add_devices,
+        add_electrode_groups,
+        add_electrodes,
+    )
+
+    for name, data_interface in data_interface_objects.items():
+        recording = getattr(data_interface, "recording_extractor", None)
+        if recording is None:
+            continue
+        channel_ids = conversion_options.get(name, dict()).get("channel_ids")
+        if channel_ids is not None and hasattr(data_interface, "get_subset_recording"):
+            recording = data_interface.get_subset_recording(channel_ids=channel_ids)
+        add_devices(recording, nwbfile, metadata)
+        add_electrode_groups(recording, nwbfile, metadata)
+        add_electrodes(recording, nwbfile, metadata)
+
+
+def _run_interface(data_interface, metadata: dict, options: dict, nwbfile):
+    data_interface.run_conversion(nwbfile, metadata, **options)
+
+
+def _write_component(nwbfile_path: Path, metadata: dict, add_component):
+    """
+    Append what add_component(nwbfile) adds to the NWB file, created from metadata if it does not exist.
+    """
+    from nwb_conversion_tools.utils.conversion_tools import make_nwbfile_from_metadata
+    from pynwb import NWBHDF5IO
+
+    append = nwbfile_path.is_file()
+    with NWBHDF5IO(str(nwbfile_path), mode="r+" if append else "w", load_namespaces=append) as io:
+        nwbfile = io.read() if append else make_nwbfile_from_metadata(metadata=metadata)
+        add_component(nwbfile)
+        io.write(nwbfile)
+
+
+def _get_key(converter, metadata: dict, conversion_options: dict):
+    # the identifier is drawn at random by the converters, a restarted run keeps the one in the file:
+    nwbfile_metadata = {
+        key: value for key, value in metadata.get("NWBFile", dict()).items() if key != "identifier"
+    }
+    return hash_options(
+        dict(
+            metadata=dict(metadata, NWBFile=nwbfile_metadata),
+            conversion_options=conversion_options,
+            components=list(converter.data_interface_objects),
+        )
+    )
+
+
+def run_checkpointed(
+    converter, nwbfile_path: PathType, metadata: dict, conversion_options: dict = None
+):
+    """
+    Write the data interfaces of converter to nwbfile_path one at a time, each appended to the file and
+    recorded in a sidecar journal (see get_journal_path) once written. After a crash, the same call skips
+    the components already written, deletes what the interrupted one had written and continues from it. A
+    file without a journal, or whose journal is for other metadata or conversion options, is converted
+    again from the start. The journal is removed when the conversion completes.
+
+    Only for nwb_conversion_tools converters. The components are the electrodes of all the recordings,
+    then every data interface (each recording segment, the .mat data, the movie) in order. The data an
+    interface streams to the file once it is written (its stream_data method, see
+    ShenoySpikeGLXRecordingInterface.add_streamed_series) is part of its component.
+    """
+    assert not hasattr(converter, "create_nwbfile"), "only nwb_conversion_tools converters can be checkpointed"
+    converter.validate_metadata(metadata=metadata)
+    if conversion_options is None:
+        conversion_options = converter.get_conversion_options()
+    else:
+        converter.validate_conversion_options(conversion_options=conversion_options)
+    nwbfile_path = Path(nwbfile_path)
+    journal = ConversionJournal(
+        get_journal_path(nwbfile_path), _get_key(converter, metadata, conversion_options)
+    )
+    # add_devices and the interfaces fill in metadata, a rerun with the same dict should get the same key:
+    metadata = deepcopy(metadata)
+    if journal.started is not None and nwbfile_path.exists():
+        try:
+            remove_objects(nwbfile_path, journal.objects)
+        except OSError:
+            # the crash left the file unreadable:
+            journal.reset()
+    if not journal.completed or not nwbfile_path.exists():
+        journal.reset()
+        if nwbfile_path.exists():
+            nwbfile_path.unlink()
+    components = {
+        ELECTRODES: partial(
+            _add_electrodes, converter.data_interface_objects, metadata, conversion_options
+        )
+    }
+    for name, data_interface in converter.data_interface_objects.items():
+        components[name] = partial(
+            _run_interface, data_interface, metadata, conversion_options.get(name, dict())
+        )
+    for name, add_component in components.items():
+        if name in journal.completed:
+            continue
+        journal.start(name, list_objects(nwbfile_path) if nwbfile_path.exists() else [])
+        with profile_span(f"checkpoint {name}"):
+            _write_component(nwbfile_path, metadata, add_component)
+            stream_data = getattr(converter.data_interface_objects.get(name), "stream_data", None)
+            if stream_data is not None:
+                # the datasets allocated by the interface are only filled once the file is closed:
+                stream_data(nwbfile_path)
+        journal.complete(name)
+    journal.remove()
@@ -0,0 +1,37 @@
+import os
+from pathlib import Path
+from typing import Callable, Union
+
+PathType = Union[str, Path]
+
+# parsed (and compiled) yaml files of this process, by path and compile function:
+_CONFIGS = dict()
+
+
+def load_yaml(file_path: PathType, compile: Callable = None):
+    """
+    Content of a yaml file, parsed once per process and again only when its mtime changes. Every call
+    returns the cached content itself, callers that update it must copy it first.
+
+    Parameters
+    ----------
+    file_path: PathType
+    compile: Callable
+        applied to the parsed content before it is cached, to build lookup structures from it once
+    """
+    import yaml
+
+    file_path = Path(file_path).resolve()
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    key = (str(file_path), compile)
+    cached = _CONFIGS.get(key)
+    if cached is None or cached[0] != mtime_ns:
+        with open(file_path, "r") as io:
+            content = yaml.load(io, Loader=yaml.FullLoader)
+        cached = (mtime_ns, content if compile is None else compile(content))
+        _CONFIGS[key] = cached
+    return cached[1]
+
+
+def clear_config_cache():
+    _CONFIGS.clear()
@@ -0,0 +1,286 @@
+import struct
+from pathlib import Path
+from typing import Union
+
+from .scheduler import estimate_session_cost
+
+PathType = Union[str, Path]
+
+# throughput in MB/s of the source bytes, from the conversion profiles (see conversion_utils.profiling):
+ESTIMATED_RATES = dict(mat=20.0, recording=40.0, movie=1000.0)
+# keys of the source_data of the data interfaces that hold the source file:
+SOURCE_FILE_KEYS = ["nsx_override", "file_path", "filename", "movie_filepath"]
+BLACKROCK_CLOCK = 30000
+
+
+def read_nsx_header(file_path: PathType):
+    """
+    Channel count, channel (electrode) ids, sampling frequency and number of frames of a Blackrock .nsX
+    file from its headers and the headers of its data packets.
+
+    Returns
+    -------
+    dict(channel_count, channel_ids, sampling_frequency, num_frames, itemsize)
+    """
+    file_path = Path(file_path)
+    file_size = file_path.stat().st_size
+    with open(file_path, "rb") as io:
+        file_type = io.read(8)
+        if file_type == b"NEURALSG":
+            # file spec 2.1, a single packet of int16 samples after the channel ids:
+            io.seek(24)
+            period, channel_count = struct.unpack("<II", io.read(8))
+            channel_ids = list(struct.unpack(f"<{channel_count}I", io.read(4*channel_count)))
+            header_size = 32 + 4*channel_count
+            num_frames = (file_size - header_size)//(2*channel_count)
+        else:
+            assert file_type == b"NEURALCD", f"{file_path} is not a Blackrock nsx file"
+            major_version, header_size = struct.unpack("<BxI", io.read(6))
+            io.seek(286)
+            period = struct.unpack("<I", io.read(4))[0]
+            io.seek(310)
+            channel_count = struct.unpack("<I", io.read(4))[0]
+            # electrode id of the 66 byte extended header of each channel:
+            extended_headers = io.read(66*channel_count)
+            channel_ids = [
+                struct.unpack_from("<H", extended_headers, 66*channel_no + 2)[0]
+                for channel_no in range(channel_count)
+            ]
+            # data packet header: 1, timestamp (8 bytes from file spec 3.0, 4 bytes before) and number of
+            # data points:
+            packet_format = "<BQI" if major_version >= 3 else "<BII"
+            packet_header_size = struct.calcsize(packet_format)
+            num_frames = 0
+            position = header_size
+            while position + packet_header_size <= file_size:
+                io.seek(position)
+                packet_header, _, num_data_points = struct.unpack(packet_format, io.read(packet_header_size))
+                if packet_header != 1:
+                    break
+                if major_version >= 3 and num_data_points == 1 and position == header_size:
+                    # files with precision timestamps hold one sample per packet:
+                    num_frames = (file_size - header_size)//(packet_header_size + 2*channel_count)
+                    break
+                # the last packet of an interrupted recording can be shorter than its header says:
+                num_data_points = min(
+                    num_data_points, (file_size - position - packet_header_size)//(2*channel_count)
+                )
+                num_frames += num_data_points
+                position += packet_header_size + 2*channel_count*num_data_points
+    return dict(
+        channel_count=channel_count,
+        channel_ids=channel_ids,
+        sampling_frequency=BLACKROCK_CLOCK/period,
+        num_frames=num_frames,
+        itemsize=2,
+    )
+
+
+def read_spikeglx_header(file_path: PathType):
+    """
+    Channel count, sampling frequency and number of frames of a SpikeGLX .bin file from its .meta file.
+    """
+    file_path = Path(file_path)
+    meta = dict()
+    with open(file_path.with_suffix(".meta"), "r") as io:
+        for line in io:
+            if "=" in line:
+                key, value = line.strip().split("=", 1)
+                meta[key.lstrip("~")] = value
+    channel_count = int(meta["nSavedChans"])
+    file_size = int(meta.get("fileSizeBytes", file_path.stat().st_size))
+    return dict(
+        channel_count=channel_count,
+        sampling_frequency=float(meta.get("imSampRate", meta.get("niSampRate", 30000))),
+        num_frames=file_size//(2*channel_count),
+        itemsize=2,
+    )
+
+
+def _object_size(file, obj, depth: int = 0):
+    """
+    Bytes of an hdf5 dataset or group, following the matlab object references (cell arrays and struct
+    fields of the v7.3 format) to the datasets holding the data.
+    """
+    import h5py
+
+    if isinstance(obj, h5py.Group):
+        return sum(_object_size(file, member, depth) for member in obj.values())
+    if h5py.check_ref_dtype(obj.dtype) is None:
+        # matlab empty arrays hold their dimensions instead of data:
+        return 0 if obj.attrs.get("MATLAB_empty", 0) else obj.size*obj.dtype.itemsize
+    if depth > 2:
+        return 0
+    return sum(
+        _object_size(file, file[ref], depth + 1) for ref in obj[()].flatten() if ref
+    )
+
+
+def read_mat_field_sizes(file_path: PathType):
+    """
+    Bytes of the content of each field of the structs of a matlab v7.3 (hdf5) file, read from the hdf5
+    headers without loading the data. For older .mat versions, which are compressed and can only be
+    listed as a whole, the file size is returned under the name of each variable.
+
+    Returns
+    -------
+    dict(name: bytes), name as "<struct>/<field>"
+    """
+    file_path = Path(file_path)
+    try:
+        import h5py
+
+        with h5py.File(file_path, "r") as file:
+            sizes = dict()
+            for name, obj in file.items():
+                if name == "#refs#":
+                    continue
+                if isinstance(obj, h5py.Group):
+                    for field, member in obj.items():
+                        sizes[f"{name}/{field}"] = _object_size(file, member)
+                else:
+                    sizes[name] = _object_size(file, obj)
+            return sizes
+    except OSError:
+        from scipy.io import whosmat
+
+        names = [name for name, _, _ in whosmat(str(file_path))]
+        return {"/".join(names): file_path.stat().st_size}
+
+
+def _get_source_file(interface_source_data: dict):
+    for key in SOURCE_FILE_KEYS:
+        if interface_source_data.get(key):
+            return Path(interface_source_data[key])
+
+
+def estimate_recording(
+    header: dict, channel_ids: list = None, time_range: list = None, stub_test: bool = False
+):
+    """
+    Frames and bytes written of a recording, limited to the time_range and channel_ids stub options of the
+    interfaces. With channel_ids, only the requested channels among the channel_ids of the header are
+    counted, the channel count is bounded by the number of channels requested for headers without ids.
+    """
+    num_frames = header["num_frames"]
+    channel_count = header["channel_count"]
+    if time_range is not None:
+        start, stop = [int(time*header["sampling_frequency"]) for time in time_range]
+        num_frames = max(0, min(stop, num_frames) - min(start, num_frames))
+    if channel_ids is not None and "channel_ids" in header:
+        channel_count = len(set(header["channel_ids"]) & set(channel_ids))
+    elif channel_ids is not None:
+        channel_count = min(channel_count, len(channel_ids))
+    if stub_test:
+        # the stub_test option of the recording interfaces keeps the first 100 frames:
+        num_frames = min(num_frames, 100)
+    return dict(
+        num_frames=num_frames,
+        channel_count=channel_count,
+        bytes=num_frames*channel_count*header["itemsize"],
+    )
+
+
+def estimate_conversion(
+    data_interface_classes: dict,
+    source_data: dict,
+    conversion_options: dict = None,
+    rates: dict = None,
+):
+    """
+    Dry run of a conversion: predict the size of each output dataset, the peak memory and the wall time
+    from the headers of the source files, without reading their data or creating the data interfaces.
+    Recording sizes are uncompressed, .mat content sizes are those of the source content, the external
+    movies are not copied.
+
+    Parameters
+    ----------
+    data_interface_classes: dict
+        of the NWBConverter, only the source_data of these interfaces is considered
+    source_data: dict
+        as for the NWBConverter
+    conversion_options: dict
+        as for NWBConverter.run_conversion, the stub options (channel_ids, time_range, stub_test) of the
+        recordings are accounted for. The channel ids of a Blackrock file are its electrode ids, plus the
+        get_channel_id_offset(source_data) of the data interface class when it defines one.
+    rates: dict
+        throughput in MB/s for the 'mat', 'recording' and 'movie' sources, see ESTIMATED_RATES
+
+    Returns
+    -------
+    dict(datasets=dict(name: bytes), output_size=bytes, memory=bytes, wall_time=s)
+    """
+    conversion_options = dict() if conversion_options is None else conversion_options
+    rates = dict(ESTIMATED_RATES, **(rates or dict()))
+    datasets = dict()
+    file_paths = []
+    wall_time = 0.0
+    for name in data_interface_classes:
+        if name not in source_data:
+            continue
+        file_path = _get_source_file(source_data[name])
+        if file_path is None:
+            continue
+        file_paths.append(file_path)
+        options = conversion_options.get(name, dict())
+        if file_path.suffix.startswith(".ns"):
+            header = read_nsx_header(file_path)
+            get_channel_id_offset = getattr(data_interface_classes[name], "get_channel_id_offset", None)
+            if get_channel_id_offset is not None:
+                offset = get_channel_id_offset(source_data[name])
+                header.update(channel_ids=[channel_id + offset for channel_id in header["channel_ids"]])
+            recording = estimate_recording(
+                header,
+                channel_ids=options.get("channel_ids"),
+                time_range=options.get("time_range"),
+                stub_test=options.get("stub_test", False),
+            )
+            es_key = options.get("es_key", source_data[name].get("es_key", "ElectricalSeries"))
+            datasets[f"{name}/{es_key}"] = recording["bytes"]
+            wall_time += recording["bytes"]/1e6/rates["recording"]
+        elif file_path.suffix == ".bin":
+            recording = estimate_recording(
+                read_spikeglx_header(file_path),
+                stub_test=options.get("stub_test", source_data[name].get("stub_test", False)),
+            )
+            datasets[f"{name}/ElectricalSeries"] = recording["bytes"]
+            wall_time += recording["bytes"]/1e6/rates["recording"]
+        elif file_path.suffix == ".mat":
+            field_sizes = read_mat_field_sizes(file_path)
+            for field, size in field_sizes.items():
+                datasets[f"{name}/{field}"] = size
+            wall_time += sum(field_sizes.values())/1e6/rates["mat"]
+        else:
+            # movies are linked as external files:
+            datasets[f"{name}/{file_path.name}"] = 0
+            wall_time += file_path.stat().st_size/1e6/rates["movie"]
+    return dict(
+        datasets=datasets,
+        output_size=sum(datasets.values()),
+        memory=estimate_session_cost(file_paths)["memory"],
+        wall_time=wall_time,
+    )
+
+
+class EstimateConversionMixin:
+    """
+    Adds estimate_conversion, the dry run of the conversion of its data_interface_classes, to an
+    NWBConverter.
+    """
+
+    @classmethod
+    def estimate_conversion(cls, source_data: dict, conversion_options: dict = None, rates: dict = None):
+        """
+        Dry run: output size per dataset, peak memory and wall time predicted from the source headers,
+        see conversion_utils.estimator.estimate_conversion
+        """
+        return estimate_conversion(cls.data_interface_classes, source_data, conversion_options, rates=rates)
+
+
+def format_estimate(estimate: dict):
+    lines = [f"{name}: {size/1e6:.1f} MB" for name, size in estimate["datasets"].items() if size]
+    lines.append(
+        f"output {estimate['output_size']/1e9:.2f} GB, peak memory {estimate['memory']/1e9:.2f} GB, "
+        f"about {estimate['wall_time']/60:.1f} min"
+    )
+    return "\n".join(lines)
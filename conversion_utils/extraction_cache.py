@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Union
+
+import numpy as np
+
+from .manifest import hash_file, hash_options
+from .profiling import profile_span
+
+PathType = Union[str, Path]
+
+
+def _is_number(value):
+    return isinstance(value, (bool, int, float, np.bool_, np.number))
+
+
+def _is_number_list(value):
+    return isinstance(value, list) and all(_is_number(element) for element in value)
+
+
+def _is_single_type(values):
+    """
+    Whether values are all of one type, so that the array they are stored as gives them back unchanged
+    (an array of ints and floats would turn the ints into floats).
+    """
+    return len({type(value) for value in values}) <= 1
+
+
+def _is_raggable(values: list):
+    """
+    Whether values are arrays of the same dtype and trailing dimensions that can be stored concatenated
+    along their first axis.
+    """
+    first = values[0]
+    return all(
+        isinstance(value, np.ndarray)
+        and value.dtype != object
+        and value.ndim > 0
+        and value.dtype == first.dtype
+        and value.shape[1:] == first.shape[1:]
+        for value in values
+    )
+
+
+class _Encoder:
+    """
+    Encode the output of an extraction (nested dicts, lists and tuples of arrays, numbers and strings) as
+    a JSON structure referencing flat arrays. Lists of numbers are stored as one array and lists of arrays
+    or of number lists (per trial or per unit values) as the concatenated data and the length of each
+    element, so that the spike times of a session take two arrays instead of one per unit. Number lists
+    mixing types (ints and floats...) are encoded number by number.
+    """
+
+    def __init__(self):
+        self.arrays = dict()
+
+    def _add(self, array):
+        key = f"a{len(self.arrays)}"
+        self.arrays[key] = np.ascontiguousarray(array)
+        return key
+
+    def encode(self, value):
+        if value is None or isinstance(value, (str, bool, int, float)):
+            return value
+        if isinstance(value, np.generic):
+            return dict(__scalar__=value.item(), dtype=value.dtype.str)
+        if isinstance(value, np.ndarray):
+            if value.dtype == object:
+                return dict(
+                    __objects__=[self.encode(element) for element in value.flatten()],
+                    shape=value.shape,
+                )
+            return dict(__array__=self._add(value))
+        if isinstance(value, dict):
+            assert all(isinstance(key, str) for key in value), "only str keys can be cached"
+            return dict(__dict__={key: self.encode(element) for key, element in value.items()})
+        if isinstance(value, (list, tuple)):
+            is_tuple = isinstance(value, tuple)
+            if len(value) > 0 and not is_tuple:
+                if all(_is_number(element) for element in value) and _is_single_type(value):
+                    return dict(
+                        __numbers__=self._add(np.array(value)),
+                        python=not isinstance(value[0], np.generic),
+                    )
+                if _is_raggable(value):
+                    return self._encode_ragged(value)
+                if all(_is_number_list(element) for element in value) and _is_single_type(
+                        number for element in value for number in element
+                ):
+                    numbers = [element for element in value if len(element) > 0]
+                    # the empty lists take the dtype of the numbers, not float64:
+                    dtype = np.array(numbers[0]).dtype if numbers else None
+                    ragged = self._encode_ragged([np.array(element, dtype=dtype) for element in value])
+                    ragged.update(
+                        lists=True,
+                        python=not numbers or not isinstance(numbers[0][0], np.generic),
+                    )
+                    return ragged
+            return dict(__list__=[self.encode(element) for element in value], tuple=is_tuple)
+        raise TypeError(f"{type(value)} cannot be cached")
+
+    def _encode_ragged(self, arrays: list):
+        return dict(
+            __ragged__=self._add(np.concatenate(arrays, axis=0)),
+            lengths=self._add(np.array([len(array) for array in arrays], dtype="int64")),
+        )
+
+
+def _decode(structure, arrays):
+    if not isinstance(structure, dict):
+        return structure
+    if "__scalar__" in structure:
+        return np.dtype(structure["dtype"]).type(structure["__scalar__"])
+    if "__objects__" in structure:
+        objects = np.empty(len(structure["__objects__"]), dtype=object)
+        objects[:] = [_decode(element, arrays) for element in structure["__objects__"]]
+        return objects.reshape(structure["shape"])
+    if "__array__" in structure:
+        return arrays[structure["__array__"]]
+    if "__dict__" in structure:
+        return {key: _decode(element, arrays) for key, element in structure["__dict__"].items()}
+    if "__numbers__" in structure:
+        numbers = arrays[structure["__numbers__"]]
+        return numbers.tolist() if structure["python"] else list(numbers)
+    if "__ragged__" in structure:
+        lengths = arrays[structure["lengths"]]
+        values = np.split(arrays[structure["__ragged__"]], np.cumsum(lengths)[:-1])
+        if structure.get("lists"):
+            return [value.tolist() if structure["python"] else list(value) for value in values]
+        return values
+    values = [_decode(element, arrays) for element in structure["__list__"]]
+    return tuple(values) if structure["tuple"] else values
+
+
+def save_extraction(file_path: PathType, data):
+    """
+    Save the output of an extraction as an uncompressed .npz of flat arrays plus its JSON structure.
+    """
+    file_path = Path(file_path)
+    encoder = _Encoder()
+    structure = encoder.encode(data)
+    temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}")
+    with open(temp_path, "wb") as io:
+        np.savez(io, __structure__=np.array(json.dumps(structure)), **encoder.arrays)
+    # concurrent sessions of a batch can extract the same file, the last one to finish replaces the cache:
+    os.replace(temp_path, file_path)
+
+
+def load_extraction(file_path: PathType):
+    with np.load(file_path, allow_pickle=False) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    return _decode(json.loads(str(arrays.pop("__structure__"))), arrays)
+
+
+class ExtractionCache:
+    """
+    Folder of the data extracted from the source .mat files, keyed by the sha256 of the file, the extractor
+    class and version (MatDataExtractor.EXTRACTOR_VERSION, to be increased whenever the extracted values
+    change) and the extraction options. Reconversions of unchanged files load the trial columns, spike and
+    behavior arrays from the cache instead of parsing the file again. Files whose size and mtime did not
+    change since they were last hashed are not hashed again.
+    """
+
+    def __init__(self, cache_dir: PathType):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._hashes_path = self.cache_dir/"file_hashes.json"
+        self._hashes = dict()
+        if self._hashes_path.exists():
+            with open(self._hashes_path, "r") as io:
+                self._hashes = json.load(io)
+
+    def hash_file(self, file_path: PathType):
+        file_path = str(Path(file_path).resolve())
+        stat = os.stat(file_path)
+        known = self._hashes.get(file_path, dict())
+        if known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+            return known["sha256"]
+        self._hashes[file_path] = dict(
+            size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=hash_file(file_path)
+        )
+        temp_path = self._hashes_path.with_name(f".{self._hashes_path.name}.{os.getpid()}")
+        with open(temp_path, "w") as io:
+            json.dump(self._hashes, io, indent=2)
+        os.replace(temp_path, self._hashes_path)
+        return self._hashes[file_path]["sha256"]
+
+    def get_path(self, file_path: PathType, extractor, options: dict = None):
+        """
+        Cache file of the extraction of file_path by extractor (a MatDataExtractor class or instance) with
+        options.
+        """
+        extractor_class = extractor if isinstance(extractor, type) else type(extractor)
+        key = hashlib.sha256(
+            "".join(
+                [
+                    self.hash_file(file_path),
+                    f"{extractor_class.__module__}.{extractor_class.__name__}",
+                    str(extractor_class.EXTRACTOR_VERSION),
+                    hash_options(options or dict()),
+                ]
+            ).encode()
+        ).hexdigest()
+        return self.cache_dir/f"{Path(file_path).stem}.{key[:16]}.npz"
+
+    def get(self, file_path: PathType, extractor, extract: Callable, options: dict = None):
+        """
+        Cached output of extract(), calling it and caching its output on a miss.
+
+        Parameters
+        ----------
+        file_path: PathType
+            source file the data is extracted from
+        extractor: MatDataExtractor
+            class or instance, its EXTRACTOR_VERSION is part of the key
+        extract: Callable
+            function without arguments returning the extracted data: dicts, lists and tuples of numpy
+            arrays, numbers and strings
+        options: dict
+            extraction options (trial or channel subsets...) that change the extracted data
+        """
+        cache_path = self.get_path(file_path, extractor, options)
+        if cache_path.exists():
+            with profile_span("cache_load") as counts:
+                counts.update(bytes=cache_path.stat().st_size)
+                return load_extraction(cache_path)
+        data = extract()
+        with profile_span("cache_save"):
+            save_extraction(cache_path, data)
+        return data
+
+
+def cached_extraction(
+    cache_dir: PathType, file_path: PathType, extractor, extract: Callable, options: dict = None
+):
+    """
+    ExtractionCache(cache_dir).get(...), extract() without caching if cache_dir is None.
+    """
+    if cache_dir is None:
+        return extract()
+    return ExtractionCache(cache_dir).get(file_path, extractor, extract, options=options)
@@ -0,0 +1,58 @@
+import warnings
+from pathlib import Path
+from typing import Union
+
+import h5py
+
+PathType = Union[str, Path]
+
+# h5py.File defaults are a 1 MiB chunk cache with 521 slots and the sec2 driver.
+ACCESS_PROFILES = dict(
+    default=dict(),
+    large_cache=dict(rdcc_nbytes=256*1024**2, rdcc_nslots=100003, rdcc_w0=1.0),
+    in_memory=dict(core_max_bytes=2*1024**3, rdcc_nbytes=64*1024**2, rdcc_nslots=10007),
+    page_buffer=dict(page_buf_size=64*1024**2, rdcc_nbytes=64*1024**2, rdcc_nslots=10007),
+)
+
+
+def resolve_access_profile(access_profile: Union[str, dict] = None):
+    """
+    Return the h5py access settings for a profile name from ACCESS_PROFILES or a dict of settings.
+
+    Settings
+    --------
+    rdcc_nbytes, rdcc_nslots, rdcc_w0:
+        raw data chunk cache size, number of hash slots and preemption policy
+    core_max_bytes: int
+        files up to this size are read fully into memory with the core driver
+    page_buf_size, min_meta_keep, min_raw_keep:
+        page buffer settings, only effective on files created with the paged file space strategy
+    """
+    if access_profile is None:
+        return dict()
+    if isinstance(access_profile, str):
+        assert access_profile in ACCESS_PROFILES, f"access_profile should be one of {list(ACCESS_PROFILES)}"
+        return dict(ACCESS_PROFILES[access_profile])
+    return dict(access_profile)
+
+
+def open_h5_file(file_path: PathType, access_profile: Union[str, dict] = None):
+    """
+    Open an hdf5 (matlab v7.3) file read-only with the settings of an access profile.
+    """
+    file_path = Path(file_path)
+    kwargs = resolve_access_profile(access_profile)
+    core_max_bytes = kwargs.pop("core_max_bytes", 0)
+    if core_max_bytes and file_path.stat().st_size <= core_max_bytes:
+        kwargs.update(driver="core", backing_store=False)
+    try:
+        return h5py.File(file_path, "r", **kwargs)
+    except OSError:
+        if "page_buf_size" not in kwargs:
+            raise
+        # page buffering is refused by some hdf5 builds for files that are not paged:
+        dropped = {
+            key: kwargs.pop(key) for key in ["page_buf_size", "min_meta_keep", "min_raw_keep"] if key in kwargs
+        }
+        warnings.warn(f"{file_path.name} is opened without page buffering, the settings {dropped} are ignored")
+        return h5py.File(file_path, "r", **kwargs)
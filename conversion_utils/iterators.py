@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+from hdmf.data_utils import GenericDataChunkIterator
+
+PathType = Union[str, Path]
+
+
+class BinaryRecordingIterator(GenericDataChunkIterator):
+    """
+    Chunks of a flat binary recording of frames x channels int16 samples (SpikeGLX .bin), read through a
+    memmap one chunk at a time.
+    """
+
+    def __init__(self, file_path: PathType, num_channels: int, dtype: str = "int16", **kwargs):
+        self.file_path = str(file_path)
+        self.num_channels = num_channels
+        self.binary_dtype = dtype
+        self._kwargs = kwargs
+        self._memmap = None
+        super().__init__(**kwargs)
+
+    def _get_memmap(self):
+        if self._memmap is None:
+            self._memmap = np.memmap(self.file_path, dtype=self.binary_dtype, mode="r").reshape(
+                -1, self.num_channels
+            )
+        return self._memmap
+
+    def _get_data(self, selection):
+        return np.asarray(self._get_memmap()[selection])
+
+    def _get_maxshape(self):
+        return self._get_memmap().shape
+
+    def _get_dtype(self):
+        return np.dtype(self.binary_dtype)
+
+    def _to_dict(self):
+        return dict(
+            file_path=self.file_path,
+            num_channels=self.num_channels,
+            dtype=self.binary_dtype,
+            **self._kwargs,
+        )
+
+    @staticmethod
+    def _from_dict(dictionary: dict):
+        return BinaryRecordingIterator(**dictionary)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Union
+
+from .scheduler import schedule_sessions
+
+PathType = Union[str, Path]
+
+
+def hash_file(file_path: PathType, chunk_size: int = 16*1024**2):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as io:
+        for chunk in iter(lambda: io.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def hash_options(options: dict):
+    return hashlib.sha256(
+        json.dumps(options, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ConversionManifest:
+    """
+    JSON record of batch conversions. For every session it holds the size and mtime of each input file
+    (and its sha256 once it was hashed, see run_resumable), the hash of the conversion options, the output
+    path and the status of the last run. Input files are identified by their size and mtime, so checking
+    the sessions does not read their content.
+    """
+
+    def __init__(self, manifest_path: PathType):
+        self.manifest_path = Path(manifest_path)
+        self.sessions = dict()
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as io:
+                self.sessions = json.load(io)
+        self._hashes = dict()
+        for session in self.sessions.values():
+            self._hashes.update(session.get("inputs", dict()))
+
+    def fingerprint(self, file_paths: list, hash_content: bool = False):
+        """
+        size, mtime_ns of the input files, with their sha256 if hash_content or if it is known for the same
+        size and mtime.
+        """
+        inputs = dict()
+        for file_path in sorted(str(Path(file_path).resolve()) for file_path in file_paths):
+            stat = os.stat(file_path)
+            known = self._hashes.get(file_path, dict())
+            inputs[file_path] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            if known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+                inputs[file_path] = known
+            if hash_content and "sha256" not in inputs[file_path]:
+                inputs[file_path] = dict(inputs[file_path], sha256=hash_file(file_path))
+                self._hashes[file_path] = inputs[file_path]
+        return inputs
+
+    @staticmethod
+    def content_identifier(inputs: dict, options: dict = None):
+        """
+        NWB identifier derived from the input file hashes and the conversion options, identical on reruns.
+        """
+        content = "".join(sorted(value["sha256"] for value in inputs.values()))
+        content += hash_options(options or dict())
+        return str(uuid.UUID(hashlib.sha256(content.encode()).hexdigest()[:32]))
+
+    def is_up_to_date(self, name: str, inputs: dict, options: dict, output_path: PathType):
+        session = self.sessions.get(name)
+        return (
+            session is not None
+            and session["status"] == "completed"
+            and {key: (value["size"], value["mtime_ns"]) for key, value in session["inputs"].items()}
+            == {key: (value["size"], value["mtime_ns"]) for key, value in inputs.items()}
+            and session["options_hash"] == hash_options(options)
+            and session["output_path"] == str(output_path)
+            and Path(output_path).exists()
+        )
+
+    def record(
+        self,
+        name: str,
+        inputs: dict,
+        options: dict,
+        output_path: PathType,
+        status: str,
+        error: str = None,
+    ):
+        self.sessions[name] = dict(
+            inputs=inputs,
+            options_hash=hash_options(options),
+            output_path=str(output_path),
+            status=status,
+            error=error,
+            updated=datetime.now().isoformat(),
+        )
+        self.save()
+
+    def save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_suffix(".tmp")
+        with open(temp_path, "w") as io:
+            json.dump(self.sessions, io, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+
+def _run_with_content_identifier(func, inputs: dict, options: dict, *args, **kwargs):
+    """
+    Hash the input files in the worker, those of inputs (see ConversionManifest.fingerprint) without a
+    sha256 or changed since, and run func with the NWB identifier derived from their content.
+
+    Returns
+    -------
+    dict(result=output of func, inputs=inputs with the sha256 of every file)
+    """
+    hashed = dict()
+    for file_path, known in inputs.items():
+        stat = os.stat(file_path)
+        hashed[file_path] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        if "sha256" in known and (known["size"], known["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            hashed[file_path] = known
+        else:
+            hashed[file_path].update(sha256=hash_file(file_path))
+    result = func(*args, identifier=ConversionManifest.content_identifier(hashed, options), **kwargs)
+    return dict(result=result, inputs=hashed)
+
+
+def run_resumable(
+    func,
+    sessions: list,
+    manifest_path: PathType,
+    content_identifier: bool = False,
+    **schedule_kwargs,
+):
+    """
+    schedule_sessions, skipping the sessions the manifest records as completed with the same input files,
+    options and existing output. Failed, interrupted and changed sessions are converted again.
+
+    Parameters
+    ----------
+    sessions: list
+        as for schedule_sessions, with the session's 'output_path' and 'options' (converter options that
+        should trigger a reconversion when changed, defaults to its kwargs)
+    content_identifier: bool
+        pass an NWB identifier derived from the input content to func as the 'identifier' kwarg. The input
+        files are hashed by the worker converting the session, not before the sessions are scheduled, and
+        their sha256 recorded in the manifest when the session completes. Files hashed by an earlier run
+        and unchanged since are not hashed again.
+    """
+    manifest = ConversionManifest(manifest_path)
+    to_run = []
+    for session in sessions:
+        inputs = manifest.fingerprint(session["file_paths"])
+        options = session.get("options", session.get("kwargs", dict()))
+        if manifest.is_up_to_date(session["name"], inputs, options, session["output_path"]):
+            print(f"skipping {session['name']}: up to date")
+            continue
+        args = tuple(session.get("args", ()))
+        if content_identifier:
+            args = (func, inputs, options) + args
+        manifest.record(session["name"], inputs, options, session["output_path"], "running")
+        to_run.append(dict(session, args=args, inputs=inputs, options=options))
+
+    def record_report(session, report):
+        inputs = session["inputs"]
+        if content_identifier and report["status"] == "completed":
+            inputs = report["result"]["inputs"]
+            report["result"] = report["result"]["result"]
+        manifest.record(
+            session["name"],
+            inputs,
+            session["options"],
+            session["output_path"],
+            report["status"],
+            error=report["error"],
+        )
+
+    return schedule_sessions(
+        _run_with_content_identifier if content_identifier else func,
+        to_run,
+        callback=record_report,
+        **schedule_kwargs,
+    )
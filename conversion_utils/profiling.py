@@ -0,0 +1,356 @@
+import json
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+from time import perf_counter, process_time
+from typing import Union
+
+PathType = Union[str, Path]
+
+_active_profiler = None
+
+
+def get_rss():
+    """
+    Resident set size of this process in bytes, None where it cannot be read.
+    """
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as io:
+            return int(io.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class RSSSampler:
+    """
+    Thread polling the resident set size every interval seconds and keeping its maximum since the last
+    reset(), to catch the peaks of stages that allocate and free within a call.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = get_rss()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _update(self, rss):
+        # samples where the rss could not be read are skipped:
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self._update(get_rss())
+
+    def start(self):
+        if self.peak is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        """
+        Current rss (the peak if it cannot be read) and peak since the last reset.
+        """
+        rss = get_rss()
+        self._update(rss)
+        return self.peak if rss is None else rss, self.peak
+
+    def reset(self):
+        rss = get_rss()
+        if rss is not None:
+            self.peak = rss
+
+
+class ConversionProfiler:
+    """
+    Named spans of a session conversion. Every span accumulates its number of calls, wall time, CPU time
+    (of the whole process) and the items and bytes processed, under the name of the span it was first
+    opened in. Spans of the same name are summed, so a stage called per chunk or per trial is one entry.
+
+    With trace_allocations, the peak of the memory allocated through python (numpy arrays included, see
+    tracemalloc) while the span runs and its increase over the start of the span are recorded as
+    peak_traced and peak_traced_delta. With poll_rss, the same from the resident set size polled every
+    rss_interval seconds as peak_rss and peak_rss_delta. Peaks of the enclosing spans include the peaks
+    of their inner spans; the values of a span called several times are the maximum over the calls.
+    tracemalloc slows allocations down, the wall and CPU times are best taken from a run without it.
+    """
+
+    def __init__(
+        self,
+        session: str = "",
+        trace_allocations: bool = False,
+        poll_rss: bool = False,
+        rss_interval: float = 0.01,
+    ):
+        self.session = session
+        self.trace_allocations = trace_allocations
+        self.poll_rss = poll_rss
+        self.rss_interval = rss_interval
+        self.spans = dict()
+        self._stack = []
+        # running memory peaks of the open spans:
+        self._peaks = []
+        self._rss_sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.poll_rss and self._rss_sampler is None:
+            self._rss_sampler = RSSSampler(self.rss_interval)
+            self._rss_sampler.start()
+
+    def stop(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if self._rss_sampler is not None:
+            self._rss_sampler.stop()
+            self._rss_sampler = None
+
+    def _sample_memory(self):
+        """
+        dict(traced=(current, peak), rss=(current, peak)) of the enabled measures, the peaks since the
+        last _reset_memory.
+        """
+        memory = dict()
+        if tracemalloc.is_tracing() and self.trace_allocations:
+            memory.update(traced=tracemalloc.get_traced_memory())
+        if self._rss_sampler is not None and self._rss_sampler.peak is not None:
+            memory.update(rss=self._rss_sampler.sample())
+        return memory
+
+    def _reset_memory(self):
+        # tracemalloc.reset_peak is new in python 3.9, before it the traced peaks are the peak so far:
+        if "traced" in self._peaks[-1] and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        if "rss" in self._peaks[-1]:
+            self._rss_sampler.reset()
+
+    def _enter_memory(self):
+        memory = self._sample_memory()
+        if self._peaks:
+            # fold the peak so far into the enclosing span before resetting it:
+            for key, (_, peak) in memory.items():
+                self._peaks[-1][key]["peak"] = max(self._peaks[-1][key]["peak"], peak)
+        self._peaks.append(
+            {key: dict(start=current, peak=current) for key, (current, _) in memory.items()}
+        )
+        self._reset_memory()
+
+    def _exit_memory(self, record: dict):
+        memory = self._sample_memory()
+        peaks = self._peaks.pop()
+        for key, (_, peak) in memory.items():
+            if key not in peaks:
+                continue
+            peak = max(peaks[key]["peak"], peak)
+            record[f"peak_{key}"] = max(record.get(f"peak_{key}", 0), peak)
+            record[f"peak_{key}_delta"] = max(
+                record.get(f"peak_{key}_delta", 0), peak - peaks[key]["start"]
+            )
+            if self._peaks and key in self._peaks[-1]:
+                self._peaks[-1][key]["peak"] = max(self._peaks[-1][key]["peak"], peak)
+
+    def _get_record(self, name: str):
+        if name not in self.spans:
+            self.spans[name] = dict(
+                name=name,
+                parent=self._stack[-1] if self._stack else None,
+                calls=0,
+                wall_time=0.0,
+                cpu_time=0.0,
+                items=0,
+                bytes=0,
+            )
+        return self.spans[name]
+
+    @contextmanager
+    def span(self, name: str, items: int = 0, bytes: int = 0):
+        """
+        Time the enclosed block as span name. Yields dict(items, bytes) to update with the amounts
+        processed when they are only known inside the block.
+        """
+        record = self._get_record(name)
+        counts = dict(items=items, bytes=bytes)
+        self._stack.append(name)
+        self._enter_memory()
+        wall_start, cpu_start = perf_counter(), process_time()
+        try:
+            yield counts
+        finally:
+            record["wall_time"] += perf_counter() - wall_start
+            record["cpu_time"] += process_time() - cpu_start
+            record["calls"] += 1
+            record["items"] += int(counts["items"])
+            record["bytes"] += int(counts["bytes"])
+            self._exit_memory(record)
+            self._stack.pop()
+
+    def to_dict(self):
+        return dict(session=self.session, spans=list(self.spans.values()))
+
+    def save(self, file_path: PathType):
+        with open(file_path, "w") as io:
+            json.dump(self.to_dict(), io, indent=2)
+
+
+def get_profile_path(nwbfile_path: PathType):
+    return Path(nwbfile_path).with_suffix(".profile.json")
+
+
+@contextmanager
+def profiling(profiler: ConversionProfiler):
+    """
+    Make profiler the target of profile_span in this process while the block runs, with its memory
+    sampling started.
+    """
+    global _active_profiler
+    previous = _active_profiler
+    _active_profiler = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active_profiler = previous
+
+
+def profile_span(name: str, items: int = 0, bytes: int = 0):
+    """
+    ConversionProfiler.span of the active profiler, a no-op yielding the same counts dict when no
+    conversion is being profiled.
+    """
+    if _active_profiler is None:
+        return nullcontext(dict(items=items, bytes=bytes))
+    return _active_profiler.span(name, items=items, bytes=bytes)
+
+
+def get_nbytes(data):
+    """
+    Bytes held by the arrays in data, summed over nested lists and tuples. Python numbers count as 8 bytes.
+    """
+    if isinstance(data, (list, tuple)):
+        return sum(get_nbytes(value) for value in data)
+    if hasattr(data, "nbytes"):
+        return int(data.nbytes)
+    if isinstance(data, str):
+        return len(data.encode())
+    return 8 if isinstance(data, (int, float)) else 0
+
+
+def trace_method(obj, method_name: str, span_name: str):
+    """
+    Wrap obj.method_name so that each call is added to span span_name, with the size and nbytes of the
+    returned array as items and bytes. Used on the recording extractors, whose traces are only read in
+    chunks while the NWB file is written.
+    """
+    method = getattr(obj, method_name)
+    if getattr(method, "_span_name", None) is not None:
+        return
+
+    @wraps(method)
+    def traced(*args, **kwargs):
+        with profile_span(span_name) as counts:
+            result = method(*args, **kwargs)
+            counts.update(items=getattr(result, "size", 0), bytes=getattr(result, "nbytes", 0))
+        return result
+
+    traced._span_name = span_name
+    setattr(obj, method_name, traced)
+
+
+def load_profiles(file_paths: list):
+    profiles = []
+    for file_path in map(Path, file_paths):
+        if file_path.exists():
+            with open(file_path, "r") as io:
+                profiles.append(json.load(io))
+    return profiles
+
+
+def aggregate_profiles(profiles: list):
+    """
+    Sum the spans of the same name over the sessions of a batch.
+
+    Parameters
+    ----------
+    profiles: list
+        ConversionProfiler.to_dict() of each session
+
+    Returns
+    -------
+    dict(sessions=int, spans=list) with the summed calls, wall_time, cpu_time, items, bytes and the
+    throughput (MB/s) of each span, slowest first. The memory peaks are the maximum over the sessions.
+    """
+    spans = dict()
+    for profile in profiles:
+        for span in profile["spans"]:
+            total = spans.setdefault(
+                span["name"],
+                dict(name=span["name"], sessions=0, calls=0, wall_time=0.0, cpu_time=0.0, items=0, bytes=0),
+            )
+            total["sessions"] += 1
+            for key in ["calls", "wall_time", "cpu_time", "items", "bytes"]:
+                total[key] += span[key]
+            for key in span:
+                if key.startswith("peak_"):
+                    total[key] = max(total.get(key, 0), span[key])
+    for total in spans.values():
+        total["throughput"] = total["bytes"]/1e6/total["wall_time"] if total["wall_time"] else 0.0
+    return dict(
+        sessions=len(profiles),
+        spans=sorted(spans.values(), key=lambda total: total["wall_time"], reverse=True),
+    )
+
+
+def save_batch_profile(nwbfile_paths: list, file_path: PathType):
+    """
+    Aggregate the profiles saved next to the NWB files of a batch (see get_profile_path) into file_path.
+    """
+    batch_profile = aggregate_profiles(load_profiles(map(get_profile_path, nwbfile_paths)))
+    with open(file_path, "w") as io:
+        json.dump(batch_profile, io, indent=2)
+    return batch_profile
+
+
+def format_spans(spans: list):
+    """
+    Text table of the spans of a profile or of an aggregate, with their memory peaks in MB.
+    """
+    memory_keys = sorted({key for span in spans for key in span if key.startswith("peak_")})
+    header = ["span", "calls", "wall (s)", "cpu (s)", "MB", "MB/s"] + memory_keys
+    rows = [header]
+    for span in spans:
+        wall_time = span["wall_time"]
+        rows.append(
+            [
+                span["name"],
+                str(span["calls"]),
+                f"{wall_time:.2f}",
+                f"{span['cpu_time']:.2f}",
+                f"{span['bytes']/1e6:.1f}",
+                f"{span['bytes']/1e6/wall_time if wall_time else 0.0:.1f}",
+            ]
+            + [f"{span[key]/1e6:.1f}" if key in span else "" for key in memory_keys]
+        )
+    widths = [max(len(row[col]) for row in rows) for col in range(len(header))]
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows
+    )
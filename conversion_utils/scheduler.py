@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from time import perf_counter
+
+# memory held per streamed recording file (.nsx, .ap.bin) by the chunked writers:
+RECORDING_CHUNK_MEMORY = 512*1024**2
+# peak memory of the extraction relative to the uncompressed size of the .mat content:
+MAT_MEMORY_FACTOR = 3.0
+RECORDING_SUFFIXES = [".ns2", ".ns3", ".ns5", ".ns6", ".bin"]
+
+
+def get_total_memory():
+    return os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_PHYS_PAGES")
+
+
+def _mat_content_size(file_path: Path):
+    """
+    Uncompressed size in bytes of the datasets of a matlab v7.3 (hdf5) file from its headers only, the file
+    size for older .mat versions.
+    """
+    try:
+        import h5py
+
+        content_size = [0]
+
+        def add_size(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                content_size[0] += obj.size*obj.dtype.itemsize
+
+        with h5py.File(file_path, "r") as io:
+            io.visititems(add_size)
+        return content_size[0]
+    except (ImportError, OSError):
+        # scipy.io.loadmat files are compressed, the factor covers the expansion:
+        return file_path.stat().st_size
+
+
+def estimate_session_cost(file_paths: list):
+    """
+    Estimate the peak memory and the bytes read for converting a session from its input files.
+
+    Returns
+    -------
+    dict(memory=bytes, io_bytes=bytes)
+    """
+    memory = 0
+    io_bytes = 0
+    for file_path in map(Path, file_paths):
+        io_bytes += file_path.stat().st_size
+        if file_path.suffix == ".mat":
+            memory += MAT_MEMORY_FACTOR*_mat_content_size(file_path)
+        elif file_path.suffix in RECORDING_SUFFIXES:
+            memory += min(RECORDING_CHUNK_MEMORY, file_path.stat().st_size)
+    return dict(memory=int(memory), io_bytes=io_bytes)
+
+
+def schedule_sessions(
+    func,
+    sessions: list,
+    max_memory: int = None,
+    max_workers: int = None,
+    verbose: bool = True,
+    callback=None,
+):
+    """
+    Run func for every session in worker processes, largest estimated memory first. A session is only
+    started while the sum of the estimates of the running sessions stays within max_memory and fewer than
+    max_workers are running; smaller sessions fill the remaining budget. A session larger than the budget
+    runs alone.
+
+    Parameters
+    ----------
+    func: callable
+        picklable conversion function
+    sessions: list
+        dict(name=str, file_paths=list, args=tuple, kwargs=dict) per session, args and kwargs are passed
+        to func. A precomputed 'cost' (see estimate_session_cost) skips the estimation.
+    max_memory: int
+        memory budget in bytes, defaults to 80% of the physical memory
+    max_workers: int
+        number of worker processes, defaults to the number of cores
+    callback: callable
+        called in the parent process with the session dict and its report as each session finishes
+
+    Returns
+    -------
+    list of dict(name, memory, io_bytes, wall_time, throughput (MB/s), status, error, result (the output
+    of func, None if it failed)) in completion order
+    """
+    max_memory = int(0.8*get_total_memory()) if max_memory is None else max_memory
+    max_workers = os.cpu_count() if max_workers is None else max_workers
+    pending = []
+    for session in sessions:
+        cost = session.get("cost") or estimate_session_cost(session.get("file_paths", []))
+        pending.append(dict(session, cost=cost))
+    pending.sort(key=lambda session: session["cost"]["memory"], reverse=True)
+
+    reports = []
+    running = dict()
+    used_memory = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for session in list(pending):
+                if len(running) >= max_workers:
+                    break
+                memory = session["cost"]["memory"]
+                if running and used_memory + memory > max_memory:
+                    continue
+                future = executor.submit(
+                    func, *session.get("args", ()), **session.get("kwargs", dict())
+                )
+                running[future] = (session, perf_counter())
+                used_memory += memory
+                pending.remove(session)
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                session, start = running.pop(future)
+                used_memory -= session["cost"]["memory"]
+                wall_time = perf_counter() - start
+                error = future.exception()
+                report = dict(
+                    name=session["name"],
+                    memory=session["cost"]["memory"],
+                    io_bytes=session["cost"]["io_bytes"],
+                    wall_time=wall_time,
+                    throughput=session["cost"]["io_bytes"]/1e6/wall_time if wall_time else 0.0,
+                    status="failed" if error else "completed",
+                    error=repr(error) if error else None,
+                    result=None if error else future.result(),
+                )
+                reports.append(report)
+                if callback is not None:
+                    callback(session, report)
+                if verbose:
+                    print(
+                        f"{report['status']} {report['name']}: {wall_time:.1f} s, "
+                        f"{report['throughput']:.1f} MB/s, estimated {report['memory']/1e9:.2f} GB"
+                    )
+    return reports
@@ -0,0 +1,115 @@
+import json
+import os
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Union
+
+PathType = Union[str, Path]
+
+
+class SessionIndex:
+    """
+    Persistent listing of the directories and files (size, mtime) below a data root, so that batch drivers
+    query it instead of walking the tree with recursive globs. refresh() only lists the directories whose
+    mtime changed since the last refresh, the others cost a single stat.
+    Files rewritten in place do not change their directory mtime, their size and mtime are only updated when
+    the directory is listed again.
+    """
+
+    def __init__(self, root: PathType, index_path: PathType = None, load: bool = True):
+        self.root = Path(root)
+        self.index_path = self.root/".session_index.json" if index_path is None else Path(index_path)
+        self.dirs = dict()
+        if load and self.index_path.exists():
+            with open(self.index_path, "r") as io:
+                self.dirs = json.load(io)
+
+    def _relative(self, folder: PathType):
+        relative = Path(folder).relative_to(self.root).as_posix()
+        return "" if relative == "." else relative
+
+    def refresh(self):
+        index_files = [self.index_path.name, self.index_path.with_suffix(".tmp").name]
+        dirs = dict()
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            path = self.root/relative
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            entry = self.dirs.get(relative)
+            if entry is None or entry["mtime_ns"] != mtime_ns:
+                files = dict()
+                subdirs = []
+                with os.scandir(path) as scan:
+                    for dir_entry in scan:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            subdirs.append(dir_entry.name)
+                        elif dir_entry.is_file() and dir_entry.name not in index_files:
+                            stat = dir_entry.stat()
+                            files[dir_entry.name] = [stat.st_size, stat.st_mtime_ns]
+                entry = dict(mtime_ns=mtime_ns, files=files, dirs=sorted(subdirs))
+            dirs[relative] = entry
+            stack.extend(f"{relative}/{name}" if relative else name for name in entry["dirs"])
+        self.dirs = dirs
+        self.save()
+        return self
+
+    def save(self):
+        temp_path = self.index_path.with_suffix(".tmp")
+        with open(temp_path, "w") as io:
+            json.dump(self.dirs, io)
+        os.replace(temp_path, self.index_path)
+
+    def _dirs_below(self, folder: PathType):
+        relative = self._relative(folder)
+        prefix = f"{relative}/" if relative else ""
+        return [
+            key for key in self.dirs if key == relative or key.startswith(prefix)
+        ]
+
+    def find(self, folder: PathType, name_pattern: str):
+        """
+        Files anywhere below folder whose name matches name_pattern, like folder.glob(f"**/{name_pattern}").
+        """
+        return sorted(
+            self.root/key/name
+            for key in self._dirs_below(folder)
+            for name in self.dirs[key]["files"]
+            if fnmatch(name, name_pattern)
+        )
+
+    def subdirs(self, folder: PathType, depth: int = 1):
+        """
+        Directories exactly depth levels below folder, like folder.glob("*/"*depth).
+        """
+        relative = self._relative(folder)
+        level = relative.count("/") + 1 if relative else 0
+        return sorted(
+            self.root/key
+            for key in self._dirs_below(folder)
+            if key and key.count("/") + 1 == level + depth
+        )
+
+    def file_size(self, file_path: PathType):
+        file_path = Path(file_path)
+        return self.dirs[self._relative(file_path.parent)]["files"][file_path.name][0]
+
+    def subindex(self, folder: PathType):
+        """
+        Index limited to the entries below folder, to pass to the conversion of a single session.
+        """
+        index = SessionIndex(self.root, index_path=self.index_path, load=False)
+        index.dirs = {key: self.dirs[key] for key in self._dirs_below(folder)}
+        return index
+
+
+def find_files(folder: PathType, name_pattern: str, session_index: SessionIndex = None):
+    """
+    Files below folder matching name_pattern, from the session index if given, else by walking the folder.
+    """
+    if session_index is None:
+        return list(Path(folder).glob(f"**/{name_pattern}"))
+    return session_index.find(folder, name_pattern)
@@ -0,0 +1,200 @@
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from time import perf_counter
+from typing import Union
+
+import numpy as np
+from hdmf.data_utils import AbstractDataChunkIterator
+
+from .profiling import profile_span
+
+PathType = Union[str, Path]
+
+# h5py gzip level when the dataset does not set one:
+DEFAULT_GZIP_LEVEL = 4
+
+
+class AllocatedDataChunkIterator(AbstractDataChunkIterator):
+    """
+    Data of a dataset written later: the dataset is allocated with shape and dtype (chunked and compressed
+    as set by the H5DataIO wrapping the iterator) when the NWB file is written, without data, and its
+    chunks are streamed in afterwards with stream_compressed.
+    """
+
+    def __init__(self, shape: tuple, dtype: str):
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise StopIteration
+
+    def recommended_chunk_shape(self):
+        return None
+
+    def recommended_data_shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def maxshape(self):
+        return self._shape
+
+
+def _put(items: queue.Queue, item, stop: threading.Event):
+    # bounded queues block the producers, until the consumer failed:
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _read_chunks(
+    source, chunk_shape: tuple, read_queue: queue.Queue, stop: threading.Event, number_of_threads: int
+):
+    """
+    Put the chunks of source, in the order of the chunk grid, as (offset, full chunk shape array, bytes of
+    source data) on read_queue. The edge chunks are padded with zeros, hdf5 stores them at full size.
+    """
+    try:
+        grid = [range(0, size, chunk_size) for size, chunk_size in zip(source.shape, chunk_shape)]
+        for offset in product(*grid):
+            selection = tuple(
+                slice(start, min(start + chunk_size, size))
+                for start, chunk_size, size in zip(offset, chunk_shape, source.shape)
+            )
+            block = np.asarray(source[selection])
+            nbytes = block.nbytes
+            if block.shape != tuple(chunk_shape):
+                padded = np.zeros(chunk_shape, dtype=block.dtype)
+                padded[tuple(slice(0, size) for size in block.shape)] = block
+                block = padded
+            if not _put(read_queue, (offset, np.ascontiguousarray(block), nbytes), stop):
+                return
+    finally:
+        for _ in range(number_of_threads):
+            _put(read_queue, None, stop)
+
+
+def _compress_chunks(level: int, read_queue: queue.Queue, write_queue: queue.Queue, stop: threading.Event):
+    try:
+        while not stop.is_set():
+            try:
+                item = read_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            offset, block, nbytes = item
+            # zlib releases the GIL, the threads compress in parallel:
+            if not _put(write_queue, (offset, nbytes, zlib.compress(block.data, level)), stop):
+                return
+    finally:
+        _put(write_queue, None, stop)
+
+
+def stream_compressed(source, dataset, number_of_threads: int = 4, queue_size: int = None):
+    """
+    Fill a chunked, gzip compressed h5py dataset with source (an array or a memmap of the same shape), in
+    three stages connected by bounded queues: a thread reads the chunks of source, number_of_threads
+    threads compress them and the calling thread writes the compressed chunks to the file as they are
+    (write_direct_chunk), without going through the hdf5 filter pipeline.
+
+    Parameters
+    ----------
+    source: np.ndarray
+        frames x channels, a memmap of a .bin recording is read one chunk at a time
+    dataset: h5py.Dataset
+        allocated in a file opened for writing, gzip compressed without shuffle or fletcher32 filters. Its
+        chunk shape sets the size of the blocks read and compressed.
+    number_of_threads: int
+        compressing threads
+    queue_size: int
+        chunks held in each queue, twice number_of_threads if None. Bounds the memory in use to about
+        2*queue_size chunks.
+
+    Returns
+    -------
+    dict(bytes (of source data, without the padding of the edge chunks), compressed_bytes, chunks, threads,
+    wall_time, throughput (MB/s of source data))
+    """
+    assert tuple(source.shape) == dataset.shape, f"source shape {source.shape} is not {dataset.shape}"
+    assert dataset.chunks is not None, "the dataset should be chunked"
+    assert dataset.compression == "gzip", "only gzip compressed datasets can be streamed"
+    assert not dataset.shuffle and not dataset.fletcher32, "shuffle and fletcher32 filters are not supported"
+    level = DEFAULT_GZIP_LEVEL if dataset.compression_opts is None else dataset.compression_opts
+    queue_size = 2*number_of_threads if queue_size is None else queue_size
+    read_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    stats = dict(bytes=0, compressed_bytes=0, chunks=0, threads=number_of_threads)
+    start = perf_counter()
+    with profile_span("stream") as span_counts:
+        with ThreadPoolExecutor(max_workers=number_of_threads + 1) as executor:
+            futures = [
+                executor.submit(_read_chunks, source, dataset.chunks, read_queue, stop, number_of_threads)
+            ]
+            futures += [
+                executor.submit(_compress_chunks, level, read_queue, write_queue, stop)
+                for _ in range(number_of_threads)
+            ]
+            try:
+                finished = 0
+                while finished < number_of_threads:
+                    try:
+                        item = write_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        failed = [future for future in futures if future.done() and future.exception()]
+                        if failed:
+                            raise failed[0].exception()
+                        continue
+                    if item is None:
+                        finished += 1
+                        continue
+                    offset, nbytes, compressed = item
+                    dataset.id.write_direct_chunk(offset, compressed)
+                    stats["bytes"] += nbytes
+                    stats["compressed_bytes"] += len(compressed)
+                    stats["chunks"] += 1
+            finally:
+                stop.set()
+            for future in futures:
+                future.result()
+        span_counts.update(items=stats["chunks"], bytes=stats["bytes"])
+    stats["wall_time"] = perf_counter() - start
+    stats["throughput"] = stats["bytes"]/1e6/stats["wall_time"] if stats["wall_time"] else 0.0
+    return stats
+
+
+def get_binary_memmap(file_path: PathType, num_channels: int, dtype: str = "int16"):
+    """
+    frames x num_channels memmap of a flat binary recording (SpikeGLX .bin).
+    """
+    return np.memmap(file_path, dtype=dtype, mode="r").reshape(-1, num_channels)
+
+
+def stream_to_nwbfile(
+    nwbfile_path: PathType, dataset_path: str, source, number_of_threads: int = 4, queue_size: int = None
+):
+    """
+    stream_compressed source to the dataset_path dataset of an hdf5 NWB file, allocated when it was
+    written (see AllocatedDataChunkIterator).
+    """
+    import h5py
+
+    with h5py.File(nwbfile_path, "r+") as file:
+        return stream_compressed(
+            source, file[dataset_path], number_of_threads=number_of_threads, queue_size=queue_size
+        )
@@ -3,11 +3,13 @@ from datetime import datetime
 
 from nwb_conversion_tools import NWBConverter
 
+from conversion_utils.estimator import EstimateConversionMixin
+
 from .shenoyblackrockrecordingdatainterface import ShenoyBlackRockRecordingDataInterface
 from .shenoymatdatainterface import ShenoyMatDataInterface
 
 
-class ChurchlandNWBConverter(NWBConverter):
+class ChurchlandNWBConverter(EstimateConversionMixin, NWBConverter):
     data_interface_classes = dict(
         A1=ShenoyBlackRockRecordingDataInterface,
         B1=ShenoyBlackRockRecordingDataInterface,
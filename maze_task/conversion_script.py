@@ -3,10 +3,38 @@ from pathlib import Path
 
 import pytz
 
-from .churchlandnwbconverter import ChurchlandNWBConverter
+from conversion_utils.backends import get_backend_path, run_conversion
+from conversion_utils.estimator import format_estimate
+from conversion_utils.manifest import run_resumable
+from conversion_utils.profiling import (
+    ConversionProfiler,
+    format_spans,
+    get_profile_path,
+    profile_span,
+    profiling,
+    save_batch_profile,
+)
+from conversion_utils.session_index import SessionIndex, find_files
 
 
-def convert(source_folder):
+def get_nwbfile_path(source_folder, backend: str = "hdf5"):
+    return get_backend_path(source_folder/f"{source_folder.name}_nwb_vlatest.nwb", backend)
+
+
+def convert(
+    source_folder,
+    identifier: str = None,
+    session_index: SessionIndex = None,
+    trace_allocations: bool = False,
+    dry_run: bool = False,
+    backend: str = "hdf5",
+    cache_dir: str = None,
+    checkpointed: bool = False,
+):
+    # imported here, importing this module (in the batch workers too) does not load pynwb and
+    # nwb_conversion_tools before a conversion needs them:
+    from .churchlandnwbconverter import ChurchlandNWBConverter
+
     # retrieve the correct files from source path:
     nsx_file_names = [
         "datafileA001.ns2",
@@ -18,7 +46,7 @@ def convert(source_folder):
         "datafileA004.ns2",
         "datafileB004.ns2",
     ]
-    nsx_files = list(source_folder.glob("**/*.ns2"))
+    nsx_files = find_files(source_folder, "*.ns2", session_index)
     assert (
                    len(nsx_files)%2
            ) == 0, f"at least 2* ns2 files need to be present: {nsx_file_names}"
@@ -26,7 +54,7 @@ def convert(source_folder):
         [i.name in nsx_file_names for i in nsx_files]
     ), f"one of {nsx_file_names} missing"
     nsx_list = [str(i.with_name(nsx_file_names[no])) for no, i in enumerate(nsx_files)]
-    mat_file = str(list(source_folder.glob("**/R*.mat"))[0])
+    mat_file = str(find_files(source_folder, "R*.mat", session_index)[0])
     subject_name = source_folder.parent.parent.name
 
     # construct argument for nwbconverter based on schema:
@@ -41,26 +69,79 @@ def convert(source_folder):
     for no, filename in enumerate(nsx_list):
         source_data.update({arg_names[no]: dict(filename=filename)})
 
-    ch = ChurchlandNWBConverter(source_data)
-    nwbfile_saveloc = source_folder/f"{source_folder.name}_nwb_vlatest.nwb"
     conversion_options = {
         arg_names[no]: dict(es_key=f"ElectricalSeries{Path(i).stem[-4:]}")
         for no, i in enumerate(nsx_list)
     }
+    if cache_dir is not None:
+        # data extracted from the .mat file is cached there for faster reconversions:
+        conversion_options.update(Mat=dict(cache_dir=str(cache_dir)))
+    if dry_run:
+        # predicted output size, peak memory and wall time only:
+        estimate = ChurchlandNWBConverter.estimate_conversion(source_data, conversion_options)
+        print(format_estimate(estimate))
+        return estimate
 
-    print("running conversion to nwb...")
-    ch.run_conversion(
-        metadata=ch.get_metadata(),
-        nwbfile_path=str(nwbfile_saveloc),
-        overwrite=True,
-        conversion_options=conversion_options,
+    profiler = ConversionProfiler(
+        source_folder.name, trace_allocations=trace_allocations, poll_rss=True
     )
+    # the source files are read when the data interfaces are created:
+    with profiling(profiler), profile_span("initialization"):
+        ch = ChurchlandNWBConverter(source_data)
+    nwbfile_saveloc = get_nwbfile_path(source_folder, backend=backend)
+
+    print("running conversion to nwb...")
+    metadata = ch.get_metadata()
+    if identifier is not None:
+        metadata["NWBFile"].update(identifier=identifier)
+    with profiling(profiler), profile_span("conversion"):
+        # backend 'zarr' writes a .nwb.zarr store:
+        run_conversion(
+            ch,
+            nwbfile_saveloc,
+            metadata,
+            conversion_options,
+            backend=backend,
+            # a crashed conversion resumes from the first data interface not written:
+            checkpointed=checkpointed,
+        )
+    profiler.save(get_profile_path(nwbfile_saveloc))
+    print(format_spans(profiler.to_dict()["spans"]))
     print(f"converted for {source_folder}")
+    return profiler.to_dict()
 
 
-if __name__ == "__main__":
+def main():
     source_folder = Path(
         r"C:\Users\Saksham\Documents\NWB\shenoy\data\Nitschke\spikesorted"
     )
-    for no, folder in enumerate(source_folder.iterdir()):
-        convert(folder)
+    # one session at a time, skipping the sessions converted before with the same inputs:
+    session_index = SessionIndex(source_folder).refresh()
+    sessions = [
+        dict(
+            name=folder.name,
+            args=(folder,),
+            kwargs=dict(session_index=session_index.subindex(folder)),
+            options=dict(),
+            file_paths=session_index.find(folder, "*.ns2")
+                       + session_index.find(folder, "R*.mat"),
+            output_path=get_nwbfile_path(folder),
+        )
+        for folder in session_index.subdirs(source_folder)
+    ]
+    run_resumable(
+        convert,
+        sessions,
+        manifest_path=source_folder/"conversion_manifest.json",
+        content_identifier=True,
+        max_workers=1,
+    )
+    # stage timings summed over the sessions:
+    save_batch_profile(
+        [session["output_path"] for session in sessions],
+        source_folder/"conversion_profile.json",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 from pathlib import Path
 
 import numpy as np
-import scipy.io as scio
 
 
 class MatDataExtractor:
+    # increase whenever the extracted data changes, to invalidate the extraction caches:
+    EXTRACTOR_VERSION = 1
+
     def __init__(self, input_dir, monkey_name="J"):
+        import scipy.io as scio
+
         self.monkey_name = monkey_name
         path_r_file = Path(input_dir)
         rfile = scio.loadmat(str(path_r_file))
@@ -3,6 +3,8 @@ from typing import Union
 
 from nwb_conversion_tools import BlackrockRecordingExtractorInterface
 
+from conversion_utils.profiling import profile_span, trace_method
+
 PathType = Union[str, Path]
 
 
@@ -28,6 +30,24 @@ class ShenoyBlackRockRecordingDataInterface(BlackrockRecordingExtractorInterface
                 chan_id, "brain_area", self._region
             )
 
+    @staticmethod
+    def get_channel_id_offset(source_data: dict):
+        """
+        Offset of the channel ids of the interface over the electrode ids of the nsx file: the channels of
+        array B follow the ones of array A. Used by conversion_utils.estimator.estimate_conversion.
+        """
+        return 96 if "B" in Path(source_data["filename"]).name else 0
+
+    def run_conversion(self, nwbfile, metadata, **kwargs):
+        """
+        The traces read while the file is written are counted in the '<segment>/read' span, within the span
+        of the segment.
+        """
+        span_name = f"segment {self.nsx_loc.stem[-4:]}"
+        trace_method(self.recording_extractor, "get_traces", f"{span_name}/read")
+        with profile_span(span_name):
+            return super().run_conversion(nwbfile, metadata, **kwargs)
+
     def get_metadata_schema(self):
         metadata_schema = super(
             ShenoyBlackRockRecordingDataInterface, self
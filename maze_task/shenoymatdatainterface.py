@@ -6,6 +6,9 @@ from nwb_conversion_tools.basedatainterface import BaseDataInterface
 from pynwb import NWBFile
 from pynwb.behavior import Position
 
+from conversion_utils.extraction_cache import cached_extraction
+from conversion_utils.profiling import get_nbytes, profile_span
+
 from .matextractor import MatDataExtractor
 
 PathType = Union[str, Path]
@@ -17,7 +20,15 @@ class ShenoyMatDataInterface(BaseDataInterface):
         self.file_path = Path(filename)
         assert self.file_path.suffix == ".mat", "file_path should be a .mat"
         assert self.file_path.exists(), "file_path does not exist"
-        self.mat_extractor = MatDataExtractor(self.file_path, monkey_name=subject_name)
+        self.subject_name = subject_name
+        self._mat_extractor = None
+
+    @property
+    def mat_extractor(self):
+        # the .mat file is loaded on first use, not at all when its data is read from the extraction cache:
+        if self._mat_extractor is None:
+            self._mat_extractor = MatDataExtractor(self.file_path, monkey_name=self.subject_name)
+        return self._mat_extractor
 
     def _extract_channel_spike_times(self):
         trial_spike_times = self.mat_extractor.extract_unit_spike_times()
@@ -36,67 +47,113 @@ class ShenoyMatDataInterface(BaseDataInterface):
             unit_spike_times.append(np.array(channel_ts))
         return unit_spike_times, trial_times
 
-    def run_conversion(self, nwbfile: NWBFile, metadata: dict, **kwargs):
-        assert isinstance(nwbfile, NWBFile), "'nwbfile' should be of type pynwb.NWBFile"
+    def _extract(self):
+        """
+        Behavior, trial columns and channel spike times read from the .mat file.
+        """
         (
             eye_positions,
             hand_positions,
             cursor_positions,
         ) = self.mat_extractor.extract_behavioral_position()
-        eye_data = np.concatenate(eye_positions, axis=0)
-        cursor_data = np.concatenate(cursor_positions, axis=0)
-        hand_data = np.concatenate(hand_positions, axis=0)
-        trial_events = self.mat_extractor.extract_trial_events()
-        trial_details = self.mat_extractor.extract_trial_details()
-        maze_details = self.mat_extractor.extract_maze_data()
-        unit_lookup = self.mat_extractor.SU["unitLookup"][0, 0][:, 0]
-        array_lookup = self.mat_extractor.SU["arrayLookup"][0, 0][:, 0]
         unit_spike_times, trial_times = self._extract_channel_spike_times()
-        # add behavior:
-        beh_mod = nwbfile.create_processing_module(
-            "behavior", "contains monkey movement data"
+        return dict(
+            eye_data=np.concatenate(eye_positions, axis=0),
+            cursor_data=np.concatenate(cursor_positions, axis=0),
+            hand_data=np.concatenate(hand_positions, axis=0),
+            trial_events=self.mat_extractor.extract_trial_events(),
+            trial_details=self.mat_extractor.extract_trial_details(),
+            maze_details=self.mat_extractor.extract_maze_data(),
+            unit_lookup=self.mat_extractor.SU["unitLookup"][0, 0][:, 0],
+            array_lookup=self.mat_extractor.SU["arrayLookup"][0, 0][:, 0],
+            unit_spike_times=unit_spike_times,
+            trial_times=trial_times,
         )
-        position_container = Position()
-        spatial_series_list = []
-        for name, data in zip(
-                ["Eye", "Hand", "Cursor"], [eye_data, hand_data, cursor_data]
+
+    def run_conversion(self, nwbfile: NWBFile, metadata: dict, cache_dir: str = None, **kwargs):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            folder of the extraction cache (see conversion_utils.extraction_cache), the .mat file is only
+            loaded if it changed since its data was cached. No caching if None.
+        """
+        assert isinstance(nwbfile, NWBFile), "'nwbfile' should be of type pynwb.NWBFile"
+        with profile_span("extraction"):
+            data = cached_extraction(
+                cache_dir,
+                self.file_path,
+                MatDataExtractor,
+                self._extract,
+                options=dict(subject_name=self.subject_name),
+            )
+        eye_data, cursor_data, hand_data = data["eye_data"], data["cursor_data"], data["hand_data"]
+        trial_events = data["trial_events"]
+        trial_details = data["trial_details"]
+        maze_details = data["maze_details"]
+        unit_lookup, array_lookup = data["unit_lookup"], data["array_lookup"]
+        unit_spike_times, trial_times = data["unit_spike_times"], data["trial_times"]
+        # add behavior:
+        with profile_span(
+                "behavior",
+                items=len(eye_data) + len(hand_data) + len(cursor_data),
+                bytes=eye_data.nbytes + hand_data.nbytes + cursor_data.nbytes,
         ):
-            spatial_series_list.append(
-                position_container.create_spatial_series(
-                    name=name,
-                    data=data[:, :2],
-                    timestamps=data[:, 2],
-                    reference_frame="screen center",
-                    conversion=np.nan,
-                )
+            beh_mod = nwbfile.create_processing_module(
+                "behavior", "contains monkey movement data"
             )
-        beh_mod.add(position_container)
+            position_container = Position()
+            spatial_series_list = []
+            for name, data in zip(
+                    ["Eye", "Hand", "Cursor"], [eye_data, hand_data, cursor_data]
+            ):
+                spatial_series_list.append(
+                    position_container.create_spatial_series(
+                        name=name,
+                        data=data[:, :2],
+                        timestamps=data[:, 2],
+                        reference_frame="screen center",
+                        conversion=np.nan,
+                    )
+                )
+            beh_mod.add(position_container)
         # add trials:
-        for col_details in trial_events + trial_details + maze_details:
-            col_det = {i: col_details[i] for i in col_details if "data" not in i}
-            nwbfile.add_trial_column(**col_det)
-        for trial_no in range(trial_times.shape[0]):
-            col_details_dict = {
-                i["name"]: i["data"][trial_no]
-                for i in trial_events + trial_details + maze_details
-            }
-            col_details_dict.update(
-                start_time=trial_times[trial_no, 0],
-                stop_time=trial_times[trial_no, 1],
-                timeseries=spatial_series_list,
-            )
-            nwbfile.add_trial(**col_details_dict)
+        with profile_span(
+                "trials",
+                items=trial_times.shape[0],
+                bytes=get_nbytes([i["data"] for i in trial_events + trial_details + maze_details])
+                + trial_times.nbytes,
+        ):
+            for col_details in trial_events + trial_details + maze_details:
+                col_det = {i: col_details[i] for i in col_details if "data" not in i}
+                nwbfile.add_trial_column(**col_det)
+            for trial_no in range(trial_times.shape[0]):
+                col_details_dict = {
+                    i["name"]: i["data"][trial_no]
+                    for i in trial_events + trial_details + maze_details
+                }
+                col_details_dict.update(
+                    start_time=trial_times[trial_no, 0],
+                    stop_time=trial_times[trial_no, 1],
+                    timeseries=spatial_series_list,
+                )
+                nwbfile.add_trial(**col_details_dict)
         # add units:
-        unit_lookup_corrected = [
-            list(np.array([ch_id - 1]) + 96) if array_lookup[no] == 2 else [ch_id - 1]
-            for no, ch_id in enumerate(unit_lookup)
-        ]
-        for unit_no in range(len(unit_spike_times)):
-            nwbfile.add_unit(
-                spike_times=unit_spike_times[unit_no],
-                electrodes=unit_lookup_corrected[unit_no],
-                electrode_group=list(nwbfile.electrode_groups.values())[
-                    array_lookup[unit_no] - 1
-                    ],
-                obs_intervals=trial_times,
-            )
+        with profile_span(
+                "units",
+                items=sum(len(unit_sp_times) for unit_sp_times in unit_spike_times),
+                bytes=get_nbytes(unit_spike_times),
+        ):
+            unit_lookup_corrected = [
+                list(np.array([ch_id - 1]) + 96) if array_lookup[no] == 2 else [ch_id - 1]
+                for no, ch_id in enumerate(unit_lookup)
+            ]
+            for unit_no in range(len(unit_spike_times)):
+                nwbfile.add_unit(
+                    spike_times=unit_spike_times[unit_no],
+                    electrodes=unit_lookup_corrected[unit_no],
+                    electrode_group=list(nwbfile.electrode_groups.values())[
+                        array_lookup[unit_no] - 1
+                        ],
+                    obs_intervals=trial_times,
+                )
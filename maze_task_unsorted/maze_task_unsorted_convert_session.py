@@ -1,10 +1,22 @@
-from neuroconv.utils import FolderPathType, FilePathType, load_dict_from_file, dict_deep_update
 from pathlib import Path
 import shutil
+from typing import Union
 from pytz import timezone
 from datetime import datetime
 
-from maze_task_unsorted.maze_task_unsorted_nwbconverter import MazeTaskUnsortedNWBConverter
+from conversion_utils.backends import get_backend_path, run_conversion
+from conversion_utils.estimator import format_estimate
+from conversion_utils.profiling import (
+    ConversionProfiler,
+    format_spans,
+    get_profile_path,
+    profile_span,
+    profiling,
+)
+
+# neuroconv.utils.FolderPathType and FilePathType, without importing neuroconv with this module:
+FolderPathType = Union[str, Path]
+FilePathType = Union[str, Path]
 
 def session_to_nwb(
     *,
@@ -13,7 +25,17 @@ def session_to_nwb(
     datafile_names: list[FilePathType],
     matfile_name: FilePathType,
     verbose: bool = True,
+    identifier: str = None,
+    trace_allocations: bool = False,
+    dry_run: bool = False,
+    backend: str = "hdf5",
+    cache_dir: FolderPathType = None,
 ):
+    # imported here, importing this module does not load pynwb and neuroconv before a conversion needs them:
+    from neuroconv.utils import load_dict_from_file, dict_deep_update
+
+    from maze_task_unsorted.maze_task_unsorted_nwbconverter import MazeTaskUnsortedNWBConverter
+
     data_dir_path = Path(data_dir_path)
     output_dir_path = Path(output_dir_path)
     output_dir_path.mkdir(parents=True, exist_ok=True)
@@ -26,8 +48,23 @@ def session_to_nwb(
         source_data[datainterface_key] = dict(file_path=file_path, es_key=es_key)
         conversion_options[datainterface_key] = dict(write_as="processed")
     source_data["Mat"] = dict(filename=data_dir_path / matfile_name, subject_name="N")
+    if cache_dir is not None:
+        # data extracted from the .mat file is cached there for faster reconversions:
+        conversion_options["Mat"] = dict(cache_dir=str(cache_dir))
 
-    converter = MazeTaskUnsortedNWBConverter(source_data=source_data)
+    if dry_run:
+        # predicted output size, peak memory and wall time only:
+        estimate = MazeTaskUnsortedNWBConverter.estimate_conversion(source_data, conversion_options)
+        if verbose:
+            print(format_estimate(estimate))
+        return estimate
+
+    profiler = ConversionProfiler(
+        data_dir_path.name, trace_allocations=trace_allocations, poll_rss=True
+    )
+    # the source files are read when the data interfaces are created:
+    with profiling(profiler), profile_span("initialization"):
+        converter = MazeTaskUnsortedNWBConverter(source_data=source_data)
     metadata = converter.get_metadata()
 
     editable_metadata_path = Path(__file__).parent / "maze_task_unsorted_metadata.yaml"
@@ -38,14 +75,24 @@ def session_to_nwb(
     metadata["NWBFile"]["session_start_time"] = datetime.strptime(data_dir_path.name, "%Y-%m-%d").replace(tzinfo=pst)
     metadata["NWBFile"]["session_id"] = metadata["NWBFile"]["session_start_time"].strftime("%Y%m%d")
     metadata["Subject"]["date_of_birth"] = datetime.datetime(2005, 4, 14, tzinfo=pst)
+    if identifier is not None:
+        metadata["NWBFile"]["identifier"] = identifier
 
-    nwbfile_path = output_dir_path / f"{data_dir_path.name}.nwb"
+    nwbfile_path = get_backend_path(output_dir_path / f"{data_dir_path.name}.nwb", backend)
 
-    converter.run_conversion(
-        metadata=metadata,
-        nwbfile_path=nwbfile_path,
-        conversion_options=conversion_options,
-    )
+    with profiling(profiler), profile_span("conversion"):
+        # backend 'zarr' writes a .nwb.zarr store:
+        run_conversion(
+            converter,
+            nwbfile_path,
+            metadata,
+            conversion_options,
+            backend=backend,
+        )
+    profiler.save(get_profile_path(nwbfile_path))
+    if verbose:
+        print(format_spans(profiler.to_dict()["spans"]))
+    return profiler.to_dict()
 
 def main():
     data_dir_path = Path("/Volumes/T7/CatalystNeuro/NWB/Shenoy/2010-09-23")
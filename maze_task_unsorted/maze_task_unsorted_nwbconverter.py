@@ -1,8 +1,10 @@
 from neuroconv import NWBConverter
+
+from conversion_utils.estimator import EstimateConversionMixin
 from .shenoyblackrockrecordingdatainterface import ShenoyBlackrockRecordingInterface
 from .shenoymatdatainterface import ShenoyMatDataInterface
 
-class MazeTaskUnsortedNWBConverter(NWBConverter):
+class MazeTaskUnsortedNWBConverter(EstimateConversionMixin, NWBConverter):
     data_interface_classes = dict(
         A1=ShenoyBlackrockRecordingInterface,
         B1=ShenoyBlackrockRecordingInterface,
@@ -15,4 +17,4 @@ class MazeTaskUnsortedNWBConverter(NWBConverter):
         A5=ShenoyBlackrockRecordingInterface,
         B5=ShenoyBlackrockRecordingInterface,
         Mat=ShenoyMatDataInterface,
-    )
\ No newline at end of file
+    )
@@ -1,8 +1,12 @@
+from pathlib import Path
+
 from neuroconv.datainterfaces import BlackrockRecordingInterface
 from spikeinterface.extractors import BlackrockRecordingExtractor
 from neuroconv.utils import FilePathType
 import numpy as np
 
+from conversion_utils.profiling import profile_span, trace_method
+
 class ShenoyBlackrockRecordingInterface(BlackrockRecordingInterface):
     Extractor = BlackrockRecordingExtractor
 
@@ -21,6 +25,24 @@ class ShenoyBlackrockRecordingInterface(BlackrockRecordingInterface):
         self.recording_extractor.set_property("brain_area", [self._region]*96)
         self.recording_extractor.set_property("channel_name", [f"chan{i}" for i in self.recording_extractor.channel_ids])
 
+    @staticmethod
+    def get_channel_id_offset(source_data: dict):
+        """
+        Offset of the channel ids of the interface over the electrode ids of the nsx file: the channels of
+        array B follow the ones of array A. Used by conversion_utils.estimator.estimate_conversion.
+        """
+        return 96 if "B" in Path(source_data["file_path"]).name else 0
+
+    def add_to_nwbfile(self, nwbfile, metadata, **conversion_options):
+        """
+        The traces read while the file is written are counted in the '<segment>/read' span, within the span
+        of the segment.
+        """
+        span_name = f"segment {self.es_key}"
+        trace_method(self.recording_extractor, "get_traces", f"{span_name}/read")
+        with profile_span(span_name):
+            return super().add_to_nwbfile(nwbfile, metadata, **conversion_options)
+
     def get_metadata(self):
         metadata = super().get_metadata()
 
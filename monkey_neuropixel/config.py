@@ -0,0 +1,38 @@
+import copy
+
+from conversion_utils.config import load_yaml
+
+from . import brain_location_path, metadata_location_path, session_list_location_path
+
+DEFAULT_BRAIN_LOCATION = "PMd"
+
+
+def _compile_brain_locations(brain_location_map: dict):
+    # session names as str, yaml reads names of digits only as int:
+    return {str(session_name): location for session_name, location in (brain_location_map or dict()).items()}
+
+
+def load_metadata_default():
+    """
+    Default experiment metadata of data/metadata.yaml, a copy the callers can update.
+    """
+    return copy.deepcopy(load_yaml(metadata_location_path))
+
+
+def load_session_names():
+    """
+    Names of the sessions to convert, the 'session_names' list of data/session_names.yaml.
+    """
+    session_names = load_yaml(session_list_location_path)
+    if isinstance(session_names, dict):
+        session_names = session_names.get("session_names") or []
+    return [str(session_name) for session_name in session_names]
+
+
+def get_brain_location(session_name: str):
+    """
+    Recorded brain area of a session from data/brain_location_map.yaml, PMd for the sessions not listed.
+    """
+    return load_yaml(brain_location_path, compile=_compile_brain_locations).get(
+        str(session_name), DEFAULT_BRAIN_LOCATION
+    )
@@ -1,88 +1,191 @@
 from pathlib import Path
 
-import yaml
-from nwb_conversion_tools.utils.json_schema import dict_deep_update
+from conversion_utils.backends import get_backend_path, run_conversion
+from conversion_utils.estimator import format_estimate
+from conversion_utils.manifest import run_resumable
+from conversion_utils.profiling import (
+    ConversionProfiler,
+    format_spans,
+    get_profile_path,
+    profile_span,
+    profiling,
+    save_batch_profile,
+)
 
-# retrieve default experiment metadata and sessions list (can be changed in the yaml file):
-from . import metadata_location_path, session_list_location_path
-from .converter import NpxNWBConverter
+# default experiment metadata and sessions list (can be changed in the yaml files), parsed once per process:
+from .config import load_metadata_default, load_session_names
 
-with open(str(metadata_location_path), "r") as io:
-    metadata_default = yaml.load(io, Loader=yaml.FullLoader)
+data_path = Path(r"/mnt/scrap/catalyst_neuro/sakshamsharda/shenoy/PrimateNeuropixel")
 
-## 1. Run a single session conversion:
-mat_path = Path(
-    r"/mnt/scrap/catalyst_neuro/sakshamsharda/shenoy/PrimateNeuropixel/P20180323/P20180323.behavior.mat"
-)
-sglx_path = Path(
-    r"/mnt/scrap/catalyst_neuro/sakshamsharda/shenoy/PrimateNeuropixel/P20180323/P20180323_g0_t0.imec0.ap.bin"
-)
-converter_args = dict(
-    Mat=dict(filename=str(mat_path)), Sgx=dict(file_path=str(sglx_path))
-)
-# create NWBConverter class:
-mt = NpxNWBConverter(converter_args)
-
-# get and update metadata to go with the NWB file
-metadata = mt.get_metadata()
-metadata = dict_deep_update(metadata, metadata_default)
-stub = True
-conversion_options = dict(
-    Sgx=dict(stub_test=stub)
-)  # specify this as True if testing a conversion
-nwb_path_append = "_stub" if stub else ""
-nwbname = mat_path.parent/f"{mat_path.stem}_stub.nwb"
-mt.run_conversion(
-    nwbfile_path=str(nwbname),
-    overwrite=True,
-    metadata=metadata,
-    conversion_options=conversion_options,
-)
 
-## 2. Convert multiple sessions using parallelization:
+def get_session_paths(session_names_list: list):
+    """
+    .behavior.mat and .ap.bin files of the sessions in data_path that hold both.
+    """
+    mat_pt_list = []
+    bin_pt_list = []
+    for name in session_names_list:
+        mat_pt = data_path/name/f"{name}.behavior.mat"
+        bin_pt = data_path/name/f"{name}_g0_t0.imec0.ap.bin"
+        if mat_pt.exists() and bin_pt.exists():
+            mat_pt_list.append(mat_pt)
+            bin_pt_list.append(bin_pt)
+    return mat_pt_list, bin_pt_list
 
-from .converter import NpxNWBConverter
-from pathlib import Path
-from joblib import Parallel, delayed
-import yaml
-
-with open(str(session_list_location_path), "r") as io:
-    session_names_list = yaml.load(io, Loader=yaml.FullLoader)
-mat_pt_list = []
-bin_pt_list = []
-for name in session_names_list:
-    mat_pt = Path(
-        fr"/mnt/scrap/catalyst_neuro/sakshamsharda/shenoy/PrimateNeuropixel/{name}/{name}.behavior.mat"
-    )
-    bin_pt = Path(
-        fr"/mnt/scrap/catalyst_neuro/sakshamsharda/shenoy/PrimateNeuropixel/{name}/{name}_g0_t0.imec0.ap.bin"
+
+def get_nwbfile_path(bin_pt, stub, backend="hdf5"):
+    nwb_path_append = "_stub" if stub else ""
+    return get_backend_path(
+        bin_pt.parent/Path(bin_pt.name.split(".")[0] + f"{nwb_path_append}.nwb"), backend
     )
-    if mat_pt.exists() and bin_pt.exists():
-        mat_pt_list.append(mat_pt)
-        bin_pt_list.append(bin_pt)
 
 
-def converter(mat_pt, bin_pt):
+def converter(
+    mat_pt,
+    bin_pt,
+    stub=True,
+    identifier=None,
+    trace_allocations=False,
+    dry_run=False,
+    backend="hdf5",
+    cache_dir=None,
+    checkpointed=False,
+    extraction_jobs=1,
+    compress_waveforms=False,
+    trial_range=None,
+    compression_threads=None,
+):
+    """
+    trial_range: [start, stop) trials to convert, a stub of the session holding the behavior, trials and
+    spikes of these trials and the matching sample window of the .ap.bin recording, in place of the
+    stub_test recording stub. Dry runs count the recording in full.
+    compression_threads: threads compressing the AP data streamed to the NWB file once it is written, see
+    ShenoySpikeGLXRecordingInterface.add_streamed_series. The AP data is written with the file if None.
+    """
+    # imported here, importing this module (in the batch workers too) does not load pynwb and
+    # nwb_conversion_tools before a conversion needs them:
+    from nwb_conversion_tools.utils.json_schema import dict_deep_update
+
+    from .converter import NpxNWBConverter
+
     arg = dict(Mat=dict(filename=str(mat_pt)), Sgx=dict(file_path=str(bin_pt)))
-    nc = NpxNWBConverter(arg)
+    stub_test = stub and trial_range is None
+    stub = stub or trial_range is not None
+    if dry_run:
+        # predicted output size, peak memory and wall time only:
+        estimate = NpxNWBConverter.estimate_conversion(arg, dict(Sgx=dict(stub_test=stub_test)))
+        print(format_estimate(estimate))
+        return estimate
+    profiler = ConversionProfiler(
+        mat_pt.name.split(".")[0], trace_allocations=trace_allocations, poll_rss=True
+    )
+    # the source files are read when the data interfaces are created:
+    with profiling(profiler), profile_span("initialization"):
+        nc = NpxNWBConverter(arg)
     metadata = nc.get_metadata()
-    metadata = dict_deep_update(metadata, metadata_default)
+    metadata = dict_deep_update(metadata, load_metadata_default())
+    if identifier is not None:
+        metadata["NWBFile"].update(identifier=identifier)
+    nwb_pt = get_nwbfile_path(bin_pt, stub, backend=backend)
+    # the spike times of the .mat file are read by extraction_jobs processes, compress_waveforms writes the
+    # unit waveform templates as compressed float32:
+    assert backend == "hdf5" or not compress_waveforms, "only hdf5 conversions compress the waveforms"
+    conversion_options = dict(
+        Sgx=dict(stub_test=stub_test),
+        Mat=dict(number_of_jobs=extraction_jobs, compress_waveforms=compress_waveforms),
+    )
+    if trial_range is not None:
+        conversion_options["Sgx"].update(
+            frame_range=nc.data_interface_objects["Mat"].get_frame_range(trial_range)
+        )
+        conversion_options["Mat"].update(trial_range=list(trial_range))
+    if compression_threads is not None:
+        assert backend == "hdf5", "only hdf5 conversions stream the AP data"
+        assert not stub_test, "stub_test recordings cannot be streamed, use a trial_range or stub=False"
+        conversion_options["Sgx"].update(compression_threads=compression_threads)
+    if cache_dir is not None:
+        # data extracted from the .mat file is cached there for faster reconversions:
+        conversion_options["Mat"].update(cache_dir=str(cache_dir))
+    with profiling(profiler), profile_span("conversion"):
+        # backend 'zarr' writes a .nwb.zarr store:
+        run_conversion(
+            nc,
+            nwb_pt,
+            metadata,
+            conversion_options,
+            backend=backend,
+            # a crashed conversion resumes from the first data interface not written:
+            checkpointed=checkpointed,
+        )
+    profiler.save(get_profile_path(nwb_pt))
+    print(format_spans(profiler.to_dict()["spans"]))
+    print(
+        f'**************************conversion run for {mat_pt.name.split(".")[0]}............................'
+    )
+    return profiler.to_dict()
+
+
+def main(manifest_path=None):
+    """
+    manifest_path: record of the batch conversions (see conversion_utils.manifest.run_resumable), defaults
+    to data_path/conversion_manifest.json
+    """
+    from nwb_conversion_tools.utils.json_schema import dict_deep_update
+
+    from .converter import NpxNWBConverter
+
+    ## 1. Run a single session conversion:
+    mat_path = data_path/"P20180323/P20180323.behavior.mat"
+    sglx_path = data_path/"P20180323/P20180323_g0_t0.imec0.ap.bin"
+    converter_args = dict(
+        Mat=dict(filename=str(mat_path)), Sgx=dict(file_path=str(sglx_path))
+    )
+    # create NWBConverter class:
+    mt = NpxNWBConverter(converter_args)
+
+    # get and update metadata to go with the NWB file
+    metadata = mt.get_metadata()
+    metadata = dict_deep_update(metadata, load_metadata_default())
     stub = True
-    nwb_path_append = "_stub" if stub else ""
-    nwb_pt = bin_pt.parent/Path(bin_pt.name.split(".")[0] + f"{nwb_path_append}.nwb")
-    conversion_options = dict(Sgx=dict(stub_test=stub))
-    nc.run_conversion(
-        nwbfile_path=str(nwb_pt),
+    conversion_options = dict(
+        Sgx=dict(stub_test=stub)
+    )  # specify this as True if testing a conversion
+    nwbname = mat_path.parent/f"{mat_path.stem}_stub.nwb"
+    mt.run_conversion(
+        nwbfile_path=str(nwbname),
         overwrite=True,
         metadata=metadata,
         conversion_options=conversion_options,
     )
-    print(
-        f'**************************conversion run for {mat_pt.name.split(".")[0]}............................'
+
+    ## 2. Convert multiple sessions using parallelization:
+    mat_pt_list, bin_pt_list = get_session_paths(load_session_names())
+    # largest sessions first, within 80% of the physical memory. Sessions completed in an earlier run with
+    # the same inputs and options are skipped:
+    sessions = [
+        dict(
+            name=mat_pt.parent.name,
+            args=(mat_pt, bin_pt),
+            kwargs=dict(stub=stub),
+            file_paths=[mat_pt, bin_pt],
+            output_path=get_nwbfile_path(bin_pt, stub),
+        )
+        for mat_pt, bin_pt in zip(mat_pt_list, bin_pt_list)
+    ]
+    run_resumable(
+        converter,
+        sessions,
+        manifest_path=data_path/"conversion_manifest.json" if manifest_path is None else manifest_path,
+        # the .ap.bin files are hundreds of GB, hashing them would take longer than the conversions:
+        content_identifier=False,
+        max_workers=20,
+    )
+    # stage timings summed over the sessions:
+    save_batch_profile(
+        [session["output_path"] for session in sessions],
+        data_path/"conversion_profile.json",
     )
 
 
-Parallel(n_jobs=20)(
-    delayed(converter)(mat_pt, bin_pt)
-    for mat_pt, bin_pt in zip(mat_pt_list, bin_pt_list)
-)
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import uuid
+from pathlib import Path
 from typing import Optional
 
+import numpy as np
+
 from nwb_conversion_tools import NWBConverter, SpikeGLXRecordingInterface
 from nwb_conversion_tools.utils.json_schema import FilePathType
 
+from conversion_utils.estimator import EstimateConversionMixin, read_spikeglx_header
+from conversion_utils.profiling import profile_span, trace_method
 from monkey_neuropixel.matdatainterface import NpxMatDataInterface
 
 
@@ -12,17 +17,180 @@ class ShenoySpikeGLXRecordingInterface(SpikeGLXRecordingInterface):
         super(ShenoySpikeGLXRecordingInterface, self).__init__(
             file_path=file_path, stub_test=stub_test
         )
+        # dataset of the NWB file to stream the .ap.bin to once it is written, see add_streamed_series:
+        self._stream = None
         for ch in self.recording_extractor.get_channel_ids():
             self.recording_extractor.set_channel_property(
                 channel_id=ch, property_name="group_name", value="Probe0"
             )
 
+    def get_window_recording(self, frame_range: list):
+        """
+        The [start, stop) samples of frame_range of the recording, its start time kept.
+        """
+        from spikeextractors import SubRecordingExtractor
+
+        num_frames = self.recording_extractor.get_num_frames()
+        return SubRecordingExtractor(
+            self.recording_extractor,
+            start_frame=min(int(frame_range[0]), num_frames),
+            end_frame=min(int(frame_range[1]), num_frames),
+        )
+
+    def add_streamed_series(
+        self,
+        nwbfile,
+        metadata: dict,
+        frame_range: list = None,
+        compression_threads: int = 4,
+        chunk_shape: list = None,
+    ):
+        """
+        Add the ElectricalSeries of the AP data without its data: the dataset is allocated, chunked and
+        gzip compressed, when the file is written and stream_data fills it from a memmap of the .ap.bin
+        afterwards, with compression_threads threads (see conversion_utils.streaming.stream_compressed).
+        """
+        from hdmf.backends.hdf5.h5_utils import H5DataIO
+        from nwb_conversion_tools.utils.spike_interface import (
+            add_devices,
+            add_electrode_groups,
+            add_electrodes,
+        )
+        from pynwb.ecephys import ElectricalSeries
+
+        from conversion_utils.streaming import AllocatedDataChunkIterator
 
-class NpxNWBConverter(NWBConverter):
+        recording = self.recording_extractor
+        add_devices(recording, nwbfile, metadata)
+        add_electrode_groups(recording, nwbfile, metadata)
+        add_electrodes(recording, nwbfile, metadata)
+        channel_ids = recording.get_channel_ids()
+        electrode_ids = list(nwbfile.electrodes.id[:])
+        electrodes = nwbfile.create_electrode_table_region(
+            region=[electrode_ids.index(channel_id) for channel_id in channel_ids],
+            description="electrodes of the AP data",
+        )
+        num_frames = recording.get_num_frames()
+        start, stop = [0, num_frames] if frame_range is None else frame_range
+        start, stop = min(int(start), num_frames), min(int(stop), num_frames)
+        # 1 s of 64 channels by default, the chunks are also the blocks read and compressed:
+        chunk_shape = (30000, 64) if chunk_shape is None else chunk_shape
+        chunk_shape = tuple(
+            max(1, min(size, maximum)) for size, maximum in zip(chunk_shape, (stop - start, len(channel_ids)))
+        )
+        eseries_kwargs = dict(name="ElectricalSeries_raw", description="Raw acquired data")
+        eseries_kwargs.update(metadata.get("Ecephys", dict()).get("ElectricalSeries_raw", dict()))
+        # the samples are written as int16, scaled to V by the channel gains (in uV):
+        gains = np.array(recording.get_channel_gains())
+        if np.all(gains == gains[0]):
+            eseries_kwargs.update(conversion=float(gains[0])*1e-6)
+        else:
+            eseries_kwargs.update(conversion=1e-6, channel_conversion=gains.tolist())
+        sampling_frequency = recording.get_sampling_frequency()
+        eseries_kwargs.update(
+            data=H5DataIO(
+                AllocatedDataChunkIterator((stop - start, len(channel_ids)), "int16"),
+                chunks=chunk_shape,
+                compression="gzip",
+            ),
+            electrodes=electrodes,
+            starting_time=start/sampling_frequency,
+            rate=float(sampling_frequency),
+        )
+        nwbfile.add_acquisition(ElectricalSeries(**eseries_kwargs))
+        self._stream = dict(
+            dataset_path=f"acquisition/{eseries_kwargs['name']}/data",
+            frame_range=[start, stop],
+            num_channels=len(channel_ids),
+            compression_threads=compression_threads,
+        )
+
+    def stream_data(self, nwbfile_path):
+        """
+        Stream the AP data to the dataset of nwbfile_path added by add_streamed_series. Returns the stats
+        of stream_compressed (bytes, compressed bytes, wall time, throughput in MB/s), its chunks and bytes
+        are counted in the 'stream' span within the span of the segment. None if nothing is to be streamed.
+        """
+        from conversion_utils.streaming import get_binary_memmap, stream_to_nwbfile
+
+        if self._stream is None:
+            return None
+        file_path = self.source_data["file_path"]
+        start, stop = self._stream["frame_range"]
+        source = get_binary_memmap(file_path, read_spikeglx_header(file_path)["channel_count"])
+        with profile_span(f"segment {Path(file_path).stem}"):
+            stats = stream_to_nwbfile(
+                nwbfile_path,
+                self._stream["dataset_path"],
+                source[start:stop, :self._stream["num_channels"]],
+                number_of_threads=self._stream["compression_threads"],
+            )
+        self._stream = None
+        return stats
+
+    def run_conversion(
+        self,
+        nwbfile,
+        metadata,
+        frame_range: list = None,
+        compression_threads: int = None,
+        chunk_shape: list = None,
+        **kwargs,
+    ):
+        """
+        frame_range restricts the samples written to a [start, stop) window, for trial range stub
+        conversions (see NpxMatDataInterface.get_frame_range). With compression_threads, the AP data is
+        not written with the file but streamed to it by compression_threads threads in chunks of
+        chunk_shape (frames, channels) once it is written, see add_streamed_series (hdf5 files written by
+        NpxNWBConverter.run_conversion or run_checkpointed only). Other conversion options are passed to
+        SpikeGLXRecordingInterface.run_conversion
+        The traces read while the file is written are counted in the '<segment>/read' span, within the span
+        of the segment.
+        """
+        if compression_threads is not None:
+            assert not kwargs.get("stub_test"), "stub_test recordings cannot be streamed, use frame_range"
+            return self.add_streamed_series(
+                nwbfile,
+                metadata,
+                frame_range=frame_range,
+                compression_threads=compression_threads,
+                chunk_shape=chunk_shape,
+            )
+        span_name = f"segment {Path(self.source_data['file_path']).stem}"
+        trace_method(self.recording_extractor, "get_traces", f"{span_name}/read")
+        if frame_range is None:
+            with profile_span(span_name):
+                return super().run_conversion(nwbfile, metadata, **kwargs)
+        recording_extractor = self.recording_extractor
+        self.recording_extractor = self.get_window_recording(frame_range)
+        try:
+            with profile_span(span_name):
+                return super().run_conversion(nwbfile, metadata, **kwargs)
+        finally:
+            self.recording_extractor = recording_extractor
+
+
+class NpxNWBConverter(EstimateConversionMixin, NWBConverter):
     data_interface_classes = dict(
         Sgx=ShenoySpikeGLXRecordingInterface, Mat=NpxMatDataInterface,
     )
 
+    def run_conversion(self, metadata: dict = None, save_to_file: bool = True, nwbfile_path: str = None, **kwargs):
+        """
+        NWBConverter.run_conversion, then the AP data of the recordings converted with compression_threads
+        is streamed to the written file. The stats of each streamed recording (see
+        ShenoySpikeGLXRecordingInterface.stream_data) are kept in stream_stats, by data interface name.
+        """
+        nwbfile = super().run_conversion(
+            metadata=metadata, save_to_file=save_to_file, nwbfile_path=nwbfile_path, **kwargs
+        )
+        self.stream_stats = dict()
+        for name, data_interface in self.data_interface_objects.items():
+            if getattr(data_interface, "_stream", None) is not None:
+                assert save_to_file and nwbfile_path is not None, "the streamed recordings need an hdf5 file"
+                self.stream_stats[name] = data_interface.stream_data(nwbfile_path)
+        return nwbfile
+
     def get_metadata(self):
         metadata = super(NpxNWBConverter, self).get_metadata()
         metadata["NWBFile"].update(
@@ -1,8 +1,9 @@
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Union
 
-import yaml
+import numpy as np
 from nwb_conversion_tools.basedatainterface import BaseDataInterface
 from nwb_conversion_tools.utils.json_schema import (
     get_base_schema,
@@ -13,24 +14,53 @@ from nwb_conversion_tools.utils.json_schema import (
 from pynwb import NWBFile, TimeSeries
 from pynwb.behavior import Position, SpatialSeries, BehavioralTimeSeries
 
-from . import brain_location_path
+from conversion_utils.extraction_cache import cached_extraction
+from conversion_utils.profiling import get_nbytes, profile_span
+
+from .config import get_brain_location
 from .matextractor import MatDataExtractor
 
 PathType = Union[str, Path]
 
+# about 1 MiB chunks of float32 waveform templates:
+WAVEFORM_CHUNK_BYTES = 1024**2
+
+
+def _compress_waveforms(waveforms, shape: tuple):
+    """
+    Write the waveform_mean column of the units table, of shape units x samples (x channels for per channel
+    templates), as a chunked, gzip compressed dataset (hdf5 only), its rows already float32. Chunks hold
+    whole templates.
+    """
+    from hdmf.backends.hdf5.h5_utils import H5DataIO
+
+    template_shape = tuple(shape[1:])
+    units_per_chunk = min(shape[0], max(1, WAVEFORM_CHUNK_BYTES//(4*int(np.prod(template_shape)))))
+    data_io_kwargs = dict(compression="gzip", chunks=(units_per_chunk, *template_shape))
+    if hasattr(waveforms, "set_data_io"):
+        waveforms.set_data_io(H5DataIO, data_io_kwargs)
+    else:
+        # hdmf < 3:
+        waveforms.set_dataio(H5DataIO(**data_io_kwargs))
+
 
 class NpxMatDataInterface(BaseDataInterface):
-    def __init__(self, filename: PathType):
-        super().__init__(filename=filename)
+    def __init__(self, filename: PathType, access_profile: Union[str, dict] = None):
+        super().__init__(filename=filename, access_profile=access_profile)
         self.filename = Path(filename)
         assert self.filename.suffix == ".mat", "file_path should be a .mat"
         assert self.filename.exists(), "file_path does not exist"
-        with open(str(brain_location_path), "r") as io:
-            brain_location_map = yaml.load(io, Loader=yaml.FullLoader)
-        self.brain_location = brain_location_map.get(
-            self.filename.stem.split(".")[0], "PMd"
-        )
-        self.mat_extractor = MatDataExtractor(self.filename)
+        # the location map is parsed once per process:
+        self.brain_location = get_brain_location(self.filename.stem.split(".")[0])
+        self.access_profile = access_profile
+        self._mat_extractor = None
+
+    @property
+    def mat_extractor(self):
+        # the .mat file is opened on first use, not at all when its data is read from the extraction cache:
+        if self._mat_extractor is None:
+            self._mat_extractor = MatDataExtractor(self.filename, access_profile=self.access_profile)
+        return self._mat_extractor
 
     def get_metadata_schema(self):
         metadata_schema = get_base_schema()
@@ -81,56 +111,142 @@ class NpxMatDataInterface(BaseDataInterface):
         )
         return metadata
 
-    def run_conversion(self, nwbfile: NWBFile, metadata: dict, **kwargs):
+    def get_trial_nos(self, trial_range: list = None):
+        """
+        Trial numbers in [start, stop) of trial_range, all trials if None.
+        """
+        if trial_range is None:
+            return np.arange(self.mat_extractor._no_trials)
+        start, stop = trial_range
+        return np.arange(start, min(stop, self.mat_extractor._no_trials))
+
+    def get_frame_range(self, trial_range: list = None):
+        """
+        [start, stop) samples of the .ap.bin recording spanning the trials in trial_range, to cut the
+        matching window of the recording.
+        """
+        with self.mat_extractor:
+            return self.mat_extractor.get_sample_range(self.get_trial_nos(trial_range))
+
+    def _extract(self, trial_range: list = None, number_of_jobs: int = 1):
+        """
+        Trial times and columns, behavior, unit spike times and unit details of the trials in trial_range
+        read from the .mat file.
+        """
+        trial_nos = self.get_trial_nos(trial_range)
+        with self.mat_extractor:
+            start_times, stop_times = self.mat_extractor.get_trial_times(trial_nos)
+            default_unit_args, custom_unit_args = self.mat_extractor.extract_unit_details()
+            spike_times, unit_offsets = self.mat_extractor.extract_unit_spike_times_flat(
+                number_of_jobs=number_of_jobs, trial_nos=trial_nos
+            )
+            return dict(
+                start_times=start_times,
+                stop_times=stop_times,
+                events_dict=self.mat_extractor.get_trial_epochs(trial_nos),
+                beh_dict=self.mat_extractor.get_behavior_movement(trial_nos),
+                trial_ids=self.mat_extractor.get_trial_ids(trial_nos),
+                task_dict=self.mat_extractor.get_task_details(trial_nos),
+                spike_times=spike_times,
+                unit_offsets=unit_offsets,
+                default_unit_args=default_unit_args,
+                custom_unit_args=custom_unit_args,
+            )
+
+    def run_conversion(
+        self,
+        nwbfile: NWBFile,
+        metadata: dict,
+        cache_dir: str = None,
+        number_of_jobs: int = 1,
+        compress_waveforms: bool = False,
+        trial_range: list = None,
+        **kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            folder of the extraction cache (see conversion_utils.extraction_cache), the .mat file is only
+            read if it changed since its data was cached. No caching if None.
+        number_of_jobs: int
+            processes reading the spike times of the .mat file, each over a range of trials
+        compress_waveforms: bool
+            store the waveform templates, the largest unit column, as chunked and gzip compressed float32
+            (hdf5 files only). float64 and uncompressed if False.
+        trial_range: list
+            [start, stop) trials to convert, for a stub conversion of the session: the behavior, trials and
+            spike times of these trials only.
+        """
         metadata_comp = dict_deep_update(self.get_metadata(), metadata)
         assert isinstance(nwbfile, NWBFile), "'nwbfile' should be of type pynwb.NWBFile"
-        start_times, stop_times = self.mat_extractor.get_trial_times()
-        events_dict = self.mat_extractor.get_trial_epochs()
-        beh_dict = self.mat_extractor.get_behavior_movement()
-        trial_ids = self.mat_extractor.get_trial_ids()
-        task_dict = self.mat_extractor.get_task_details()
-        spike_times_list = self.mat_extractor.extract_unit_spike_times()
-        default_unit_args, custom_unit_args = self.mat_extractor.extract_unit_details()
+        with profile_span("extraction") as counts:
+            data = cached_extraction(
+                cache_dir,
+                self.filename,
+                MatDataExtractor,
+                partial(self._extract, trial_range, number_of_jobs=number_of_jobs),
+                options=None if trial_range is None else dict(trial_range=list(trial_range)),
+            )
+            counts.update(items=len(data["start_times"]))
+        start_times, stop_times = data["start_times"], data["stop_times"]
+        events_dict = data["events_dict"]
+        beh_dict = data["beh_dict"]
+        trial_ids = data["trial_ids"]
+        task_dict = data["task_dict"]
+        spike_times, unit_offsets = data["spike_times"], data["unit_offsets"]
+        default_unit_args, custom_unit_args = data["default_unit_args"], data["custom_unit_args"]
         obs_intervals = [
             [start_times[i], stop_times[i]] for i in range(len(start_times))
         ]
         # add behavior:
-        beh_mod = nwbfile.create_processing_module(
-            "behavior", "contains monkey movement data"
-        )
-        position_container = Position()
-        beh_ts_container = BehavioralTimeSeries()
-        spatial_series_list = []
         timestamps = beh_dict.pop("times")
-        for name, args in beh_dict.items():
-            args_ = dict(timestamps=timestamps["data"], **args)
-            if "position" in name:
-                args_.update(metadata_comp["Behavior"]["Position"][0])
-                spatial_series_list.append(
-                    position_container.create_spatial_series(**args_)
-                )
-            else:
-                args_.update(metadata_comp["Behavior"]["BehavioralTimeSeries"][0])
-                beh_ts_container.create_timeseries(**args_)
-        beh_mod.add(position_container)
-        beh_mod.add(beh_ts_container)
+        with profile_span(
+                "behavior",
+                items=len(timestamps["data"]),
+                bytes=sum(args["data"].nbytes for args in beh_dict.values()),
+        ):
+            beh_mod = nwbfile.create_processing_module(
+                "behavior", "contains monkey movement data"
+            )
+            position_container = Position()
+            beh_ts_container = BehavioralTimeSeries()
+            spatial_series_list = []
+            for name, args in beh_dict.items():
+                args_ = dict(timestamps=timestamps["data"], **args)
+                if "position" in name:
+                    args_.update(metadata_comp["Behavior"]["Position"][0])
+                    spatial_series_list.append(
+                        position_container.create_spatial_series(**args_)
+                    )
+                else:
+                    args_.update(metadata_comp["Behavior"]["BehavioralTimeSeries"][0])
+                    beh_ts_container.create_timeseries(**args_)
+            beh_mod.add(position_container)
+            beh_mod.add(beh_ts_container)
 
         # add trials:
         task_dict.update(events_dict)
-        for name, args in task_dict.items():
-            col_det = dict(name=name, description=args["description"])
-            nwbfile.add_trial_column(**col_det)
-        for trial_no in range(self.mat_extractor._no_trials):
-            col_details_dict = {
-                key: args["data"][trial_no] for key, args in task_dict.items()
-            }
-            col_details_dict.update(
-                start_time=start_times[trial_no],
-                stop_time=stop_times[trial_no],
-                timeseries=spatial_series_list,
-                id=int(trial_ids[trial_no]),
-            )
-            nwbfile.add_trial(**col_details_dict)
+        with profile_span(
+                "trials",
+                items=len(trial_ids),
+                bytes=get_nbytes([args["data"] for args in task_dict.values()])
+                + get_nbytes([start_times, stop_times]),
+        ):
+            for name, args in task_dict.items():
+                col_det = dict(name=name, description=args["description"])
+                nwbfile.add_trial_column(**col_det)
+            for trial_no in range(len(trial_ids)):
+                col_details_dict = {
+                    key: args["data"][trial_no] for key, args in task_dict.items()
+                }
+                col_details_dict.update(
+                    start_time=start_times[trial_no],
+                    stop_time=stop_times[trial_no],
+                    timeseries=spatial_series_list,
+                    id=int(trial_ids[trial_no]),
+                )
+                nwbfile.add_trial(**col_details_dict)
 
         if len(nwbfile.devices) == 0:
             nwbfile.create_device(**metadata_comp["Ecephys"]["Device"][0])
@@ -141,19 +257,25 @@ class NpxMatDataInterface(BaseDataInterface):
                 device=nwbfile.devices[args.pop("device")], **args
             )
         # add units:
-        args_all = dict()
-        for name, custom_arg in custom_unit_args.items():
-            nwbfile.add_unit_column(name=name, description=custom_arg["description"])
-            args_all[name] = custom_arg["data"]
-        for name, def_arg in default_unit_args.items():
-            args_all[name] = def_arg["data"]
-        for no, unit_sp_times in enumerate(spike_times_list):
-            args = dict()
-            for key, value in args_all.items():
-                args[key] = int(value[no]) if key == "id" else value[no]
-            args.update(
-                spike_times=unit_sp_times,
-                electrode_group=list(nwbfile.electrode_groups.values())[0],
-                obs_intervals=obs_intervals,
-            )
-            nwbfile.add_unit(**args)
+        with profile_span("units", items=len(spike_times)) as counts:
+            args_all = dict()
+            for name, custom_arg in custom_unit_args.items():
+                nwbfile.add_unit_column(name=name, description=custom_arg["description"])
+                args_all[name] = custom_arg["data"]
+            for name, def_arg in default_unit_args.items():
+                args_all[name] = def_arg["data"]
+            if compress_waveforms:
+                args_all["waveform_mean"] = args_all["waveform_mean"].astype("float32")
+            counts.update(bytes=get_nbytes(spike_times) + get_nbytes(list(args_all.values())))
+            for no in range(len(unit_offsets) - 1):
+                args = dict()
+                for key, value in args_all.items():
+                    args[key] = int(value[no]) if key == "id" else value[no]
+                args.update(
+                    spike_times=spike_times[unit_offsets[no]:unit_offsets[no + 1]],
+                    electrode_group=list(nwbfile.electrode_groups.values())[0],
+                    obs_intervals=obs_intervals,
+                )
+                nwbfile.add_unit(**args)
+            if compress_waveforms:
+                _compress_waveforms(nwbfile.units["waveform_mean"], args_all["waveform_mean"].shape)
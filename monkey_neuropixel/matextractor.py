@@ -1,19 +1,34 @@
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from time import time
+from typing import Union
 
-import h5py
 import numpy as np
-from tqdm import tqdm
+
+from conversion_utils.h5access import open_h5_file
+from conversion_utils.profiling import profile_span
 
 
 class MatDataExtractor:
-    def __init__(self, file_name):
+    # increase whenever the extracted data changes, to invalidate the extraction caches:
+    EXTRACTOR_VERSION = 5
+
+    def __init__(self, file_name, access_profile: Union[str, dict] = None):
+        """
+        Parameters
+        ----------
+        file_name: PathType
+            *.behavior.mat file (matlab v7.3)
+        access_profile: Union[str, dict]
+            name of a profile in conversion_utils.h5access.ACCESS_PROFILES or a dict of h5py access settings
+        """
         self.file_name = Path(file_name)
         assert self.file_name.suffix == ".mat"
-        self._open_file = h5py.File(self.file_name, "r")
-        self.trials = self._open_file["trials"]
-        self.npix_meta = self._open_file["npix_meta"]
+        self._access_profile = access_profile
+        self._open_file = None
+        self._trial_times = None
+        self.open()
         self.trial_colnames = list(self.trials.keys())
         self._no_trials = max(self.trials[self.trial_colnames[0]].shape)
         self._no_units = max(self.npix_meta["cluster_ids"].shape)
@@ -22,10 +37,42 @@ class MatDataExtractor:
             [chr(subject_array[i, 0]) for i in range(subject_array.shape[0])]
         )
 
-    def get_trial_times(self):
+    def open(self):
+        if not self._open_file:
+            self._open_file = open_h5_file(self.file_name, self._access_profile)
+            self.trials = self._open_file["trials"]
+            self.npix_meta = self._open_file["npix_meta"]
+        return self
+
+    def close(self):
+        if self._open_file:
+            self._open_file.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_trial_nos(self, trial_nos: list = None):
+        """
+        trial_nos as an array, all trials if None.
+        """
+        return np.arange(self._no_trials) if trial_nos is None else np.asarray(trial_nos, dtype="int64")
+
+    def _return_refs(self, field, trial_nos: list = None):
+        """
+        References of field for trial_nos (all trials if None), the reference column read at once.
+        """
+        return self.trials[field][0, :][self.get_trial_nos(trial_nos)]
+
+    def get_trial_times(self, trial_nos: list = None):
         """
-        Trial start and end times for given trial nos.
+        Trial start and end times for given trial nos (all trials if None), read once per extractor.
         """
+        trial_nos = self.get_trial_nos(trial_nos)
+        if self._trial_times is not None:
+            return tuple(times[trial_nos] for times in self._trial_times)
         start_time_list = []
         stop_time_list = []
         for trial_no in range(self._no_trials):
@@ -35,21 +82,25 @@ class MatDataExtractor:
             stop_time_list.append(
                 self._open_file[self.trials["npix_stop_idx"][0, trial_no]][0, 0]/3e4
             )
-        return np.array(start_time_list), np.array(stop_time_list)
+        self._trial_times = np.array(start_time_list), np.array(stop_time_list)
+        return tuple(times[trial_nos] for times in self._trial_times)
 
-    def get_trial_epochs(self):
+    def get_sample_range(self, trial_nos: list = None):
         """
-        Trial start and end times for given trial nos.
+        [start, stop) samples of the .ap.bin recording from the start of the first to the end of the last
+        trial of trial_nos (all trials if None), from npix_start_idx and npix_stop_idx.
         """
-        trial_start, trial_end = self.get_trial_times()
-
-        def get_val(name, trial_no):
-            return (
-                    np.array(self._return_trial_value(name, trial_no=trial_no)).flatten()[0]
-                    *1e-3
-                    + trial_start[trial_no]*1e-3
-            )
+        trial_nos = self.get_trial_nos(trial_nos)
+        start = self._open_file[self._return_refs("npix_start_idx", trial_nos[:1])[0]][0, 0]
+        stop = self._open_file[self._return_refs("npix_stop_idx", trial_nos[-1:])[0]][0, 0]
+        return [int(start), int(stop) + 1]
 
+    def get_trial_epochs(self, trial_nos: list = None):
+        """
+        Trial event times of trial_nos (all trials if None), each event column read in one pass (see
+        _read_trial_scalars). The delay period and reaction time are durations, not offset by the trial start.
+        """
+        trial_start, trial_end = self.get_trial_times(trial_nos)
         events_list = {
             "target_onset_time": "TargetOnset",
             "go_cue_time": "GoCue",
@@ -61,58 +112,104 @@ class MatDataExtractor:
             "reaction_time": "rt",
         }
 
+        durations = ["delay_period", "reaction_time"]
+
         events_dict = defaultdict(dict)
         for event_name in events_list:
+            data = self._read_trial_scalars(events_list[event_name], trial_nos)*1e-3
             events_dict[event_name].update(
-                data=[
-                    get_val(events_list[event_name], i) for i in range(self._no_trials)
-                ],
+                data=data if event_name in durations else data + trial_start,
                 description=f"{events_list[event_name]} time in s",
             )
 
         return events_dict
 
+    def _read_trial_scalars(self, field, trial_nos: list = None):
+        """
+        First value of field in each trial of trial_nos (all trials if None) as a float array, the reference
+        column read once. NaN for the trials where it is empty.
+        """
+        refs = self._return_refs(field, trial_nos)
+        values = np.full(len(refs), np.nan)
+        for trial_no, ref in enumerate(refs):
+            dataset = self._open_file[ref]
+            # empty matlab arrays hold their dimensions:
+            if "MATLAB_empty" not in dataset.attrs and dataset.size > 0:
+                values[trial_no] = dataset[()].flat[0]
+        return values
+
     def _return_trial_value(self, field, trial_no=0):
         return self._open_file[self.trials[field][0, trial_no]]
 
-    def get_behavior_movement(self):
-        trial_start, trial_end = self.get_trial_times()
+    def _read_trial_arrays(self, fields: list, scale: float = 1.0, trial_nos: list = None):
+        """
+        Concatenate the per trial arrays (dimensions x samples) of fields in trial_nos (all trials if None),
+        holding the same number of samples in each trial, into samples x dimensions arrays scaled by scale. The
+        reference columns are read once and the outputs are allocated from the shapes of the datasets before
+        any data is read.
+
+        Returns
+        -------
+        arrays: dict
+            samples x dimensions array of each field
+        lengths: np.ndarray
+            number of samples of each trial
+        """
+        datasets = {
+            field: [self._open_file[ref] for ref in self._return_refs(field, trial_nos)] for field in fields
+        }
+        lengths = np.array(
+            [
+                0 if "MATLAB_empty" in dataset.attrs else dataset.shape[1]
+                for dataset in datasets[fields[0]]
+            ],
+            dtype="int64",
+        )
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        arrays = dict()
+        for field in fields:
+            no_dims = max(
+                [dataset.shape[0] for dataset in datasets[field] if "MATLAB_empty" not in dataset.attrs],
+                default=1,
+            )
+            arrays[field] = np.empty((offsets[-1], no_dims))
+            for trl, dataset in enumerate(datasets[field]):
+                if lengths[trl] == 0:
+                    continue
+                assert dataset.shape == (no_dims, lengths[trl]), f"{field} of trial {trl} is {dataset.shape}"
+                arrays[field][offsets[trl]:offsets[trl + 1]] = dataset[()].T
+            np.multiply(arrays[field], scale, out=arrays[field])
+        return arrays, lengths
+
+    def get_behavior_movement(self, trial_nos: list = None):
+        trial_start, trial_end = self.get_trial_times(trial_nos)
         beh_fields = {"hand_position": "handPosition", "hand_speed": "handSpeed"}
+        arrays, lengths = self._read_trial_arrays(
+            list(beh_fields.values()) + ["hand_time"], scale=1e-3, trial_nos=trial_nos
+        )
         beh_dict = defaultdict(dict)
         for field in beh_fields:
             beh_dict[field].update(
-                data=np.concatenate(
-                    [
-                        np.array(self._return_trial_value(beh_fields[field], i)).T
-                        *1e-3
-                        for i in range(self._no_trials)
-                    ],
-                    axis=0,
-                ).squeeze(),
+                data=arrays[beh_fields[field]].squeeze(),
                 description=f"{field} x,y,z in m",
             )
+        times = arrays["hand_time"]
+        times += np.repeat(trial_start, lengths)[:, np.newaxis]
         beh_dict["times"].update(
-            data=np.concatenate(
-                [
-                    np.array(self._return_trial_value("hand_time", i)).T*1e-3
-                    + trial_start[i]
-                    for i in range(self._no_trials)
-                ],
-                axis=0,
-            ).squeeze(),
+            data=times.squeeze(),
             description="time vector in s",
         )
         return beh_dict
 
-    def get_trial_ids(self):
+    def get_trial_ids(self, trial_nos: list = None):
         return np.array(
             [
                 self._return_trial_value("trialId", i)[0, 0]
-                for i in range(self._no_trials)
+                for i in self.get_trial_nos(trial_nos)
             ]
         )
 
-    def get_task_details(self):
+    def get_task_details(self, trial_nos: list = None):
         task_fields = {
             "centerX": "center hold location x: screen center origin, direction: right",
             "centerY": "center hold location y: screen center origin, direction: top",
@@ -129,33 +226,78 @@ class MatDataExtractor:
             task_dict[field].update(
                 data=[
                     self._return_trial_value(field, i)[0, 0]
-                    for i in range(self._no_trials)
+                    for i in self.get_trial_nos(trial_nos)
                 ],
                 description=desc,
             )
         return task_dict
 
-    def extract_unit_spike_times(self, spike_ids: list = None):
+    def extract_unit_spike_times(self, spike_ids: list = None, trial_nos: list = None):
+        """
+        Spike times in s of each unit in spike_ids (all units if None), see extract_unit_spike_times_flat.
+        """
+        spike_times, unit_offsets = self.extract_unit_spike_times_flat(spike_ids, trial_nos=trial_nos)
+        return [
+            spike_times[start:stop].tolist()
+            for start, stop in zip(unit_offsets[:-1], unit_offsets[1:])
+        ]
+
+    def extract_unit_spike_times_flat(
+        self, spike_ids: list = None, number_of_jobs: int = 1, trial_nos: list = None
+    ):
+        """
+        Spike times in s of the units in spike_ids (all units if None) over trial_nos (all trials if None), as
+        one array holding the spikes of each unit in turn, in trial order. The vector of spike time references
+        of a trial is read at once and the spikes of each unit are written to a numpy buffer, grown by
+        doubling.
+
+        Parameters
+        ----------
+        spike_ids: list
+        number_of_jobs: int
+            processes reading the spike times, each opens the file and reads a contiguous range of trials.
+            Their chunks are merged unit by unit in trial order (see merge_unit_chunks).
+        trial_nos: list
+            trials to read, all trials if None
+
+        Returns
+        -------
+        spike_times: np.ndarray
+        unit_offsets: np.ndarray
+            len(spike_ids) + 1 offsets, the spikes of the n-th unit are spike_times[unit_offsets[n]:unit_offsets[n + 1]]
+        """
         no_neurons = len(self._open_file[self.trials["npix"][0, 0]])
-        if spike_ids is None:
-            spike_ids = np.arange(no_neurons)
-        trial_nos = np.arange(self._no_trials)
-        spike_times_all_list = []
-        trial_start, _ = self.get_trial_times()
-        for _ in spike_ids:
-            spike_times_all_list.append([])
-        start = time()
-        for trl in tqdm(trial_nos):
-            sptimes = self._return_trial_value("npix", trl)
-            for id in spike_ids:
-                spike_times_all_list[id].extend(
-                    (
-                            self._open_file[sptimes[id, 0]][:].flatten()*1e-3
-                            + trial_start[trl]
-                    ).tolist()
+        spike_ids = np.arange(no_neurons) if spike_ids is None else np.asarray(spike_ids)
+        trial_nos = self.get_trial_nos(trial_nos)
+        trial_start, _ = self.get_trial_times(trial_nos)
+        number_of_jobs = max(1, min(number_of_jobs, len(trial_nos)))
+        with profile_span("spike_times") as span_counts:
+            if number_of_jobs == 1:
+                spike_times, unit_offsets = _read_spike_times(
+                    self._open_file, self._return_refs("npix", trial_nos), trial_start, spike_ids
                 )
-        print(time() - start)
-        return spike_times_all_list
+            else:
+                bounds = np.linspace(0, len(trial_nos), number_of_jobs + 1).astype("int64")
+                # spawned, the workers do not inherit the hdf5 library state of the open file:
+                with ProcessPoolExecutor(
+                    max_workers=number_of_jobs, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    futures = [
+                        executor.submit(
+                            _read_trials_spike_times,
+                            self.file_name,
+                            self._access_profile,
+                            trial_nos[start:stop],
+                            trial_start[start:stop],
+                            spike_ids,
+                        )
+                        for start, stop in zip(bounds[:-1], bounds[1:])
+                    ]
+                    spike_times, unit_offsets = merge_unit_chunks(
+                        [future.result() for future in futures]
+                    )
+            span_counts.update(items=len(spike_times), bytes=spike_times.nbytes)
+        return spike_times, unit_offsets
 
     def extract_unit_details(self, selfspike_ids: list = None):
         default_unit_args = {
@@ -184,25 +326,72 @@ class MatDataExtractor:
         }
         default_dict = defaultdict(dict)
         custom_dict = defaultdict(dict)
+        # each field is read at once, the values of a unit are in a column:
         for arg in default_unit_args:
             default_dict[default_unit_args[arg]].update(
-                data=np.concatenate(
-                    [
-                        self.npix_meta[arg][:, i].flatten()[:, np.newaxis]
-                        for i in range(self._no_units)
-                    ],
-                    axis=1,
-                ).T
+                data=np.ascontiguousarray(self.npix_meta[arg][()].T)
             )
         for arg in custom_unit_args:
             custom_dict[arg].update(
-                data=np.concatenate(
-                    [
-                        self.npix_meta[arg][:, i].flatten()[:, np.newaxis]
-                        for i in range(self._no_units)
-                    ],
-                    axis=1,
-                ).T,
+                data=np.ascontiguousarray(self.npix_meta[arg][()].T),
                 description=custom_unit_args[arg],
             )
         return default_dict, custom_dict
+
+
+def _read_spike_times(h5_file, trial_refs, trial_start, spike_ids):
+    """
+    Spike times of the units in spike_ids over the trials of trial_refs (the 'npix' references of the
+    trials, starting at the times in trial_start), see MatDataExtractor.extract_unit_spike_times_flat.
+    """
+    buffers = [np.empty(1024) for _ in spike_ids]
+    counts = np.zeros(len(spike_ids), dtype="int64")
+    for trl, trial_ref in enumerate(trial_refs):
+        unit_refs = h5_file[trial_ref][:, 0][spike_ids]
+        for no, unit_ref in enumerate(unit_refs):
+            dataset = h5_file[unit_ref]
+            # units without spikes in the trial are matlab empty arrays, holding their dimensions:
+            if "MATLAB_empty" in dataset.attrs:
+                continue
+            start, stop = counts[no], counts[no] + dataset.size
+            if stop > len(buffers[no]):
+                buffer = np.empty(max(2*len(buffers[no]), stop))
+                buffer[:start] = buffers[no][:start]
+                buffers[no] = buffer
+            spike_times = buffers[no][start:stop]
+            np.multiply(dataset[()].ravel(), 1e-3, out=spike_times)
+            spike_times += trial_start[trl]
+            counts[no] = stop
+    unit_offsets = np.concatenate([[0], np.cumsum(counts)])
+    spike_times = np.empty(unit_offsets[-1])
+    for no, buffer in enumerate(buffers):
+        spike_times[unit_offsets[no]:unit_offsets[no + 1]] = buffer[:counts[no]]
+    return spike_times, unit_offsets
+
+
+def _read_trials_spike_times(
+    file_name: Path, access_profile, trial_nos: np.ndarray, trial_start: np.ndarray, spike_ids: np.ndarray
+):
+    """
+    Worker of extract_unit_spike_times_flat: spike times of the trials trial_nos, read with its own
+    read-only handle of the file.
+    """
+    with open_h5_file(file_name, access_profile) as h5_file:
+        return _read_spike_times(h5_file, h5_file["trials"]["npix"][0, :][trial_nos], trial_start, spike_ids)
+
+
+def merge_unit_chunks(chunks: list):
+    """
+    Merge the (spike_times, unit_offsets) of consecutive trial ranges into the spike times of the whole
+    session: the chunks of each unit are concatenated in the order of chunks.
+    """
+    counts = np.sum([np.diff(unit_offsets) for _, unit_offsets in chunks], axis=0)
+    unit_offsets = np.concatenate([[0], np.cumsum(counts)])
+    spike_times = np.empty(unit_offsets[-1])
+    for no in range(len(counts)):
+        position = unit_offsets[no]
+        for chunk_times, chunk_offsets in chunks:
+            chunk = chunk_times[chunk_offsets[no]:chunk_offsets[no + 1]]
+            spike_times[position:position + len(chunk)] = chunk
+            position += len(chunk)
+    return spike_times, unit_offsets
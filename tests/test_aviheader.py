@@ -0,0 +1,161 @@
+import shutil
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from pynwb import NWBFile
+from pynwb.image import ImageSeries
+
+from center_out_task.aviheader import index_avi_frames, probe_avi
+from center_out_task.coutmoviedatainterface import CoutMoviedataInterface
+
+
+def _chunk(fourcc: bytes, data: bytes):
+    return fourcc + struct.pack("<I", len(data)) + data + b"\x00"*(len(data) & 1)
+
+
+def _list(list_type: bytes, *chunks):
+    return _chunk(b"LIST", list_type + b"".join(chunks))
+
+
+def write_avi(file_path, segments: list, odml_index: bool = False, idx1: bool = True, fps: int = 25):
+    """
+    Minimal avi with one video stream: a RIFF AVI segment followed by RIFF AVIX segments, segments holds the
+    (frame data, is keyframe) of the frames of each segment. With odml_index, the frames are indexed by an
+    indx super index pointing to an ix00 index at the end of each movi list, with idx1 by an idx1 index of
+    the first segment. A header without frame rate if fps is 0.
+    """
+    no_frames = sum(len(frames) for frames in segments)
+
+    def hdrl(index_offsets):
+        avih = struct.pack("<10I", 10**6//fps if fps else 0, 0, 0, 0x110, no_frames, 0, 1, 0, 4, 4) + b"\x00"*16
+        strh = struct.pack("<4s4sIHHIIIII", b"vids", b"MJPG", 0, 0, 0, 0, 1, fps, 0, no_frames) + b"\x00"*20
+        strf = struct.pack("<IiiHH4s", 40, 4, 4, 1, 24, b"MJPG") + b"\x00"*20
+        chunks = [_chunk(b"strh", strh), _chunk(b"strf", strf)]
+        if odml_index:
+            indx = struct.pack("<HBBI4s12x", 4, 0, 0, len(index_offsets), b"00dc") + b"".join(
+                struct.pack("<QII", offset, 0, 0) for offset in index_offsets
+            )
+            chunks.append(_chunk(b"indx", indx))
+        return _list(b"hdrl", _chunk(b"avih", avih), _list(b"strl", *chunks))
+
+    def movi(frames, movi_offset):
+        # movi_offset: file offset of the movi list
+        data, entries = b"", []
+        for frame, is_keyframe in frames:
+            position = movi_offset + 12 + len(data)
+            entries.append((position, len(frame), is_keyframe))
+            data += _chunk(b"00dc", frame)
+        index_offset = movi_offset + 12 + len(data)
+        if odml_index:
+            base_offset = movi_offset
+            ix00 = struct.pack("<HBBI4sQ4x", 2, 0, 1, len(entries), b"00dc", base_offset) + b"".join(
+                struct.pack("<II", position + 8 - base_offset, size | (0 if is_keyframe else 0x80000000))
+                for position, size, is_keyframe in entries
+            )
+            data += _chunk(b"ix00", ix00)
+        return _list(b"movi", data), entries, index_offset
+
+    index_offsets = [0]*len(segments)
+    for _ in range(2):
+        # the second pass writes the offsets of the ix00 indexes found by the first one:
+        content, offset, frame_entries = b"", 0, []
+        for segment_no, frames in enumerate(segments):
+            head = hdrl(index_offsets) if segment_no == 0 else b""
+            movi_list, entries, index_offsets[segment_no] = movi(frames, offset + 12 + len(head))
+            body = head + movi_list
+            if segment_no == 0 and idx1:
+                movi_start = offset + 12 + len(head) + 8
+                body += _chunk(
+                    b"idx1",
+                    b"".join(
+                        struct.pack("<4sIII", b"00dc", 0x10 if is_keyframe else 0, position - movi_start, size)
+                        for position, size, is_keyframe in entries
+                    ),
+                )
+            riff = _chunk(b"RIFF", (b"AVI " if segment_no == 0 else b"AVIX") + body)
+            content += riff
+            offset += len(riff)
+            frame_entries += entries
+    Path(file_path).write_bytes(content)
+    return frame_entries
+
+
+class TestIndexAviFrames(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"movie.avi"
+        self.segments = [
+            [(b"key0", True), (b"frame1", False), (b"frame_2", False)],
+            [(b"key3", True), (b"frame4", False)],
+        ]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def _check(self, frame_entries, frame_index, keyframes):
+        np.testing.assert_array_equal(frame_index["byte_offset"], [entry[0] + 8 for entry in frame_entries])
+        np.testing.assert_array_equal(frame_index["byte_size"], [entry[1] for entry in frame_entries])
+        np.testing.assert_array_equal(frame_index["is_keyframe"], keyframes)
+        data = self.file_path.read_bytes()
+        for offset, size, (frame, _) in zip(
+                frame_index["byte_offset"], frame_index["byte_size"], sum(self.segments, [])
+        ):
+            assert data[offset:offset + size] == frame
+
+    def test_odml_index(self):
+        frame_entries = write_avi(self.file_path, self.segments, odml_index=True)
+        assert probe_avi(self.file_path)["frame_count"] == 5
+        self._check(frame_entries, index_avi_frames(self.file_path), [True, False, False, True, False])
+
+    def test_idx1_and_avix_scan(self):
+        frame_entries = write_avi(self.file_path, self.segments)
+        self._check(frame_entries, index_avi_frames(self.file_path), [True, False, False, False, False])
+
+    def test_scan(self):
+        frame_entries = write_avi(self.file_path, self.segments, idx1=False)
+        self._check(frame_entries, index_avi_frames(self.file_path), [True, False, False, False, False])
+
+
+class TestAddFrameIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"movie.avi"
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def _add_frame_index(self):
+        nwbfile = NWBFile("session", "identifier", datetime(2020, 1, 1).astimezone())
+        nwbfile.add_trial(start_time=0.0, stop_time=0.05)
+        # rate 0: not known when the series was added
+        nwbfile.add_acquisition(
+            ImageSeries(
+                name="Video",
+                external_file=[str(self.file_path)],
+                format="external",
+                starting_frame=[0],
+                rate=0.0,
+                num_samples=probe_avi(self.file_path)["frame_count"],
+            )
+        )
+        CoutMoviedataInterface(self.file_path).add_frame_index(nwbfile)
+        return nwbfile.acquisition["Video_frame_index"]
+
+    def test_header_rate(self):
+        write_avi(self.file_path, [[(b"key0", True), (b"frame1", False), (b"frame_2", False)]])
+        frame_index = self._add_frame_index()
+        np.testing.assert_allclose(frame_index["timestamp"].data, [0.0, 0.04, 0.08])
+        np.testing.assert_array_equal(frame_index["trial"].data, [0, 0, -1])
+
+    def test_no_rate(self):
+        write_avi(self.file_path, [[(b"key0", True), (b"frame1", False)]], fps=0)
+        with self.assertRaisesRegex(AssertionError, "frame rate"):
+            self._add_frame_index()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import h5py
+import numpy as np
+from pynwb import NWBHDF5IO, NWBFile
+
+from center_out_task.matextractor import MatDataExtractor
+
+
+def write_mat_file(file_path, trials: list):
+    """
+    Minimal matlab v7.3 R struct array: each field of R is a column of object references to the value of
+    each trial, a dict value is stored as a struct (group) and None as an empty matlab array.
+    """
+    with h5py.File(file_path, "w") as file:
+        refs = file.create_group("#refs#")
+
+        def put(parent, name, value):
+            if isinstance(value, dict):
+                group = parent.create_group(name)
+                for key, item in value.items():
+                    put(group, key, item)
+                return group.ref
+            if value is None:
+                dataset = parent.create_dataset(name, data=np.zeros(2, dtype="uint64"))
+                dataset.attrs["MATLAB_empty"] = 1
+                return dataset.ref
+            return parent.create_dataset(name, data=np.atleast_2d(value)).ref
+
+        columns = dict()
+        for trial_no, trial in enumerate(trials):
+            for field, value in trial.items():
+                columns.setdefault(field, []).append(put(refs, f"{field}{trial_no}", value))
+        R = file.create_group("R")
+        for field, column in columns.items():
+            R.create_dataset(field, data=np.array(column, dtype=h5py.ref_dtype)[:, None])
+
+
+def make_trial(trial_no: int, trial_length: int = 20, **fields):
+    trial = dict(
+        subject=np.array([[ord(letter)] for letter in "Jenkins"], dtype="uint16"),
+        startDateNum=737000.5 + trial_no/864.0,
+        trialLength=float(trial_length),
+        trialNum=float(trial_no + 1),
+        isSuccessful=1.0,
+    )
+    trial.update(fields)
+    return trial
+
+
+class TestCenterOutMatDataExtractor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"R_test.mat"
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_trial_params(self):
+        write_mat_file(
+            self.file_path,
+            [
+                make_trial(
+                    0,
+                    startTrialParams=dict(
+                        taskID=1.0, timeReach=500.0, posTarget=np.array([[10.0], [-5.0]]), barrierPoints=None,
+                        sizeTarget=np.array([[ord("a")]], dtype="uint16").astype("S2"),
+                    ),
+                ),
+                make_trial(
+                    1, startTrialParams=dict(taskID=2.0, posTarget=np.array([[0.0], [8.0]]), barrierPoints=None),
+                ),
+            ],
+        )
+        with MatDataExtractor(self.file_path) as extractor:
+            scalars, ragged = extractor.extract_trial_params(
+                names=["taskID", "timeReach", "timeFail", "posTarget", "sizeTarget", "barrierPoints"],
+                ragged_names=["posTarget", "sizeTarget", "barrierPoints"],
+            )
+        np.testing.assert_array_equal(scalars["taskID"], [1.0, 2.0])
+        np.testing.assert_array_equal(scalars["timeReach"], [500.0, np.nan])
+        assert np.isnan(scalars["timeFail"]).all()
+        np.testing.assert_array_equal(ragged["posTarget"][0], [10.0, -5.0, 0.0, 8.0])
+        np.testing.assert_array_equal(ragged["posTarget"][1], [2, 4])
+        # not numeric or empty in every trial:
+        for name in ("sizeTarget", "barrierPoints"):
+            assert len(ragged[name][0]) == 0
+            np.testing.assert_array_equal(ragged[name][1], [0, 0])
+
+    def test_empty_ragged_columns(self):
+        # no barriers in the session, no trial was acquired:
+        params = dict(taskID=1.0, posTarget=np.array([[10.0], [-5.0]]), barrierPoints=None)
+        write_mat_file(
+            self.file_path,
+            [
+                make_trial(
+                    trial_no, startTrialParams=params, timeTargetAcquire=None, timeTargetHeld=None,
+                    timeTargetOn=300.0, delayTime=None,
+                )
+                for trial_no in range(2)
+            ],
+        )
+        with MatDataExtractor(self.file_path) as extractor:
+            task_data = extractor.extract_task_data()
+            task_times_data = extractor.extract_task_times()
+        # the trials table as COutMatDataInterface.run_conversion builds it:
+        nwbfile = NWBFile("session", "identifier", datetime(2020, 1, 1).astimezone())
+        for trial_no in range(2):
+            nwbfile.add_trial(start_time=float(trial_no), stop_time=trial_no + 0.5)
+        for col_details in task_data + task_times_data:
+            nwbfile.add_trial_column(**col_details)
+        with NWBHDF5IO(str(self.tmpdir/"session.nwb"), "w") as io:
+            io.write(nwbfile)
+        with NWBHDF5IO(str(self.tmpdir/"session.nwb"), "r") as io:
+            trials = io.read().trials
+            assert [len(points) for points in trials["barrier_points"][:]] == [0, 0]
+            assert [len(sizes) for sizes in trials["target_size"][:]] == [0, 0]
+            np.testing.assert_array_equal(trials["target_pos"][1], [10.0, -5.0])
+
+    def test_reward_intervals(self):
+        def juice(rewarded_samples, trial_length=20):
+            # sparse 1 x trial_length matrix:
+            flags = np.zeros(trial_length)
+            flags[rewarded_samples] = 1
+            return dict(
+                data=np.ones(int(flags.sum())), ir=np.zeros(int(flags.sum()), dtype="uint64"),
+                jc=np.concatenate([[0], np.cumsum(flags)]).astype("uint64"),
+            )
+
+        write_mat_file(
+            self.file_path,
+            [
+                make_trial(0, juice=juice([3, 4, 5, 10, 11])),
+                make_trial(1, juice=juice([])),
+                make_trial(2, juice=juice([18, 19])),
+            ],
+        )
+        with MatDataExtractor(self.file_path) as extractor:
+            trial_start = extractor.get_trial_start_times()
+            intervals = extractor.extract_reward_intervals()
+            subset = extractor.extract_reward_intervals(trial_nos=[2])
+            empty = extractor.extract_reward_intervals(trial_nos=[])
+        np.testing.assert_allclose(
+            intervals["start_time"], trial_start[[0, 0, 2]] + np.array([3, 10, 18])*1e-3
+        )
+        np.testing.assert_allclose(
+            intervals["stop_time"], trial_start[[0, 0, 2]] + np.array([6, 12, 20])*1e-3
+        )
+        np.testing.assert_allclose(subset["start_time"], intervals["start_time"][2:])
+        assert len(empty["start_time"]) == 0 and len(empty["stop_time"]) == 0
+
+
+if __name__ == "__main__":
+    unittest.main()
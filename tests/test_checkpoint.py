@@ -0,0 +1,110 @@
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import h5py
+import numpy as np
+import spikeextractors as se
+from nwb_conversion_tools import NWBConverter
+from nwb_conversion_tools.basedatainterface import BaseDataInterface
+from pynwb import NWBHDF5IO, TimeSeries
+from pynwb.ecephys import ElectricalSeries
+
+from conversion_utils.checkpoint import (
+    ConversionJournal,
+    get_journal_path,
+    list_objects,
+    remove_objects,
+    run_checkpointed,
+)
+
+
+class _RecordingInterface(BaseDataInterface):
+    # 4 channels, the electrodes are added by run_checkpointed before any interface is written:
+    def __init__(self):
+        super().__init__()
+        self.recording_extractor = se.NumpyRecordingExtractor(
+            timeseries=np.arange(40, dtype="int16").reshape(4, 10), sampling_frequency=1000.0
+        )
+        self.calls = 0
+
+    def run_conversion(self, nwbfile, metadata):
+        self.calls += 1
+        nwbfile.add_acquisition(
+            ElectricalSeries(
+                name="ElectricalSeries",
+                data=self.recording_extractor.get_traces().T,
+                electrodes=nwbfile.create_electrode_table_region(list(range(4)), "all electrodes"),
+                rate=1000.0,
+            )
+        )
+
+
+class _BehaviorInterface(BaseDataInterface):
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def run_conversion(self, nwbfile, metadata):
+        nwbfile.add_acquisition(TimeSeries(name="position", data=np.arange(5.0), unit="m", rate=10.0))
+        if self.fail:
+            raise RuntimeError("conversion interrupted")
+
+
+class _Converter(NWBConverter):
+    data_interface_classes = dict(Recording=_RecordingInterface, Behavior=_BehaviorInterface)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.nwbfile_path = self.tmpdir/"session.nwb"
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_journal(self):
+        journal = ConversionJournal(get_journal_path(self.nwbfile_path), "key")
+        journal.start("electrodes", [])
+        journal.complete("electrodes")
+        journal.start("A1", ["acquisition"])
+        journal = ConversionJournal(get_journal_path(self.nwbfile_path), "key")
+        assert journal.completed == ["electrodes"]
+        assert journal.started == "A1" and journal.objects == ["acquisition"]
+        # other metadata or conversion options:
+        journal = ConversionJournal(get_journal_path(self.nwbfile_path), "other key")
+        assert journal.completed == [] and journal.started is None
+
+    def test_remove_objects(self):
+        with h5py.File(self.nwbfile_path, "w") as file:
+            file.create_group("acquisition/A1").create_dataset("data", data=[1, 2])
+        objects = list_objects(self.nwbfile_path)
+        with h5py.File(self.nwbfile_path, "r+") as file:
+            file.create_group("acquisition/B1").create_dataset("data", data=[1, 2])
+            file.create_group("units")
+        remove_objects(self.nwbfile_path, objects)
+        assert list_objects(self.nwbfile_path) == objects
+
+    def test_resume(self):
+        converter = _Converter(source_data=dict(Recording=dict(), Behavior=dict()))
+        metadata = converter.get_metadata()
+        metadata["NWBFile"].update(session_start_time=datetime(2020, 1, 1).astimezone().isoformat())
+        with self.assertRaises(RuntimeError):
+            run_checkpointed(converter, self.nwbfile_path, metadata)
+        with open(get_journal_path(self.nwbfile_path), "r") as io:
+            journal = json.load(io)
+        assert journal["completed"] == ["electrodes", "Recording"] and journal["started"] == "Behavior"
+        converter.data_interface_objects["Behavior"].fail = False
+        run_checkpointed(converter, self.nwbfile_path, metadata)
+        assert converter.data_interface_objects["Recording"].calls == 1
+        assert not get_journal_path(self.nwbfile_path).exists()
+        with NWBHDF5IO(str(self.nwbfile_path), "r") as io:
+            nwbfile = io.read()
+            assert len(nwbfile.electrodes) == 4
+            electrical_series = nwbfile.acquisition["ElectricalSeries"]
+            np.testing.assert_array_equal(electrical_series.data[:], np.arange(40).reshape(4, 10).T)
+            np.testing.assert_array_equal(electrical_series.electrodes.data[:], range(4))
+            np.testing.assert_array_equal(nwbfile.acquisition["position"].data[:], np.arange(5.0))
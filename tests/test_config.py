@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from conversion_utils.config import load_yaml
+from monkey_neuropixel.config import get_brain_location, load_metadata_default, load_session_names
+
+
+class TestLoadYaml(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"config.yaml"
+        self.file_path.write_text("a: 1\n")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_mtime(self):
+        config = load_yaml(self.file_path)
+        assert config == dict(a=1) and load_yaml(self.file_path) is config
+        self.file_path.write_text("a: 3\n")
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert load_yaml(self.file_path) == dict(a=3)
+
+    def test_neuropixel_config(self):
+        session_names = load_session_names()
+        assert "session_names" not in session_names and "P20180327" in session_names
+        assert get_brain_location("P20180607") == "PMd"
+        assert get_brain_location("P20180323") == "M1"
+        metadata = load_metadata_default()
+        metadata.clear()
+        assert load_metadata_default()
@@ -0,0 +1,84 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from conversion_utils.manifest import ConversionManifest, hash_file, run_resumable
+
+
+def _convert(output_path, identifier=None):
+    Path(output_path).write_text(identifier)
+    return identifier
+
+
+class TestConversionManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.input_path = self.tmpdir/"R_session.mat"
+        self.input_path.write_bytes(b"R"*1000)
+        self.output_path = self.tmpdir/"session.nwb"
+        self.output_path.write_bytes(b"")
+        self.manifest_path = self.tmpdir/"manifest.json"
+        self.options = dict(stub=False)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def _record(self, status):
+        manifest = ConversionManifest(self.manifest_path)
+        inputs = manifest.fingerprint([self.input_path])
+        manifest.record("session", inputs, self.options, self.output_path, status)
+
+    def _is_up_to_date(self, options=None):
+        manifest = ConversionManifest(self.manifest_path)
+        inputs = manifest.fingerprint([self.input_path])
+        options = self.options if options is None else options
+        return manifest.is_up_to_date("session", inputs, options, self.output_path)
+
+    def test_completed_session_is_up_to_date(self):
+        self._record("completed")
+        assert self._is_up_to_date()
+
+    def test_failed_session_is_redone(self):
+        self._record("failed")
+        assert not self._is_up_to_date()
+
+    def test_changed_input_or_options_are_redone(self):
+        self._record("completed")
+        assert not self._is_up_to_date(options=dict(stub=True))
+        self.input_path.write_bytes(b"S"*1001)
+        assert not self._is_up_to_date()
+
+    def test_missing_output_is_redone(self):
+        self._record("completed")
+        self.output_path.unlink()
+        assert not self._is_up_to_date()
+
+    def test_inputs_are_hashed_on_request(self):
+        manifest = ConversionManifest(self.manifest_path)
+        assert "sha256" not in manifest.fingerprint([self.input_path])[str(self.input_path.resolve())]
+        inputs = manifest.fingerprint([self.input_path], hash_content=True)
+        assert inputs[str(self.input_path.resolve())]["sha256"] == hash_file(self.input_path)
+
+    def test_content_identifier_is_reproducible(self):
+        manifest = ConversionManifest(self.manifest_path)
+        inputs = manifest.fingerprint([self.input_path], hash_content=True)
+        identifier = manifest.content_identifier(inputs, self.options)
+        assert identifier == ConversionManifest.content_identifier(inputs, self.options)
+        assert identifier != ConversionManifest.content_identifier(inputs, dict(stub=True))
+
+    def test_worker_hashes_are_recorded(self):
+        session = dict(
+            name="session",
+            args=(self.output_path,),
+            file_paths=[self.input_path],
+            output_path=self.output_path,
+            options=self.options,
+        )
+        reports = run_resumable(
+            _convert, [session], self.manifest_path, content_identifier=True, max_workers=1, verbose=False
+        )
+        inputs = ConversionManifest(self.manifest_path).sessions["session"]["inputs"]
+        assert inputs[str(self.input_path.resolve())]["sha256"] == hash_file(self.input_path)
+        assert reports[0]["result"] == self.output_path.read_text()
+        assert reports[0]["result"] == ConversionManifest.content_identifier(inputs, self.options)
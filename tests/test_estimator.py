@@ -0,0 +1,55 @@
+import shutil
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from conversion_utils.estimator import estimate_recording, read_nsx_header, read_spikeglx_header
+
+
+class TestEstimator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def _write_nsx(self, packets: list, major_version: int = 2, channel_count: int = 4):
+        header = bytearray(314)
+        header[:10] = b"NEURALCD" + bytes([major_version, 3])
+        struct.pack_into("<I", header, 10, 314 + 66*channel_count)
+        struct.pack_into("<I", header, 286, 30)
+        struct.pack_into("<I", header, 310, channel_count)
+        extended_headers = bytearray(66*channel_count)
+        for channel_no in range(channel_count):
+            struct.pack_into("<2sH", extended_headers, 66*channel_no, b"CC", channel_no + 1)
+        content = bytes(header) + bytes(extended_headers)
+        packet_format = "<BQI" if major_version >= 3 else "<BII"
+        for num_frames in packets:
+            content += struct.pack(packet_format, 1, 0, num_frames) + bytes(2*channel_count*num_frames)
+        file_path = self.tmpdir/"datafileA001.ns2"
+        file_path.write_bytes(content)
+        return file_path
+
+    def test_nsx_header(self):
+        nsx_header = read_nsx_header(self._write_nsx([100, 50]))
+        assert nsx_header["channel_count"] == 4
+        assert nsx_header["channel_ids"] == [1, 2, 3, 4]
+        assert nsx_header["sampling_frequency"] == 1000
+        assert nsx_header["num_frames"] == 150
+        # channel 7 is not in the file:
+        recording = estimate_recording(nsx_header, channel_ids=[1, 2, 7], time_range=[0.01, 0.02])
+        assert recording["bytes"] == 10*2*2
+
+    def test_nsx_header_spec_3(self):
+        assert read_nsx_header(self._write_nsx([100, 50], major_version=3))["num_frames"] == 150
+        # precision timestamps, one sample per packet:
+        assert read_nsx_header(self._write_nsx([1]*20, major_version=3))["num_frames"] == 20
+
+    def test_spikeglx_header(self):
+        file_path = self.tmpdir/"P_g0_t0.imec0.ap.bin"
+        file_path.write_bytes(bytes(385*2*30))
+        file_path.with_suffix(".meta").write_text("nSavedChans=385\nimSampRate=30000\n")
+        spikeglx_header = read_spikeglx_header(file_path)
+        assert spikeglx_header["num_frames"] == 30
+        assert estimate_recording(spikeglx_header, stub_test=True)["bytes"] == 30*385*2
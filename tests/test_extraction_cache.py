@@ -0,0 +1,77 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from conversion_utils.extraction_cache import ExtractionCache
+
+
+class _Extractor:
+    EXTRACTOR_VERSION = 1
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"R_test.mat"
+        self.file_path.write_bytes(b"mat content")
+        self.data = dict(
+            trial_times=[np.arange(3.0), np.arange(5.0)],
+            spike_times=[[0.1, 0.2], []],
+            events=[np.float64(0.3), np.float64(np.nan)],
+            columns=[
+                dict(name="target_positions", data=[np.ones((2, 2)), np.zeros((1, 2))], index=True),
+                dict(name="task_success", data=[np.uint8(1), np.uint8(0)], description="success"),
+            ],
+            frames=[[np.ones((1, 1)), np.ones((1, 1), dtype="uint8")]],
+            times=(np.arange(4), "s"),
+            lookup=np.array([1, 2], dtype="uint8"),
+        )
+        self.calls = 0
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def _extract(self):
+        self.calls += 1
+        return self.data
+
+    def test_roundtrip(self):
+        ExtractionCache(self.tmpdir/"cache").get(self.file_path, _Extractor, self._extract)
+        data = ExtractionCache(self.tmpdir/"cache").get(self.file_path, _Extractor, self._extract)
+        assert self.calls == 1
+        np.testing.assert_array_equal(data["trial_times"][1], np.arange(5.0))
+        assert data["spike_times"][0] == [0.1, 0.2] and data["spike_times"][1] == []
+        assert isinstance(data["events"][0], np.float64) and np.isnan(data["events"][1])
+        assert data["columns"][0]["data"][0].shape == (2, 2) and data["columns"][0]["index"]
+        assert data["columns"][1]["data"][0].dtype == np.uint8
+        assert data["frames"][0][1].dtype == np.uint8
+        assert isinstance(data["times"], tuple) and data["times"][1] == "s"
+        assert data["lookup"].dtype == np.uint8
+
+    def test_mixed_number_lists(self):
+        self.data = dict(numbers=[1, 2.5, np.int64(3)], lists=[[1, 2.5], [], [3]], ints=[[1, 2], []])
+        ExtractionCache(self.tmpdir/"cache").get(self.file_path, _Extractor, self._extract)
+        data = ExtractionCache(self.tmpdir/"cache").get(self.file_path, _Extractor, self._extract)
+        assert self.calls == 1
+        assert [type(number) for number in data["numbers"]] == [int, float, np.int64]
+        assert [type(number) for number in data["lists"][0] + data["lists"][2]] == [int, float, int]
+        assert [type(number) for number in data["ints"][0]] == [int, int]
+
+    def test_invalidation(self):
+        cache = ExtractionCache(self.tmpdir/"cache")
+        cache.get(self.file_path, _Extractor, self._extract, options=dict(trial_nos=[0, 1]))
+        cache.get(self.file_path, _Extractor, self._extract, options=dict(trial_nos=[0]))
+        assert self.calls == 2
+        self.file_path.write_bytes(b"new mat content")
+        cache.get(self.file_path, _Extractor, self._extract, options=dict(trial_nos=[0]))
+        assert self.calls == 3
+        _Extractor.EXTRACTOR_VERSION = 2
+        try:
+            cache.get(self.file_path, _Extractor, self._extract, options=dict(trial_nos=[0]))
+        finally:
+            _Extractor.EXTRACTOR_VERSION = 1
+        assert self.calls == 4
+
@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from monkey_neuropixel.matextractor import MatDataExtractor
+
+
+def write_mat_file(file_path, trials: list, npix_meta: dict):
+    """
+    Minimal matlab v7.3 .behavior.mat: each field of the trials struct is a row of object references to the
+    value of each trial, a list value (the spike times of each unit in 'npix') is stored as a column of
+    references and None as an empty matlab array. npix_meta holds the datasets of the units, as matlab
+    stores them (one column per unit).
+    """
+    with h5py.File(file_path, "w") as file:
+        refs = file.create_group("#refs#")
+
+        def put(name, value):
+            if isinstance(value, list):
+                unit_refs = [put(f"{name}_{no}", element) for no, element in enumerate(value)]
+                return refs.create_dataset(name, data=np.array(unit_refs, dtype=h5py.ref_dtype)[:, None]).ref
+            if value is None:
+                dataset = refs.create_dataset(name, data=np.zeros(2, dtype="uint64"))
+                dataset.attrs["MATLAB_empty"] = 1
+                return dataset.ref
+            return refs.create_dataset(name, data=np.atleast_2d(value)).ref
+
+        columns = dict()
+        for trial_no, trial in enumerate(trials):
+            for field, value in trial.items():
+                columns.setdefault(field, []).append(put(f"{field}{trial_no}", value))
+        trials_group = file.create_group("trials")
+        for field, column in columns.items():
+            trials_group.create_dataset(field, data=np.array(column, dtype=h5py.ref_dtype)[None, :])
+        npix_meta_group = file.create_group("npix_meta")
+        for name, value in npix_meta.items():
+            npix_meta_group.create_dataset(name, data=value)
+
+
+def make_trial(trial_no: int, start_idx: int, **fields):
+    trial = dict(
+        subject=np.array([[ord(letter)] for letter in "Vinnie"], dtype="uint16"),
+        trialId=float(trial_no + 1),
+        npix_start_idx=float(start_idx),
+        npix_stop_idx=float(start_idx + 29999),
+    )
+    trial.update(fields)
+    return trial
+
+
+class TestNpxMatDataExtractor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"V20190101.behavior.mat"
+        # trials starting at 10 s and 20 s:
+        self.trials = [make_trial(0, 300000), make_trial(1, 600000)]
+        self.npix_meta = dict(cluster_ids=np.array([[3.0, 7.0]]))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_spike_times(self):
+        # unit 1 has no spikes in the first trial:
+        self.trials[0].update(npix=[np.array([[5.0, 12.5]]), None])
+        self.trials[1].update(npix=[np.array([[1.0]]), np.array([[2.0, 3.0]])])
+        write_mat_file(self.file_path, self.trials, self.npix_meta)
+        with MatDataExtractor(self.file_path) as extractor:
+            spike_times, unit_offsets = extractor.extract_unit_spike_times_flat()
+            parallel = extractor.extract_unit_spike_times_flat(number_of_jobs=2)
+            subset = extractor.extract_unit_spike_times(spike_ids=[1], trial_nos=[1])
+        np.testing.assert_array_equal(unit_offsets, [0, 3, 5])
+        np.testing.assert_allclose(spike_times, [10.005, 10.0125, 20.001, 20.002, 20.003])
+        np.testing.assert_array_equal(parallel[0], spike_times)
+        np.testing.assert_array_equal(parallel[1], unit_offsets)
+        np.testing.assert_allclose(subset[0], [20.002, 20.003])
+
+    def test_behavior_movement(self):
+        self.trials[0].update(
+            handPosition=np.arange(9.0).reshape(3, 3),
+            handSpeed=np.ones((3, 3)),
+            hand_time=np.array([[0.0, 1.0, 2.0]]),
+        )
+        # a trial without samples:
+        self.trials[1].update(handPosition=None, handSpeed=None, hand_time=None)
+        self.trials.append(
+            make_trial(
+                2,
+                900000,
+                handPosition=np.full((3, 2), 2.0),
+                handSpeed=np.zeros((3, 2)),
+                hand_time=np.array([[0.0, 1.0]]),
+            )
+        )
+        write_mat_file(self.file_path, self.trials, self.npix_meta)
+        with MatDataExtractor(self.file_path) as extractor:
+            beh_dict = extractor.get_behavior_movement()
+        np.testing.assert_allclose(
+            beh_dict["hand_position"]["data"],
+            np.concatenate([np.arange(9.0).reshape(3, 3).T, np.full((2, 3), 2.0)])*1e-3,
+        )
+        assert beh_dict["hand_speed"]["data"].shape == (5, 3)
+        np.testing.assert_allclose(beh_dict["times"]["data"], [10.0, 10.001, 10.002, 30.0, 30.001])
+
+    def test_trial_epochs(self):
+        events = ["TargetOnset", "GoCue", "Move", "MoveEnd", "TargetAcquired", "TargetHeld", "delay", "rt"]
+        self.trials[0].update({event: 100.0 for event in events})
+        self.trials[1].update({event: 250.0 for event in events}, GoCue=None)
+        write_mat_file(self.file_path, self.trials, self.npix_meta)
+        with MatDataExtractor(self.file_path) as extractor:
+            events_dict = extractor.get_trial_epochs()
+            subset = extractor.get_trial_epochs(trial_nos=[1])
+        np.testing.assert_allclose(events_dict["target_onset_time"]["data"], [10.1, 20.25])
+        assert events_dict["go_cue_time"]["data"][0] == 10.1 and np.isnan(events_dict["go_cue_time"]["data"][1])
+        np.testing.assert_allclose(subset["move_start_time"]["data"], [20.25])
+        # durations, not offset by the trial start:
+        np.testing.assert_allclose(events_dict["delay_period"]["data"], [0.1, 0.25])
+        np.testing.assert_allclose(events_dict["reaction_time"]["data"], [0.1, 0.25])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+import numpy as np
+
+from monkey_neuropixel.matextractor import merge_unit_chunks
+
+
+class TestMergeUnitChunks(unittest.TestCase):
+    def test_trial_order(self):
+        # two units over two trial ranges, unit 1 without spikes in the first one:
+        chunks = [
+            (np.array([0.1, 0.2]), np.array([0, 2, 2])),
+            (np.array([1.1, 1.2, 1.3]), np.array([0, 1, 3])),
+        ]
+        spike_times, unit_offsets = merge_unit_chunks(chunks)
+        np.testing.assert_array_equal(unit_offsets, [0, 3, 5])
+        np.testing.assert_array_equal(spike_times, [0.1, 0.2, 1.1, 1.2, 1.3])
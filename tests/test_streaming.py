@@ -0,0 +1,91 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import h5py
+import numpy as np
+from pynwb import NWBHDF5IO, NWBFile
+
+from conversion_utils.streaming import get_binary_memmap, stream_compressed
+from monkey_neuropixel.converter import ShenoySpikeGLXRecordingInterface
+
+
+def write_spikeglx(file_path, data: np.ndarray):
+    """
+    .ap.bin of data (frames x AP channels, int16) plus a sync channel and the .ap.meta of a Neuropixels 1.0
+    probe recorded at 30 kHz with an AP gain of 500.
+    """
+    num_frames, num_channels = data.shape
+    np.concatenate([data, np.zeros((num_frames, 1), dtype="int16")], axis=1).tofile(file_path)
+    meta = dict(
+        typeThis="imec",
+        fileCreateTime="2020-01-01T10:00:00",
+        nSavedChans=num_channels + 1,
+        fileSizeBytes=num_frames*(num_channels + 1)*2,
+        imSampRate=30000,
+        imAiRangeMax=0.6,
+        snsSaveChanSubset="all",
+        snsApLfSy=f"{num_channels},0,1",
+        imroTbl=f"(0,{num_channels})" + "".join(f"({channel} 0 0 500 250 1)" for channel in range(num_channels)),
+        snsChanMap=f"({num_channels},0,1)"
+        + "".join(f"(AP{channel};{channel}:{channel})" for channel in range(num_channels))
+        + f"(SY0;{num_channels}:{num_channels})",
+        snsShankMap="(1,2,480)" + "".join(f"(0:{channel % 2}:{channel // 2}:1)" for channel in range(num_channels)),
+    )
+    Path(file_path).with_suffix(".meta").write_text("".join(f"{key}={value}\n" for key, value in meta.items()))
+
+
+class TestStreamCompressed(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.data = np.random.default_rng(0).integers(-100, 100, size=(1050, 13), dtype="int16")
+        self.data.tofile(self.tmpdir/"recording.bin")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        # the last column of the recording is not streamed, like the sync channel of the .ap.bin files:
+        source = get_binary_memmap(self.tmpdir/"recording.bin", 13)[:, :12]
+        with h5py.File(self.tmpdir/"output.h5", "w") as file:
+            dataset = file.create_dataset(
+                "data", shape=source.shape, dtype="int16", chunks=(100, 5), compression="gzip"
+            )
+            stats = stream_compressed(source, dataset, number_of_threads=3, queue_size=2)
+        assert stats["chunks"] == 11*3 and stats["throughput"] > 0
+        # the edge chunks are padded, the bytes count the source data only:
+        assert stats["bytes"] == source.nbytes
+        with h5py.File(self.tmpdir/"output.h5", "r") as file:
+            np.testing.assert_array_equal(file["data"][()], self.data[:, :12])
+
+
+class TestStreamedSeries(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.file_path = self.tmpdir/"session_g0_t0.imec0.ap.bin"
+        self.data = np.random.default_rng(0).integers(-100, 100, size=(1050, 6), dtype="int16")
+        write_spikeglx(self.file_path, self.data)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream_data(self):
+        nwbfile_path = self.tmpdir/"session.nwb"
+        interface = ShenoySpikeGLXRecordingInterface(file_path=str(self.file_path))
+        nwbfile = NWBFile("session", "identifier", datetime(2020, 1, 1).astimezone())
+        interface.run_conversion(
+            nwbfile, interface.get_metadata(), frame_range=[50, 1000], compression_threads=2, chunk_shape=[100, 4]
+        )
+        with NWBHDF5IO(str(nwbfile_path), "w") as io:
+            io.write(nwbfile)
+        stats = interface.stream_data(nwbfile_path)
+        assert stats["bytes"] == self.data[50:1000].nbytes
+        assert interface.stream_data(nwbfile_path) is None
+        with NWBHDF5IO(str(nwbfile_path), "r") as io:
+            electrical_series = io.read().acquisition["ElectricalSeries_raw"]
+            np.testing.assert_array_equal(electrical_series.data[:], self.data[50:1000])
+            assert electrical_series.data.chunks == (100, 4) and electrical_series.data.compression == "gzip"
+            assert electrical_series.starting_time == 50/30000 and len(electrical_series.electrodes) == 6
+            np.testing.assert_allclose(electrical_series.conversion, 0.6/512/500)